@@ -0,0 +1,74 @@
+""" Benchmarks for the feedservice
+
+Run with ``python -m pytest benchmarks`` (requires pytest-benchmark, see
+benchmarks/requirements.txt). The results of a run are compared with the
+baseline in benchmarks/results with
+
+    python -m pytest benchmarks --benchmark-storage=benchmarks/results \
+        --benchmark-compare=0001
+
+and a new baseline is stored with --benchmark-save=<name>. Feeds are served
+from the corpus in benchmarks/corpus by a local stub server (see
+stubserver.py). """
+
+# patch the standard library like manage.py and gunicorn.conf.py do, so that
+# feeds are fetched concurrently
+import eventlet
+eventlet.monkey_patch()
+
+import os
+
+import django
+import pytest
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'feedservice.settings')
+os.environ.setdefault('MYGPOFS_SECRET_KEY', 'benchmarks')
+django.setup()
+
+from feedservice.parse.models import Feed, Episode, File
+
+from stubserver import StubServer
+
+
+def make_feed(num_episodes):
+    """ Returns a parsed feed with the given number of typical episodes """
+
+    feed = Feed()
+    feed.title = 'Benchmark Podcast'
+    feed.link = 'http://example.com/'
+    feed.description = 'A podcast about <b>benchmarks</b>. ' * 10
+    feed.urls = ['http://example.com/feed.xml']
+    feed.new_location = None
+    feed.logo = 'http://example.com/logo.png'
+    feed.http_etag = '"abc"'
+    feed.http_last_modified = 'Mon, 19 Oct 2026 10:00:00 GMT'
+
+    episodes = []
+    for n in range(num_episodes, 0, -1):
+        episode = Episode()
+        episode.guid = 'http://example.com/episodes/%d' % n
+        episode.title = 'Benchmark Podcast %d: Episode number %d' % (n, n)
+        episode.description = ('<p>In episode %d we talk about <a href='
+                               '"http://example.com/%d">things</a>.</p>'
+                               % (n, n)) * 5
+        episode.link = 'http://example.com/episodes/%d' % n
+        episode.released = 1500000000 + n * 7 * 86400
+        episode.duration = 3600 + n
+        episode.set_files([File(['http://example.com/media/%d.mp3' % n],
+                                'audio/mpeg', 50000000 + n)])
+        episodes.append(episode)
+
+    feed.set_episodes(episodes)
+    return feed
+
+
+@pytest.fixture(scope='session')
+def large_feed():
+    return make_feed(5000)
+
+
+@pytest.fixture(scope='session')
+def stub_server():
+    server = StubServer().start()
+    yield server
+    server.stop()
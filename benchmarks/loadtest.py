@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+""" Local load test of the gunicorn deployment profile
+
+Starts a stub server that serves a generated feed, runs gunicorn with
+gunicorn.conf.py against it and sends /parse requests from a number of
+client threads. Reports throughput, latencies and the memory of each worker
+(RSS, and PSS / private memory, which show how much is shared with the
+master process).
+
+    python benchmarks/loadtest.py --workers 4 --duration 20
+    GUNICORN_PRELOAD=False python benchmarks/loadtest.py
+
+Requires gunicorn (with its eventlet worker) and Linux (for /proc). """
+
+import os
+import sys
+import time
+import socket
+import argparse
+import threading
+import statistics
+import subprocess
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ITEM = """<item>
+ <guid>http://example.com/episodes/%(n)d</guid>
+ <title>Load Test Podcast %(n)d: Episode %(n)d</title>
+ <description>In episode %(n)d we talk about things.</description>
+ <pubDate>Mon, 19 Oct 2026 10:00:00 GMT</pubDate>
+ <enclosure url="http://example.com/%(n)d.mp3" type="audio/mpeg"
+            length="1000"/>
+</item>
+"""
+
+
+def make_feed(num_episodes):
+    items = ''.join(ITEM % dict(n=n) for n in range(num_episodes, 0, -1))
+    return ('<?xml version="1.0" encoding="utf-8"?><rss version="2.0">'
+            '<channel><title>Load Test Podcast</title>'
+            '<link>http://example.com/</link>%s</channel></rss>'
+            % items).encode('utf-8')
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml')
+        self.send_header('Cache-Control', 'max-age=%d' % self.server.max_age)
+        self.end_headers()
+        self.wfile.write(self.server.feed)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_feed_server(episodes, max_age):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+    server.feed = make_feed(episodes)
+    server.max_age = max_age
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_gunicorn(port, workers):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault('MYGPOFS_SECRET_KEY', 'loadtest')
+    env.setdefault('DATABASE_URL', 'sqlite:///:memory:')
+    env['MYGPOFS_DEBUG'] = 'False'
+    env['MYGPOFS_ALLOWED_HOSTS'] = '127.0.0.1'
+
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'feedservice.wsgi',
+         '--config', os.path.join(ROOT, 'gunicorn.conf.py'),
+         '--bind', '127.0.0.1:%d' % port, '--workers', str(workers)],
+        cwd=ROOT, env=env)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+
+    proc.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+
+def get_worker_pids(master_pid):
+    path = '/proc/%d/task/%d/children' % (master_pid, master_pid)
+    with open(path) as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def get_memory(pid):
+    """ Returns RSS, PSS and private memory of the process in KiB """
+    memory = {}
+    with open('/proc/%d/smaps_rollup' % pid) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                memory[parts[0].rstrip(':')] = int(parts[1])
+
+    private = memory.get('Private_Clean', 0) + memory.get('Private_Dirty', 0)
+    return memory.get('Rss', 0), memory.get('Pss', 0), private
+
+
+def run_clients(base_url, feed_urls, clients, duration):
+    latencies, errors = [], []
+    stop = time.time() + duration
+
+    def client(n):
+        i = n
+        while time.time() < stop:
+            url = feed_urls[i % len(feed_urls)]
+            i += clients
+            start = time.perf_counter()
+            try:
+                req = urllib.request.Request(
+                    base_url + '/parse?url=' + urllib.request.quote(url),
+                    headers={'Accept': 'application/json'})
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                latencies.append(time.perf_counter() - start)
+            except OSError as ex:
+                errors.append(ex)
+
+    with ThreadPoolExecutor(clients) as executor:
+        list(executor.map(client, range(clients)))
+
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--feeds', type=int, default=100,
+                        help='number of distinct feed URLs')
+    parser.add_argument('--episodes', type=int, default=100,
+                        help='number of episodes per feed')
+    parser.add_argument('--max-age', type=int, default=60,
+                        help='max-age of the feeds, 0 to disable caching')
+    args = parser.parse_args()
+
+    feed_server = start_feed_server(args.episodes, args.max_age)
+    feed_urls = ['http://127.0.0.1:%d/feed/%d.xml'
+                 % (feed_server.server_port, n) for n in range(args.feeds)]
+
+    port = free_port()
+    gunicorn = start_gunicorn(port, args.workers)
+
+    try:
+        latencies, errors = run_clients('http://127.0.0.1:%d' % port,
+                                        feed_urls, args.clients,
+                                        args.duration)
+        workers = get_worker_pids(gunicorn.pid)
+        memory = [get_memory(pid) for pid in workers]
+        master = get_memory(gunicorn.pid)
+
+    finally:
+        gunicorn.terminate()
+        gunicorn.wait()
+        feed_server.shutdown()
+
+    latencies.sort()
+    print('preload:    %s' % os.getenv('GUNICORN_PRELOAD', 'True'))
+    print('requests:   %d (%d errors)' % (len(latencies), len(errors)))
+    print('throughput: %.1f requests/s' % (len(latencies) / args.duration))
+    if latencies:
+        print('latency:    median %.1f ms, p95 %.1f ms' % (
+              statistics.median(latencies) * 1000,
+              latencies[int(len(latencies) * .95)] * 1000))
+    print('master:     RSS %d KiB, PSS %d KiB, private %d KiB' % master)
+    for pid, (rss, pss, private) in zip(workers, memory):
+        print('worker %d: RSS %d KiB, PSS %d KiB, private %d KiB'
+              % (pid, rss, pss, private))
+
+
+if __name__ == '__main__':
+    main()
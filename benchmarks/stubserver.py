@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+""" Local HTTP server that serves the feed corpus
+
+Serves the files in benchmarks/corpus, and a generated feed with 5000
+episodes as large.rss, with an optional delay before each response that
+simulates the latency of real feed servers. The delay is given in
+milliseconds with --latency, and can be overridden per request with the
+query parameter latency; other query parameters are ignored, so that
+distinct URLs can be requested for the same feed.
+
+    python benchmarks/stubserver.py --port 8001 --latency 100
+
+The benchmarks start the server in a separate process (see StubServer), so
+that serving the feeds does not compete with the measured code. """
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'corpus')
+
+CONTENT_TYPES = {
+    '.rss': 'application/rss+xml',
+    '.atom': 'application/atom+xml',
+    '.xspf': 'application/xspf+xml',
+    '.json': 'application/json',
+}
+
+ITEM = """  <item>
+   <title>Large Podcast %(n)d: Episode number %(n)d</title>
+   <link>https://large.example.com/episodes/%(n)d</link>
+   <guid isPermaLink="false">large-%(n)d</guid>
+   <pubDate>Mon, 19 Oct 2026 10:00:00 GMT</pubDate>
+   <description>In episode %(n)d we talk about &lt;a href="https://example.com/%(n)d"&gt;things&lt;/a&gt;.</description>
+   <itunes:duration>01:%(m)02d:00</itunes:duration>
+   <enclosure url="https://cdn.example.com/large/%(n)d.mp3" type="audio/mpeg" length="%(size)d"/>
+  </item>
+"""
+
+
+def make_rss(num_episodes):
+    """ Returns an RSS feed with the given number of typical episodes """
+    items = ''.join(ITEM % dict(n=n, m=n % 60, size=50000000 + n)
+                    for n in range(num_episodes, 0, -1))
+    return ('<?xml version="1.0" encoding="utf-8"?>\n<rss version="2.0" '
+            'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">\n'
+            ' <channel>\n  <title>Large Podcast</title>\n'
+            '  <link>https://large.example.com/</link>\n%s </channel>\n'
+            '</rss>\n' % items).encode('utf-8')
+
+
+def load_corpus():
+    """ Returns the contents of the served files by their names """
+
+    feeds = {'large.rss': make_rss(5000)}
+
+    for name in os.listdir(CORPUS_DIR):
+        feeds[name] = read_corpus(name)
+
+    return feeds
+
+
+def read_corpus(name):
+    with open(os.path.join(CORPUS_DIR, name), 'rb') as f:
+        return f.read()
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        name = url.path.lstrip('/')
+        params = parse_qs(url.query)
+
+        latency = float(params.get('latency', [self.server.latency])[0])
+        time.sleep(latency / 1000)
+
+        content = self.server.feeds.get(name)
+        if content is None:
+            self.send_error(404)
+            return
+
+        ext = os.path.splitext(name)[1]
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPES.get(ext, 'text/xml'))
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(object):
+    """ Runs the stub server in a subprocess """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.proc = None
+
+    def start(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+
+        self.proc = subprocess.Popen([sys.executable, __file__,
+                                      '--port', str(self.port),
+                                      '--latency', str(self.latency)])
+
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.port),
+                                         timeout=1).close()
+                return self
+            except OSError:
+                time.sleep(0.1)
+
+        self.stop()
+        raise RuntimeError('stub server did not start')
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait()
+
+    def get_url(self, name, **params):
+        query = '&'.join('%s=%s' % item for item in params.items())
+        return 'http://127.0.0.1:%d/%s%s' % (self.port, name,
+                                             '?' + query if query else '')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='delay before each response in milliseconds')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), CorpusHandler)
+    server.feeds = load_corpus()
+    server.latency = args.latency
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
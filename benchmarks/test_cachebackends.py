@@ -0,0 +1,52 @@
+""" Storing and loading a cached 5000-episode feed with each cache backend
+
+The size of the stored value is reported as extra_info['bytes']. """
+
+import os
+import pickle
+import tempfile
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+from feedservice.cachebackends import SharedMemoryCache, dumps, loads
+from feedservice.parse.cache import CacheEntry
+
+
+@pytest.fixture(scope='module')
+def entry(large_feed):
+    return CacheEntry(large_feed, 300)
+
+
+@pytest.fixture(scope='module', params=['locmem', 'shm'])
+def backend(request):
+    if request.param == 'locmem':
+        yield LocMemCache('benchmarks', {})
+        return
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        yield SharedMemoryCache(os.path.join(tempdir, 'cache'), {
+            'OPTIONS': {'MAX_ENTRIES': 1000, 'SIZE': 256 * 1024 * 1024}})
+
+
+def test_pickle(benchmark, entry):
+    data = benchmark(pickle.dumps, entry, pickle.HIGHEST_PROTOCOL)
+    benchmark.extra_info['bytes'] = len(data)
+
+
+def test_dumps(benchmark, entry):
+    data = benchmark(dumps, entry)
+    benchmark.extra_info['bytes'] = len(data)
+
+
+def test_loads(benchmark, entry):
+    benchmark(loads, dumps(entry))
+
+
+def test_set(benchmark, backend, entry):
+    benchmark(backend.set, 'feed', entry)
+
+
+def test_get(benchmark, backend, entry):
+    backend.set('feed', entry)
+    assert benchmark(backend.get, 'feed').feed.title == entry.feed.title
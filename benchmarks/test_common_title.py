@@ -0,0 +1,36 @@
+""" Finding the common title of a feed's episodes """
+
+import pytest
+
+from feedservice.parse.models import Feed, Episode
+
+
+def make_feed(titles):
+    feed = Feed()
+    feed.episodes = []
+    for title in titles:
+        episode = Episode()
+        episode.title = title
+        feed.episodes.append(episode)
+    return feed
+
+
+TITLES = {
+    # the typical case: a common prefix and a number
+    'numbered-100': ['Linux Outlaws %d: Episode Title %d' % (n, n)
+                     for n in range(100)],
+    'numbered-5000': ['Linux Outlaws %d: Episode Title %d' % (n, n)
+                      for n in range(5000)],
+
+    # long titles without a common part
+    'unrelated-1000': ['%d %s' % (n, 'abcdefghij'[n % 10] * 120)
+                       for n in range(1000)],
+}
+
+
+@pytest.mark.parametrize('name', list(TITLES))
+def test_common_title(benchmark, name):
+    feed = make_feed(TITLES[name])
+
+    common_title = benchmark(feed.get_common_title)
+    benchmark.extra_info['common_title'] = common_title
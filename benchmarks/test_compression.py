@@ -0,0 +1,50 @@
+""" CPU cost and bytes-on-wire of response compression per level """
+
+import json
+
+import pytest
+
+from feedservice.webservice.utils import ObjectEncoder
+from feedservice.webservice.compression import COMPRESSORS, compress, \
+    compress_stream
+
+
+LEVELS = {
+    'gzip': [1, 6, 9],
+    'br': [1, 5, 9, 11],
+    'zstd': [1, 3, 9, 19],
+}
+
+PARAMS = [(encoding, level) for encoding, levels in LEVELS.items()
+          for level in levels]
+
+
+@pytest.fixture(scope='module')
+def payload(large_feed):
+    return json.dumps([large_feed], sort_keys=True, indent=None,
+                      separators=(',', ':'), cls=ObjectEncoder).encode('utf-8')
+
+
+@pytest.mark.parametrize('encoding,level', PARAMS)
+def test_compress(benchmark, payload, encoding, level):
+    if encoding not in COMPRESSORS:
+        pytest.skip('%s is not available' % encoding)
+
+    data = benchmark(compress, payload, encoding, level)
+    benchmark.extra_info['bytes'] = len(data)
+    benchmark.extra_info['ratio'] = round(len(data) / len(payload), 4)
+
+
+@pytest.mark.parametrize('encoding,level', [('gzip', 6), ('br', 5),
+                                            ('zstd', 3)])
+def test_compress_stream(benchmark, payload, encoding, level):
+    if encoding not in COMPRESSORS:
+        pytest.skip('%s is not available' % encoding)
+
+    # one chunk per 64 KiB, similar to a streamed response
+    chunks = [payload[i:i + 65536] for i in range(0, len(payload), 65536)]
+
+    data = benchmark(lambda: b''.join(compress_stream(chunks, encoding,
+                                                      level)))
+    benchmark.extra_info['bytes'] = len(data)
+    benchmark.extra_info['ratio'] = round(len(data) / len(payload), 4)
@@ -0,0 +1,63 @@
+""" Parsing the durations and release dates of 10k episodes """
+
+import feedparser
+import pytest
+from feedparser.datetimes import _parse_date, _date_handlers
+
+# registers parse_date_fast with feedparser, if FEEDPARSER_FAST_DATES is set
+from feedservice.parse.feed import FeedparserEpisodeParser, parse_date_fast
+from feedservice.utils import parse_duration, parse_date
+
+
+NUM_EPISODES = 10000
+
+DURATIONS = {
+    'hms': ['01:%02d:%02d' % (n % 60, n % 60) for n in range(NUM_EPISODES)],
+    'ms': ['%d:%02d' % (n % 90, n % 60) for n in range(NUM_EPISODES)],
+    'seconds': [str(n) for n in range(NUM_EPISODES)],
+}
+
+DATES = {
+    'rfc822': ['Mon, %02d Oct 2026 10:%02d:00 GMT' % (n % 28 + 1, n % 60)
+               for n in range(NUM_EPISODES)],
+    'rfc822-offset': ['Mon, %02d Oct 2026 10:%02d:00 +0200'
+                      % (n % 28 + 1, n % 60) for n in range(NUM_EPISODES)],
+    'iso8601': ['2026-10-%02dT10:%02d:00Z' % (n % 28 + 1, n % 60)
+                for n in range(NUM_EPISODES)],
+}
+
+
+@pytest.fixture(params=['fast', 'feedparser'])
+def date_handlers(request):
+    """ Parses dates with parse_date_fast first, or only with feedparser """
+
+    handlers = list(_date_handlers)
+    _date_handlers[:] = [h for h in handlers if h is not parse_date_fast]
+    if request.param == 'fast':
+        _date_handlers.insert(0, parse_date_fast)
+
+    yield request.param
+    _date_handlers[:] = handlers
+
+
+@pytest.mark.parametrize('name', list(DURATIONS))
+def test_parse_duration(benchmark, name):
+    values = DURATIONS[name]
+    durations = benchmark(lambda: [parse_duration(v) for v in values])
+    assert None not in durations
+
+
+@pytest.mark.parametrize('name', list(DATES))
+def test_feedparser_dates(benchmark, date_handlers, name):
+    values = DATES[name]
+    dates = benchmark(lambda: [_parse_date(v) for v in values])
+    assert None not in dates
+
+
+def test_get_timestamp(benchmark):
+    entries = [feedparser.FeedParserDict(published_parsed=_parse_date(v))
+               for v in DATES['rfc822']]
+    parsers = [FeedparserEpisodeParser(e) for e in entries]
+
+    timestamps = benchmark(lambda: [p.get_timestamp() for p in parsers])
+    assert timestamps == [parse_date(v) for v in DATES['rfc822']]
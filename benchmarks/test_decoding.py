@@ -0,0 +1,70 @@
+""" Decoding of multi-megabyte feed bodies
+
+Compares decoding the body like requests' Response.text does for responses
+without a charset (detection with charset_normalizer) to decoding with the
+declared encoding, and to parsing or scanning the bytes directly. """
+
+import re
+from xml.dom import minidom
+
+import pytest
+import requests
+
+from feedservice.parse.youtube import RE_CANONICAL, PAGE_SCAN_SIZE
+
+from stubserver import make_rss
+
+
+@pytest.fixture(scope='module')
+def body():
+    # about 4 MB, with non-ASCII text, which is the hard case for detection
+    return make_rss(5000).replace(b'things', 'Grüße aus Köln'.encode('utf-8'))
+
+
+def make_response(content, content_type):
+    resp = requests.Response()
+    resp._content = content
+    resp.headers['Content-Type'] = content_type
+    return resp
+
+
+@pytest.fixture(scope='module')
+def page(body):
+    # an HTML page with a canonical link in its head, and a large body
+    return (b'<html><head><link rel="canonical" href="https://www.youtube.com'
+            b'/channel/UCabc"></head><body>' + body + b'</body></html>')
+
+
+def test_text_detected(benchmark, body):
+    benchmark.extra_info['bytes'] = len(body)
+    benchmark(lambda: make_response(body, 'application/rss+xml').text)
+
+
+def test_text_declared(benchmark, body):
+    benchmark.extra_info['bytes'] = len(body)
+    benchmark(lambda: make_response(
+        body, 'application/rss+xml; charset=utf-8').text)
+
+
+def test_decode_declared(benchmark, body):
+    benchmark(lambda: body.decode('utf-8'))
+
+
+def test_minidom_text(benchmark, body):
+    benchmark.pedantic(lambda: minidom.parseString(
+        make_response(body, 'application/rss+xml').text), rounds=3)
+
+
+def test_minidom_bytes(benchmark, body):
+    # expat decodes with the encoding of the XML prolog
+    benchmark.pedantic(lambda: minidom.parseString(body), rounds=3)
+
+
+def test_scan_text(benchmark, page):
+    benchmark(lambda: re.search(RE_CANONICAL.pattern.decode('ascii'),
+                                make_response(page, 'text/html').text))
+
+
+def test_scan_bytes(benchmark, page):
+    m = benchmark(lambda: RE_CANONICAL.search(page[:PAGE_SCAN_SIZE]))
+    assert m is not None
@@ -0,0 +1,44 @@
+""" Payload size and cost of delta responses for a feed with a new episode """
+
+import json
+
+import pytest
+from django.core.cache import cache
+
+from feedservice.parse import delta
+from feedservice.webservice.utils import ObjectEncoder
+
+from conftest import make_feed
+
+
+def encode(feed):
+    return json.dumps([feed], sort_keys=True, indent=None,
+                      separators=(',', ':'), cls=ObjectEncoder).encode('utf-8')
+
+
+@pytest.fixture(scope='module')
+def feeds():
+    """ the same feed before and after a new episode has been published """
+    return make_feed(4999), make_feed(5000)
+
+
+def test_set_episodes(benchmark, large_feed):
+    """ computing fingerprints and cursor is part of each parse """
+    benchmark(large_feed.set_episodes, large_feed.episodes)
+
+
+def test_full_response(benchmark, feeds):
+    old, new = feeds
+    data = benchmark(encode, new)
+    benchmark.extra_info['bytes'] = len(data)
+
+
+def test_delta_response(benchmark, feeds):
+    old, new = feeds
+    url = 'http://example.com/feed.xml'
+    cache.clear()
+    delta.store_index(url, old)
+
+    data = benchmark(lambda: encode(delta.apply_cursor(url, new, old.cursor)))
+    benchmark.extra_info['bytes'] = len(data)
+    assert len(json.loads(data)[0]['episodes']) == 1
@@ -0,0 +1,67 @@
+""" Selection of parser classes for a large batch of mixed feed URLs """
+
+import random
+
+import pytest
+
+from feedservice.parse import get_parser_registry
+from feedservice.parse.feed import Feedparser
+from feedservice.parse import youtube, vimeo, soundcloud, fm4
+
+
+LINEAR_CLASSES = (
+    youtube.YoutubeParser,
+    vimeo.VimeoParser,
+    soundcloud.SoundcloudParser,
+    soundcloud.SoundcloudFavParser,
+    fm4.FM4OnDemandPlaylistParser,
+)
+
+
+def linear_dispatch(url):
+    """ the previous implementation, which asks every class """
+    for cls in LINEAR_CLASSES:
+        if cls.handles_url(url):
+            return cls
+    return Feedparser
+
+
+@pytest.fixture(scope='module')
+def urls():
+    """ 10000 URLs, mostly generic feeds on many hosts """
+    rnd = random.Random(42)
+    urls = []
+    for n in range(10000):
+        kind = rnd.random()
+        if kind < 0.05:
+            urls.append('https://www.youtube.com/channel/UC%d' % n)
+        elif kind < 0.08:
+            urls.append('https://soundcloud.com/user%d' % n)
+        elif kind < 0.09:
+            urls.append('http://vimeo.com/%d' % n)
+        else:
+            urls.append('http://feeds.host%d.example.com/podcast/%d.xml'
+                        % (n % 2000, n))
+    return urls
+
+
+def test_linear(benchmark, urls):
+    benchmark(lambda: [linear_dispatch(url) for url in urls])
+
+
+def test_registry_cold(benchmark, urls):
+    registry = get_parser_registry()
+
+    def dispatch():
+        registry._cached_get.cache_clear()
+        return [registry.get_parser_cls(url) for url in urls]
+
+    benchmark(dispatch)
+
+
+def test_registry_warm(benchmark, urls):
+    registry = get_parser_registry()
+    expected = [linear_dispatch(url) for url in urls]
+    assert [registry.get_parser_cls(url) for url in urls] == expected
+
+    benchmark(lambda: [registry.get_parser_cls(url) for url in urls])
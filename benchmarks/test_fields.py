@@ -0,0 +1,29 @@
+""" Payload size and encoding time of responses with and without fields= """
+
+import json
+
+import pytest
+
+from feedservice.parse.fields import parse_feed_fields
+from feedservice.webservice.utils import ObjectEncoder
+
+
+SELECTIONS = {
+    'all': None,
+    'episode-list': 'title,logo,episodes(guid,title,released,files(urls))',
+    'metadata': 'title,link,description,logo',
+}
+
+
+def encode(feed, fields):
+    return json.dumps([feed], sort_keys=True, indent=None,
+                      separators=(',', ':'), cls=ObjectEncoder,
+                      fields=fields).encode('utf-8')
+
+
+@pytest.mark.parametrize('selection', list(SELECTIONS))
+def test_encode_fields(benchmark, large_feed, selection):
+    fields = parse_feed_fields(SELECTIONS[selection])
+
+    data = benchmark(encode, large_feed, fields)
+    benchmark.extra_info['bytes'] = len(data)
@@ -0,0 +1,48 @@
+""" Encode/decode speed and size of the response formats """
+
+import json
+
+import pytest
+
+from feedservice.webservice.formats import FORMATS, STREAMING_FORMATS, \
+    msgpack, cbor2
+
+
+def encode(content_type, feeds):
+    data = FORMATS[content_type](feeds)
+    if content_type in STREAMING_FORMATS:
+        data = b''.join(data)
+    return data
+
+
+DECODERS = {
+    'application/json': json.loads,
+    'application/x-ndjson':
+        lambda data: [json.loads(line) for line in data.splitlines()],
+    'application/msgpack':
+        lambda data: msgpack.unpackb(data, raw=False),
+    'application/cbor': lambda data: cbor2.loads(data),
+}
+
+CONTENT_TYPES = list(DECODERS)
+
+
+def skip_unavailable(content_type):
+    if content_type not in FORMATS:
+        pytest.skip('%s is not available' % content_type)
+
+
+@pytest.mark.parametrize('content_type', CONTENT_TYPES)
+def test_encode(benchmark, large_feed, content_type):
+    skip_unavailable(content_type)
+
+    data = benchmark(encode, content_type, [large_feed])
+    benchmark.extra_info['bytes'] = len(data)
+
+
+@pytest.mark.parametrize('content_type', CONTENT_TYPES)
+def test_decode(benchmark, large_feed, content_type):
+    skip_unavailable(content_type)
+
+    data = encode(content_type, [large_feed])
+    benchmark(DECODERS[content_type], data)
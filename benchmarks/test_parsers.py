@@ -0,0 +1,89 @@
+""" Fetching and parsing the feeds of the corpus
+
+Feeds are served by the stub server (see stubserver.py), so these include
+the fetches over the local network, but no latency unless given. """
+
+import json
+
+import pytest
+
+from feedservice.parse import parse_feeds, parse_feed_requests
+from feedservice.parse.fields import parse_feed_fields
+from feedservice.parse.feed import Feedparser
+from feedservice.parse.youtube import YoutubeParser
+from feedservice.parse.vimeo import VimeoParser
+from feedservice.parse.fm4 import FM4OnDemandPlaylistParser
+from feedservice.parse.soundcloud import SoundcloudEpisodeParser
+from feedservice.utils import fetch_url
+from feedservice.webservice.formats import dumps_json
+
+from stubserver import read_corpus
+
+
+FEEDS = ['tiny.rss', 'shownotes.rss', 'large.rss']
+
+# parser, corpus file and fields; the files of YouTube videos would be
+# looked up on youtube.com, so they are not parsed
+PARSERS = {
+    'feedparser': (Feedparser, 'shownotes.rss', None),
+    'youtube': (YoutubeParser, 'youtube.atom',
+                'title,link,episodes(guid,title,description,link,released)'),
+    'vimeo': (VimeoParser, 'vimeo.rss', None),
+    'fm4': (FM4OnDemandPlaylistParser, 'fm4.xspf', None),
+}
+
+
+@pytest.mark.parametrize('name', FEEDS)
+def test_parse_feeds(benchmark, stub_server, name):
+    url = stub_server.get_url(name)
+
+    feed, = benchmark(lambda: parse_feeds([url], use_cache=False))
+
+    assert not feed.errors
+    benchmark.extra_info['episodes'] = len(feed.episodes)
+
+
+@pytest.mark.parametrize('name', FEEDS)
+def test_encode_json(benchmark, stub_server, name):
+    feeds = parse_feeds([stub_server.get_url(name)], use_cache=False)
+
+    data = benchmark(dumps_json, feeds)
+    benchmark.extra_info['bytes'] = len(data)
+
+
+def test_batch_with_latency(benchmark, stub_server):
+    """ 20 feeds that take 50 ms each to respond, parsed 10 at a time """
+
+    requests = [{'url': stub_server.get_url('tiny.rss', latency=50, n=n)}
+                for n in range(20)]
+
+    results = benchmark.pedantic(parse_feed_requests, (requests, False, 10),
+                                 rounds=5)
+    assert [status for _, status, _ in results] == [200] * 20
+
+
+@pytest.mark.parametrize('name', list(PARSERS))
+def test_parser(benchmark, stub_server, name):
+    parser_cls, corpus_name, fields = PARSERS[name]
+    url = stub_server.get_url(corpus_name)
+    fields = parse_feed_fields(fields)
+
+    def parse():
+        return parser_cls(url, fetch_url(url)).get_feed(fields)
+
+    feed = benchmark(parse)
+    assert feed.episodes
+    benchmark.extra_info['episodes'] = len(feed.episodes)
+
+
+def test_soundcloud_episodes(benchmark):
+    """ Episodes from tracks as returned by the SoundCloud API """
+
+    tracks = json.loads(read_corpus('soundcloud-tracks.json'))
+
+    def parse():
+        return [SoundcloudEpisodeParser(track, 'exampledj').get_episode()
+                for track in tracks]
+
+    episodes = benchmark(parse)
+    assert len(episodes) == len(tracks)
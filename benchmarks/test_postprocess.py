@@ -0,0 +1,69 @@
+""" Post-processing and serializing the episodes of a 10k-episode feed """
+
+import json
+
+import pytest
+
+from feedservice.parse.feed import FeedparserEpisodeParser
+from feedservice.parse.fields import parse_feed_fields
+from feedservice.parse.models import Feed, Episode, File
+from feedservice.webservice.utils import ObjectEncoder
+
+
+NUM_EPISODES = 10000
+
+
+def make_episodes(num_episodes):
+    episodes = []
+    for n in range(num_episodes, 0, -1):
+        episode = Episode()
+        episode.guid = 'http://example.com/episodes/%d' % n
+        episode.title = 'Benchmark Podcast %d: Episode number %d' % (n, n)
+        episode.set_files([
+            File(['http://example.com/media/%d.mp3' % n], 'audio/mpeg', n),
+            File(['http://example.com/media/%d.m4a' % n], 'audio/mp4', n),
+        ])
+        episodes.append(episode)
+    return episodes
+
+
+@pytest.fixture(scope='module')
+def episodes():
+    return make_episodes(NUM_EPISODES)
+
+
+@pytest.fixture(scope='module')
+def feed(episodes):
+    feed = Feed()
+    feed.set_episodes(episodes)
+    return feed
+
+
+def test_set_episodes(benchmark, episodes):
+    feed = Feed()
+    benchmark(feed.set_episodes, episodes)
+    benchmark.extra_info['common_title'] = feed.common_title
+
+
+def test_set_episodes_without_cursor(benchmark, episodes):
+    # a field selection without the cursor skips the episode fingerprints
+    fields = parse_feed_fields('title,episodes(guid,title)')
+    feed = Feed()
+    benchmark(feed.set_episodes, episodes, fields)
+    assert not hasattr(feed, 'cursor')
+
+
+def test_encode_episodes(benchmark, feed):
+    benchmark(json.dumps, feed.episodes, cls=ObjectEncoder)
+
+
+def test_get_files(benchmark):
+    # an entry with many alternative media files
+    media = [{'url': 'http://example.com/media/%d.mp3' % n,
+              'type': 'audio/mpeg', 'fileSize': str(n)} for n in range(500)]
+    entry = type('Entry', (dict,), {})(media_content=media)
+    entry.media_content = media
+    parser = FeedparserEpisodeParser(entry)
+
+    files = benchmark(parser.get_files)
+    assert len(files) == len(media)
@@ -0,0 +1,37 @@
+""" Boot time and baseline memory of a worker process
+
+Each round starts a fresh interpreter that loads the WSGI application and the
+URL configuration (and thereby the views), as a worker does before it serves
+its first request. """
+
+import os
+import sys
+import json
+import subprocess
+
+
+BOOT_SCRIPT = '''
+import json, os, resource, sys, time
+start = time.perf_counter()
+import feedservice.wsgi
+import feedservice.urls
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'boot': elapsed, 'rss_kb': rss_kb,
+                  'modules': len(sys.modules)}))
+'''
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def boot_worker():
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.setdefault('MYGPOFS_SECRET_KEY', 'benchmarks')
+    output = subprocess.check_output([sys.executable, '-c', BOOT_SCRIPT],
+                                     env=env, cwd=ROOT)
+    return json.loads(output)
+
+
+def test_worker_boot(benchmark):
+    result = benchmark.pedantic(boot_worker, rounds=5)
+    benchmark.extra_info.update(result)
@@ -0,0 +1,29 @@
+""" Text processors on the HTML show notes of the corpus """
+
+import feedparser
+import pytest
+
+from feedservice.parse.text import StripHtmlTags, ConvertMarkdown
+
+from stubserver import read_corpus
+
+
+PROCESSORS = {
+    'strip_html': StripHtmlTags,
+    'markdown': ConvertMarkdown,
+}
+
+
+@pytest.fixture(scope='module')
+def shownotes():
+    feed = feedparser.parse(read_corpus('shownotes.rss'))
+    return [entry.content[0].value for entry in feed.entries]
+
+
+@pytest.mark.parametrize('name', list(PROCESSORS))
+def test_process_text(benchmark, shownotes, name):
+    processor = PROCESSORS[name]()
+
+    texts = benchmark(lambda: [processor.process(html) for html in shownotes])
+    benchmark.extra_info['chars_in'] = sum(map(len, shownotes))
+    benchmark.extra_info['chars_out'] = sum(map(len, texts))
@@ -0,0 +1,35 @@
+""" Overhead of the timing instrumentation, disabled and enabled """
+
+import pytest
+
+from feedservice import timing
+
+from conftest import make_feed
+
+
+def build_feed():
+    return make_feed(500)
+
+
+def time_stages(n):
+    for _ in range(n):
+        with timing.timed('stage'):
+            pass
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_timed(benchmark, enabled):
+    timings = timing.Timings() if enabled else None
+
+    with timing.use_timings(timings):
+        benchmark(time_stages, 10000)
+
+
+@pytest.mark.parametrize('enabled', [False, True])
+def test_build_feed(benchmark, enabled):
+    timings = timing.Timings() if enabled else None
+
+    with timing.use_timings(timings):
+        feed = benchmark(build_feed)
+
+    benchmark.extra_info['episodes'] = len(feed.episodes)
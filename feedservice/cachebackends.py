@@ -0,0 +1,517 @@
+""" Django cache backends that are shared between processes and nodes
+
+All shared state (parsed feeds, failures, popularity, ...) is stored in
+Django's default cache, which is selected with CACHE_BACKEND:
+
+* ``locmem``: Django's local memory cache, one per process
+* ``shm``: SharedMemoryCache, a memory-mapped file (in /dev/shm by default)
+  that is shared by the worker processes of one host
+* ``memcached``: MemcachedProtocolCache, which is shared by all nodes that
+  use the same memcached servers (or servers that speak its protocol)
+
+Both shared backends store values in a compact binary form (see dumps). """
+
+import os
+import mmap
+import time
+import zlib
+import fcntl
+import pickle
+import socket
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+import contextlib
+
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.memcached import BaseMemcachedCache
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MEMCACHED = '127.0.0.1:11211'
+
+# serialized values of at least this many bytes are compressed
+COMPRESS_MIN_SIZE = 512
+
+PICKLED = b'p'
+COMPRESSED = b'z'
+
+
+def dumps(value):
+    """ Serializes a value with pickle, compressed with zlib if that helps
+    """
+
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    if len(data) >= COMPRESS_MIN_SIZE:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return COMPRESSED + compressed
+
+    return PICKLED + data
+
+
+def loads(data):
+    data = memoryview(data)
+    if data[:1] == COMPRESSED:
+        return pickle.loads(zlib.decompress(data[1:]))
+    return pickle.loads(data[1:])
+
+
+def get_default_location():
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else \
+        tempfile.gettempdir()
+    return os.path.join(directory, 'feedservice-cache')
+
+
+class SharedMemoryCache(BaseCache):
+    """ A cache in a memory-mapped file, shared by the processes of a host
+
+    The file (LOCATION) consists of a header, an index of MAX_ENTRIES slots
+    and a ring buffer of OPTIONS['SIZE'] bytes for the values. New values
+    are appended to the ring buffer, overwriting the oldest ones; each slot
+    points to a value by its position in the stream of all values written,
+    so that overwritten values are recognized. Keys are hashed to a slot and
+    the following PROBES - 1 slots; if all of them are in use, the one with
+    the oldest value is replaced.
+
+    Access is serialized with flock, shared for reading and exclusive for
+    writing, and a lock per process. Values larger than a quarter of the
+    ring buffer are not stored. """
+
+    MAGIC = b'FSCACHE1'
+    HEADER = struct.Struct('<8sQQQ')    # magic, slots, size, write position
+    SLOT = struct.Struct('<16sQId')     # key digest, position, length, expiry
+    RECORD = struct.Struct('<H')        # length of the key, before the key
+
+    PROBES = 8
+    EMPTY = bytes(16)
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS') or {}
+
+        self._path = location or get_default_location()
+        self._slots = self._max_entries
+        self._size = int(options.get('SIZE', 64 * 1024 * 1024))
+        self._data_start = self.HEADER.size + self._slots * self.SLOT.size
+        self._file_size = self._data_start + self._size
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._mm = None
+
+    def _open(self):
+        """ Maps the file, once per process, and initializes it if needed """
+
+        if self._pid == os.getpid():
+            return
+
+        fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+        try:
+            header = os.pread(fd, self.HEADER.size, 0)
+            expected = (self.MAGIC, self._slots, self._size)
+
+            if os.fstat(fd).st_size != self._file_size or \
+                    len(header) < self.HEADER.size or \
+                    self.HEADER.unpack(header)[:3] != expected:
+                # a new file, or one with another layout
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self._file_size)
+                os.pwrite(fd, self.HEADER.pack(self.MAGIC, self._slots,
+                                               self._size, 0), 0)
+
+            mm = mmap.mmap(fd, self._file_size)
+
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+        # the file of the parent process (eg gunicorn's master) is not used,
+        # as flock does not exclude processes that share an open file
+        self._fd, self._mm, self._pid = fd, mm, os.getpid()
+
+    @contextlib.contextmanager
+    def _locked(self, exclusive=False):
+        with self._lock:
+            self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else
+                        fcntl.LOCK_SH)
+            try:
+                yield self._mm
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _digest(self, key):
+        return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+    def _probe(self, digest):
+        start = int.from_bytes(digest[:8], 'little')
+        return [(start + n) % self._slots for n in range(self.PROBES)]
+
+    def _read_slot(self, mm, index):
+        return self.SLOT.unpack_from(mm, self.HEADER.size +
+                                     index * self.SLOT.size)
+
+    def _write_slot(self, mm, index, *slot):
+        self.SLOT.pack_into(mm, self.HEADER.size + index * self.SLOT.size,
+                            *slot)
+
+    def _write_pos(self, mm):
+        return self.HEADER.unpack_from(mm)[3]
+
+    def _is_live(self, slot, write_pos, now):
+        digest, pos, length, expires = slot
+        return digest != self.EMPTY and expires > now and \
+            pos + self._size >= write_pos
+
+    def _find(self, mm, digest):
+        """ Returns the index of the live slot of the key, or None """
+
+        write_pos, now = self._write_pos(mm), time.time()
+        for index in self._probe(digest):
+            slot = self._read_slot(mm, index)
+            if slot[0] == digest and self._is_live(slot, write_pos, now):
+                return index
+        return None
+
+    def _read(self, mm, index, key):
+        """ Returns the value of the slot, if it belongs to the key """
+
+        digest, pos, length, expires = self._read_slot(mm, index)
+        start = self._data_start + pos % self._size
+        record = mm[start:start + length]
+
+        key_length, = self.RECORD.unpack_from(record)
+        end = self.RECORD.size + key_length
+        if record[self.RECORD.size:end] != key.encode('utf-8'):
+            return None
+
+        return record[end:]
+
+    def _store(self, mm, key, digest, data, expires):
+        encoded_key = key.encode('utf-8')
+        record = self.RECORD.pack(len(encoded_key)) + encoded_key + data
+
+        write_pos = self._write_pos(mm)
+        offset = write_pos % self._size
+        if offset + len(record) > self._size:
+            # values do not wrap around the end of the ring buffer
+            write_pos += self._size - offset
+            offset = 0
+
+        start = self._data_start + offset
+        mm[start:start + len(record)] = record
+
+        # the key's own slot, a free one, or the one with the oldest value
+        now = time.time()
+        candidates = []
+        for index in self._probe(digest):
+            slot = self._read_slot(mm, index)
+            if slot[0] == digest:
+                candidates = [(-1, index)]
+                break
+            live = self._is_live(slot, write_pos, now)
+            candidates.append((slot[1] if live else -1, index))
+
+        index = min(candidates)[1]
+        self._write_slot(mm, index, digest, write_pos, len(record), expires)
+
+        self.HEADER.pack_into(mm, 0, self.MAGIC, self._slots, self._size,
+                              write_pos + len(record))
+
+    def _expiry(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return float('inf') if expires is None else expires
+
+    def _fits(self, key, data):
+        return len(key) + len(data) + self.RECORD.size <= self._size // 4
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        digest = self._digest(key)
+
+        with self._locked() as mm:
+            index = self._find(mm, digest)
+            data = None if index is None else self._read(mm, index, key)
+
+        return default if data is None else loads(data)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        digest, data = self._digest(key), dumps(value)
+
+        with self._locked(exclusive=True) as mm:
+            if self._fits(key, data):
+                self._store(mm, key, digest, data, self._expiry(timeout))
+            else:
+                self._delete(mm, digest)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        digest, data = self._digest(key), dumps(value)
+
+        if not self._fits(key, data):
+            return False
+
+        with self._locked(exclusive=True) as mm:
+            if self._find(mm, digest) is not None:
+                return False
+
+            self._store(mm, key, digest, data, self._expiry(timeout))
+            return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        digest = self._digest(key)
+
+        with self._locked(exclusive=True) as mm:
+            index = self._find(mm, digest)
+            if index is None:
+                return False
+
+            slot = self._read_slot(mm, index)
+            self._write_slot(mm, index, *slot[:3], self._expiry(timeout))
+            return True
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+
+        with self._locked(exclusive=True) as mm:
+            self._delete(mm, self._digest(key))
+
+    def _delete(self, mm, digest):
+        index = self._find(mm, digest)
+        if index is not None:
+            self._write_slot(mm, index, self.EMPTY, 0, 0, 0)
+
+    def clear(self):
+        with self._locked(exclusive=True) as mm:
+            start = self.HEADER.size
+            mm[start:self._data_start] = bytes(self._data_start - start)
+
+
+class MemcachedConnection(object):
+    """ A connection to a memcached server, speaking its text protocol """
+
+    def __init__(self, address, timeout):
+        host, _, port = address.rpartition(':')
+        if not host:
+            host, port = address, DEFAULT_MEMCACHED.rpartition(':')[2]
+        self.sock = socket.create_connection((host, int(port)), timeout)
+        self.file = self.sock.makefile('rb')
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        line = self.file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('connection closed by server')
+        return line[:-2]
+
+    def read_value(self, length):
+        data = self.file.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError('connection closed by server')
+        return data[:-2]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class MemcachedServer(object):
+    """ A memcached server and the idle connections to it
+
+    After an error, the server is considered down for dead_retry seconds,
+    in which all operations on it fail right away. """
+
+    def __init__(self, address, socket_timeout, dead_retry):
+        self.address = address
+        self.socket_timeout = socket_timeout
+        self.dead_retry = dead_retry
+        self.dead_until = 0
+        self.idle = []
+
+    @contextlib.contextmanager
+    def connection(self):
+        if self.dead_until > time.time():
+            raise ConnectionError('%s is down' % self.address)
+
+        try:
+            conn = self.idle.pop() if self.idle else \
+                MemcachedConnection(self.address, self.socket_timeout)
+        except OSError:
+            self.mark_dead()
+            raise
+
+        try:
+            yield conn
+
+        except BaseException as ex:
+            # the state of the connection is unknown
+            conn.close()
+            if isinstance(ex, OSError):
+                self.mark_dead()
+            raise
+
+        self.idle.append(conn)
+
+    def mark_dead(self):
+        logger.warning('memcached server %s is down', self.address)
+        self.dead_until = time.time() + self.dead_retry
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+
+class MemcachedClient(object):
+    """ A client for memcached servers, as used by BaseMemcachedCache
+
+    Keys are distributed over the servers by their hash. Errors are logged
+    and treated as cache misses and failed updates. """
+
+    def __init__(self, servers, socket_timeout=1, dead_retry=30):
+        self.servers = [MemcachedServer(address, socket_timeout, dead_retry)
+                        for address in servers]
+
+    def get_server(self, key):
+        return self.servers[zlib.crc32(key.encode('utf-8')) %
+                            len(self.servers)]
+
+    def _store(self, command, key, value, timeout):
+        data = dumps(value)
+        line = '%s %s 0 %d %d\r\n' % (command, key, timeout, len(data))
+
+        try:
+            with self.get_server(key).connection() as conn:
+                conn.send(line.encode('utf-8') + data + b'\r\n')
+                return conn.readline() == b'STORED'
+        except OSError:
+            return False
+
+    def set(self, key, value, timeout=0):
+        return self._store('set', key, value, timeout)
+
+    def add(self, key, value, timeout=0):
+        return self._store('add', key, value, timeout)
+
+    def set_multi(self, mapping, timeout=0):
+        return [key for key, value in mapping.items()
+                if not self.set(key, value, timeout)]
+
+    def get(self, key, default=None):
+        return self.get_multi([key]).get(key, default)
+
+    def get_multi(self, keys):
+        by_server = {}
+        for key in keys:
+            by_server.setdefault(self.get_server(key), []).append(key)
+
+        values = {}
+        for server, server_keys in by_server.items():
+            try:
+                with server.connection() as conn:
+                    conn.send(('get %s\r\n' % ' '.join(server_keys))
+                              .encode('utf-8'))
+                    values.update(self._read_values(conn))
+            except OSError:
+                pass
+
+        return values
+
+    def _read_values(self, conn):
+        values = {}
+
+        while True:
+            line = conn.readline()
+            if line == b'END':
+                return values
+
+            parts = line.split()
+            if len(parts) != 4 or parts[0] != b'VALUE':
+                raise ConnectionError('unexpected response %r' % line)
+
+            values[parts[1].decode('utf-8')] = loads(
+                conn.read_value(int(parts[3])))
+
+    def _command(self, key, line):
+        """ Sends a command about the key; returns the reply, or None """
+
+        try:
+            with self.get_server(key).connection() as conn:
+                conn.send(line.encode('utf-8'))
+                return conn.readline()
+        except OSError:
+            return None
+
+    def touch(self, key, timeout=0):
+        return self._command(key, 'touch %s %d\r\n' % (key, timeout)) == \
+            b'TOUCHED'
+
+    def delete(self, key):
+        return self._command(key, 'delete %s\r\n' % key) == b'DELETED'
+
+    def delete_multi(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def flush_all(self):
+        for server in self.servers:
+            try:
+                with server.connection() as conn:
+                    conn.send(b'flush_all\r\n')
+                    conn.readline()
+            except OSError:
+                pass
+
+    def disconnect_all(self):
+        for server in self.servers:
+            server.close()
+
+
+class MemcachedProtocolCache(BaseMemcachedCache):
+    """ A cache on memcached servers (LOCATION, as host:port separated by
+    ';')
+
+    Connections are kept open between requests. The OPTIONS SOCKET_TIMEOUT
+    and DEAD_RETRY (in seconds) are passed to MemcachedClient. """
+
+    def __init__(self, server, params):
+        super().__init__(server or DEFAULT_MEMCACHED, params, library=None,
+                         value_not_found_exception=ValueError)
+        self._client = MemcachedClient(
+            self._servers,
+            socket_timeout=float(self._options.get('SOCKET_TIMEOUT', 1)),
+            dead_retry=float(self._options.get('DEAD_RETRY', 30)),
+        )
+
+    @property
+    def _cache(self):
+        return self._client
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._cache.touch(key, self.get_backend_timeout(timeout))
+
+    def close(self, **kwargs):
+        # called after every request; the connections are reused instead
+        pass
+
+    # values are pickled, so they can not be changed by the servers
+    incr = BaseCache.incr
+    decr = BaseCache.decr
@@ -0,0 +1,224 @@
+""" Adaptive limits for concurrent fetches from each host
+
+Every host starts with HOST_CONCURRENCY_INITIAL concurrent fetches. The
+limit grows additively while the host responds as fast as usual (by one per
+limit responses, up to HOST_CONCURRENCY_MAX), and is halved when it slows
+down (its recent latency exceeds HOST_LATENCY_FACTOR times its long-term
+latency) or asks to be fetched less (429 and 503 responses). A Retry-After
+header of these responses pauses all fetches from the host; if it asks for
+more than FETCH_TIMEOUT seconds, fetches fail right away with HostThrottled.
+
+Fetches that exceed the limit wait for a free slot, in the order in which
+they arrived. The limits are kept per process; latency is measured until
+the response headers arrive, so that it does not depend on the size of the
+feeds. """
+
+import time
+import collections
+import email.utils
+import urllib.parse
+
+import eventlet
+from eventlet.event import Event
+from django.conf import settings
+
+from feedservice import metrics, timing
+
+
+# weights of a new latency sample in the recent and long-term averages
+RECENT_WEIGHT = 0.2
+LONG_TERM_WEIGHT = 0.02
+
+# status codes with which hosts ask to be fetched less
+THROTTLE_STATUS = (429, 503)
+
+# idle hosts are forgotten when more than this many are tracked
+MAX_HOSTS = 10000
+
+
+class HostThrottled(Exception):
+    """ raised when a host has asked not to be fetched for longer than
+    FETCH_TIMEOUT """
+
+
+class HostLimit(object):
+    """ The concurrency limit of one host, and the fetches waiting for it """
+
+    def __init__(self, host):
+        self.host = host
+        self.limit = float(settings.HOST_CONCURRENCY_INITIAL)
+        self.active = 0
+        self.waiters = collections.deque()
+        self.latency = None
+        self.long_term_latency = None
+        self.blocked_until = 0
+        self.last_decrease = 0
+
+    def is_idle(self):
+        return self.active == 0 and not self.waiters and \
+            self.blocked_until <= time.time()
+
+    def acquire(self):
+        """ Waits until a fetch from the host is allowed """
+
+        wait = self.blocked_until - time.time()
+        if wait > settings.FETCH_TIMEOUT:
+            raise HostThrottled('%s asked not to be fetched for %d seconds'
+                                % (self.host, wait))
+
+        if wait <= 0 and self.active < int(self.limit) and not self.waiters:
+            self.active += 1
+            return
+
+        event = Event()
+        self.waiters.append(event)
+
+        try:
+            with timing.timed('fetch-wait'):
+                event.wait()
+
+        except BaseException:
+            # eg a timeout; a slot that has been handed over is passed on
+            if event.ready():
+                self.release()
+            else:
+                self.waiters.remove(event)
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._hand_over()
+
+    def _hand_over(self):
+        """ Hands free slots over to waiting fetches """
+
+        if self.blocked_until > time.time():
+            return
+
+        while self.waiters and self.active < int(self.limit):
+            self.active += 1
+            self.waiters.popleft().send()
+
+    def record(self, status, latency, retry_after=None):
+        """ Adapts the limit to a response """
+
+        now = time.time()
+
+        if status in THROTTLE_STATUS:
+            self.decrease(now, 'throttled')
+
+            if retry_after:
+                pause = min(retry_after, settings.HOST_RETRY_AFTER_MAX)
+                if now + pause > self.blocked_until:
+                    self.blocked_until = now + pause
+                    eventlet.spawn_after(pause, self._hand_over)
+            return
+
+        if self.latency is None:
+            self.latency = self.long_term_latency = latency
+        else:
+            self.latency += RECENT_WEIGHT * (latency - self.latency)
+            self.long_term_latency += LONG_TERM_WEIGHT * (
+                latency - self.long_term_latency)
+
+        if self.latency > settings.HOST_LATENCY_FACTOR * \
+                self.long_term_latency:
+            self.decrease(now, 'latency')
+
+        else:
+            self.limit = min(self.limit + 1 / self.limit,
+                             settings.HOST_CONCURRENCY_MAX)
+            self._hand_over()
+
+    def decrease(self, now, reason):
+        """ Halves the limit, at most once per round trip to the host """
+
+        if now - self.last_decrease < max(self.latency or 0, 1):
+            return
+
+        self.last_decrease = now
+        self.limit = max(self.limit / 2, 1)
+        metrics.record_host_limit_decrease(self.host, reason)
+
+
+class NullLimit(object):
+    """ Used if the limits are disabled """
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+    def record(self, status, latency, retry_after=None):
+        pass
+
+
+NULL_LIMIT = NullLimit()
+
+_limits = {}
+
+
+def get_host(url):
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+def get_limit(url):
+    """ Returns the HostLimit for the URL's host """
+
+    if settings.HOST_CONCURRENCY_MAX <= 0:
+        return NULL_LIMIT
+
+    host = get_host(url)
+    limit = _limits.get(host)
+
+    if limit is None:
+        if len(_limits) >= MAX_HOSTS:
+            for idle in [h for h, l in _limits.items() if l.is_idle()]:
+                del _limits[idle]
+
+        limit = _limits[host] = HostLimit(host)
+
+    return limit
+
+
+def clear():
+    """ Forgets the limits of all hosts """
+    _limits.clear()
+
+
+def get_retry_after(headers):
+    """ Returns the seconds of a Retry-After header, or None
+
+    >>> get_retry_after({'Retry-After': '120'})
+    120
+    """
+
+    value = headers.get('Retry-After', '').strip()
+
+    if value.isdigit():
+        return int(value)
+
+    date = email.utils.parsedate_tz(value)
+    if date:
+        return max(0, email.utils.mktime_tz(date) - time.time())
+
+    return None
+
+
+class limited(object):
+    """ Holds a slot of the URL's host while fetching from it """
+
+    def __init__(self, url):
+        self.limit = get_limit(url)
+
+    def __enter__(self):
+        self.limit.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.limit.release()
+
+    def record(self, resp):
+        self.limit.record(resp.status_code, resp.elapsed.total_seconds(),
+                          get_retry_after(resp.headers))
@@ -0,0 +1,208 @@
+""" Prometheus metrics of fetching, parsing, caching and encoding feeds
+
+The metrics are exported at /metrics if prometheus_client is installed;
+otherwise recording them does nothing. When several worker processes serve
+requests (eg with gunicorn), PROMETHEUS_MULTIPROC_DIR has to point to an
+empty directory in which the workers store their metrics, so that they can
+be aggregated (see gunicorn.conf.py).
+
+Feeds are labelled by their host's registered domain (see get_host_label),
+and only for the first METRICS_MAX_HOSTS of them in each process, so that
+the number of time series stays bounded. """
+
+import os
+import functools
+import ipaddress
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# buckets of the histograms, in seconds, bytes and episodes
+DURATION_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 20)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7)
+EPISODE_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+if prometheus_client is not None:
+    FETCHES = Counter(
+        'feedservice_fetches_total', 'Feed fetches by host and HTTP status '
+        '("error" if no response was received)', ['host', 'status'])
+    FETCH_DURATION = Histogram(
+        'feedservice_fetch_duration_seconds', 'Duration of feed fetches',
+        ['host'], buckets=DURATION_BUCKETS)
+    FEED_SIZE = Histogram(
+        'feedservice_feed_size_bytes', 'Size of fetched feeds', ['host'],
+        buckets=SIZE_BUCKETS)
+
+    FETCHES_REJECTED = Counter(
+        'feedservice_fetches_rejected_total', 'Fetches that were not made '
+        'because the feed failed recently ("failing-feed") or its host is '
+        'down ("host-down")', ['host', 'reason'])
+    BREAKER_TRANSITIONS = Counter(
+        'feedservice_breaker_transitions_total', 'Changes of the state of '
+        'host circuit breakers (open, half-open, closed)', ['host', 'state'])
+
+    HOST_LIMIT_DECREASES = Counter(
+        'feedservice_host_limit_decreases_total', 'Decreases of the '
+        'concurrency limit of hosts because they were slow ("latency") or '
+        'asked to be fetched less ("throttled")', ['host', 'reason'])
+
+    PARSE_DURATION = Histogram(
+        'feedservice_parse_duration_seconds', 'Duration of parsing a fetched '
+        'feed', ['parser'], buckets=DURATION_BUCKETS)
+    EPISODES = Histogram(
+        'feedservice_feed_episodes', 'Number of episodes of parsed feeds',
+        ['parser'], buckets=EPISODE_BUCKETS)
+    PARSE_RESULTS = Counter(
+        'feedservice_parse_results_total', 'Requested feeds by result '
+        '(parsed, not_modified, error)', ['result'])
+
+    CACHE_LOOKUPS = Counter(
+        'feedservice_cache_lookups_total', 'Lookups of feeds in the cache by '
+        'result (fresh, stale, expired, miss)', ['result'])
+
+    WEBSUB_EVENTS = Counter(
+        'feedservice_websub_events_total', 'Subscriptions to hubs and pushes '
+        'from them (subscribe, verified, denied, push, rejected)', ['event'])
+
+    ENCODE_DURATION = Histogram(
+        'feedservice_encode_duration_seconds', 'Duration of serializing '
+        'responses', ['format'], buckets=DURATION_BUCKETS)
+    RESPONSE_SIZE = Histogram(
+        'feedservice_response_size_bytes', 'Size of serialized responses, '
+        'before compression', ['format'], buckets=SIZE_BUCKETS)
+
+    IN_PROGRESS = Gauge(
+        'feedservice_requests_in_progress', 'Requests that are being '
+        'handled', ['view'], multiprocess_mode='livesum')
+
+
+_hosts = set()
+
+
+def get_host_label(url):
+    """ Returns the label for the host of the URL
+
+    This is the registered domain, approximated by the last two labels of
+    the host name, or 'ip' for IP addresses. Beyond the first
+    METRICS_MAX_HOSTS different values, 'other' is returned. """
+
+    host = urlsplit(url).hostname or ''
+
+    try:
+        ipaddress.ip_address(host)
+        return 'ip'
+    except ValueError:
+        pass
+
+    label = '.'.join(host.rsplit('.', 2)[-2:]) or 'none'
+
+    if label not in _hosts:
+        if len(_hosts) >= settings.METRICS_MAX_HOSTS:
+            return 'other'
+        _hosts.add(label)
+
+    return label
+
+
+def record_fetch(url, status, seconds, size=None):
+    """ Records a fetch that returned status, or 'error' """
+    if prometheus_client is None:
+        return
+
+    host = get_host_label(url)
+    FETCHES.labels(host, str(status)).inc()
+    FETCH_DURATION.labels(host).observe(seconds)
+    if size is not None:
+        FEED_SIZE.labels(host).observe(size)
+
+
+def record_fetch_rejected(url, reason):
+    if prometheus_client is not None:
+        FETCHES_REJECTED.labels(get_host_label(url), reason).inc()
+
+
+def record_breaker(url, state):
+    if prometheus_client is not None:
+        BREAKER_TRANSITIONS.labels(get_host_label(url), state).inc()
+
+
+def record_host_limit_decrease(host, reason):
+    if prometheus_client is not None:
+        HOST_LIMIT_DECREASES.labels(get_host_label('//' + host), reason).inc()
+
+
+def record_parse(parser_cls, seconds, feed):
+    if prometheus_client is None:
+        return
+
+    name = parser_cls.__name__
+    PARSE_DURATION.labels(name).observe(seconds)
+    episodes = getattr(feed, 'episodes', None)
+    if episodes is not None:
+        EPISODES.labels(name).observe(len(episodes))
+
+
+def record_parse_result(result):
+    if prometheus_client is not None:
+        PARSE_RESULTS.labels(result).inc()
+
+
+def record_cache_lookup(result):
+    if prometheus_client is not None:
+        CACHE_LOOKUPS.labels(result).inc()
+
+
+def record_websub(event):
+    if prometheus_client is not None:
+        WEBSUB_EVENTS.labels(event).inc()
+
+
+def record_encode(content_type, seconds, size):
+    if prometheus_client is None:
+        return
+
+    ENCODE_DURATION.labels(content_type).observe(seconds)
+    RESPONSE_SIZE.labels(content_type).observe(size)
+
+
+def track_in_progress(view):
+    """ Returns a decorator that counts the requests being handled by a view
+    """
+
+    def decorator(view_func):
+        if prometheus_client is None:
+            return view_func
+
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            with IN_PROGRESS.labels(view).track_inprogress():
+                return view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def generate():
+    """ Returns the metrics in the Prometheus text format
+
+    In multiprocess mode, these are the metrics of all processes. """
+
+    registry = prometheus_client.REGISTRY
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+
+    return prometheus_client.generate_latest(registry)
@@ -6,11 +6,20 @@ import logging
 import urllib.error
 import http.client
 import socket
+import time
 
 import eventlet
+import requests
+from django.conf import settings
 
+from feedservice.parse import cache, delta, enclosures, failures, \
+    popularity, redirects, websub
 from feedservice.parse.models import Feed, ParserException
+from feedservice.parse.registry import ParserRegistry, ENTRY_POINT_GROUP, \
+    normalize_url
 from feedservice.utils import fetch_url, NotModified
+from feedservice import metrics, timing
+from feedservice.hostlimits import HostThrottled, THROTTLE_STATUS
 
 
 logger = logging.getLogger(__name__)
@@ -20,86 +29,425 @@ class FetchFeedException(Exception):
     """ raised when there's an error while fetching the podcast feed """
 
 
-def get_parser_classes():
-    from feedservice.parse import feed, youtube, soundcloud, fm4, vimeo
-    return (
-        youtube.YoutubeParser,
-        vimeo.VimeoParser,
-        soundcloud.SoundcloudParser,
-        soundcloud.SoundcloudFavParser,
-        fm4.FM4OnDemandPlaylistParser,
-        feed.Feedparser,  # fallback, has to be the last entry
-    )
+class UpstreamError(FetchFeedException):
+    """ raised when the feed's server times out or responds with an error """
 
 
-PARSER_CLASSES = get_parser_classes()
+def get_parser_registry():
+    """ Returns the registry of the built-in and installed parsers
 
+    The parser modules are only imported when they are first needed;
+    installed parsers (entry points) come first, so that they can override
+    built-in ones. """
+
+    registry = ParserRegistry(default='feedservice.parse.feed:Feedparser',
+                              entry_point_group=ENTRY_POINT_GROUP)
+
+    for path, hosts in (
+            ('feedservice.parse.youtube:YoutubeParser', ['youtube.com']),
+            ('feedservice.parse.vimeo:VimeoParser', ['vimeo.com']),
+            ('feedservice.parse.soundcloud:SoundcloudParser',
+             ['soundcloud.com']),
+            ('feedservice.parse.soundcloud:SoundcloudFavParser',
+             ['soundcloud.com']),
+            ('feedservice.parse.fm4:FM4OnDemandPlaylistParser',
+             ['onapp1.orf.at']),
+        ):
+        registry.register(path, hosts)
+
+    return registry
 
-def parse_feeds(feed_urls, mod_since_utc=None, text_processor=None):
-    """ Parses the specified feeds and returns their JSON representations
 
-    RSS-Redirects are followed automatically by including both feeds in the
-    result. """
+PARSER_REGISTRY = get_parser_registry()
+
+
+def parse_feeds(feed_urls, mod_since_utc=None, text_processor=None,
+                use_cache=True, validators=None, fields=None, cursors=None,
+                enrich_files=False):
+    """ Parses the specified feeds and returns their JSON representations
 
-    visited_urls = set()
+    validators maps feed URLs to the (etag, last_modified) values the client
+    has for them; mod_since_utc applies to all other feeds. Feeds that have
+    not been modified are included as feeds that only contain their URL,
+    their validators and not_modified = True. fields selects the fields that
+    are parsed (see feedservice.parse.fields). cursors maps feed URLs to the
+    cursors from previous responses, for which only the changed episodes
+    are returned (see feedservice.parse.delta). enrich_files requests the
+    metadata of the episodes' files (see feedservice.parse.enclosures).
+
+    RSS-Redirects and permanent redirects are followed automatically by
+    including both feeds in the result, unless the redirect is already known
+    (see feedservice.parse.redirects); then only the new location is
+    fetched, and the requested URL is included in its urls. """
+
+    validators = validators or {}
+    cursors = cursors or {}
+    visited_urls = set(feed_urls)
     result = []
 
     for url in feed_urls:
 
+        etag, last_modified = validators.get(url, (None, None))
+
         try:
-            feed = parse_feed(url, text_processor, mod_since_utc)
+            feed = parse_feed(url, text_processor,
+                              last_modified or mod_since_utc, use_cache, etag,
+                              fields, cursors.get(url), enrich_files)
 
         except FetchFeedException as ffe:
-            feed = Feed()
-            feed.urls = [url]
-            feed.new_location = None
-            feed.add_error('fetch-feed', str(ffe))
+            feed = get_error_feed(url, ffe)
+
+        result.append(feed)
 
-        if not feed:
+        if getattr(feed, 'not_modified', False):
             continue
 
-        visited = feed.urls
+        visited_urls.update(feed.urls)
         new_loc = feed.new_location
 
         # we follow RSS-redirects automatically
-        if new_loc and new_loc not in (list(visited_urls) + visited):
+        if new_loc and new_loc not in visited_urls:
+            visited_urls.add(new_loc)
             feed_urls.append(new_loc)
 
-        visited_urls.add(url)
+    return result
 
-        result.append(feed)
 
-    return result
+def parse_feed_requests(feed_requests, use_cache=True, concurrency=10,
+                        fields=None, enrich_files=False):
+    """ Parses feeds concurrently and returns the list of their results
 
+    See iter_feed_requests. """
+    return list(iter_feed_requests(feed_requests, use_cache, concurrency,
+                                   fields, enrich_files))
 
-def get_parser_cls(url):
-    for cls in PARSER_CLASSES:
-        if cls.handles_url(url):
-            return cls
 
-    raise ValueError('no feed can handle %s' % url)
+def iter_feed_requests(feed_requests, use_cache=True, concurrency=10,
+                       fields=None, enrich_files=False):
+    """ Parses feeds concurrently, each with its own options
+
+    Each request is a dict with the keys url, etag, last_modified, cursor,
+    text_processor and max_episodes, of which only url is required. Yields
+    (url, status, feed) tuples in the order of the requests, where
+    status is 200 for parsed feeds, 304 (and feed None) for feeds that have
+    not been modified, and 502 for feeds that could not be fetched. """
+
+    # the feeds are parsed in other green threads, which have to add their
+    # timings to those of the request
+    timings = timing.get_timings()
+
+    def _parse(feed_request):
+        with timing.use_timings(timings):
+            return _parse_request(feed_request)
+
+    def _parse_request(feed_request):
+        url = feed_request['url']
+
+        try:
+            feed = parse_feed(url, feed_request.get('text_processor'),
+                              feed_request.get('last_modified'), use_cache,
+                              feed_request.get('etag'), fields,
+                              feed_request.get('cursor'), enrich_files)
+
+        except FetchFeedException as ffe:
+            return url, 502, get_error_feed(url, ffe)
+
+        if getattr(feed, 'not_modified', False):
+            return url, 304, None
+
+        max_episodes = feed_request.get('max_episodes')
+        if max_episodes is not None and hasattr(feed, 'episodes'):
+            feed.episodes = feed.episodes[:max_episodes]
+
+        return url, 200, feed
+
+    pool = eventlet.GreenPool(concurrency)
+    return pool.imap(_parse, feed_requests)
+
 
+def get_error_feed(url, ffe):
+    """ Returns a feed that reports that it could not be fetched """
+    feed = Feed()
+    feed.urls = [url]
+    feed.new_location = None
+    feed.add_error('fetch-feed', str(ffe))
+    return feed
 
-def parse_feed(feed_url, text_processor, mod_since_utc=None):
+
+def get_not_modified_feed(url, etag=None, last_modified=None):
+    """ Returns a feed that reports that it has not been modified """
+    feed = Feed()
+    feed.urls = [url]
+    feed.not_modified = True
+    feed.http_etag = etag
+    feed.http_last_modified = last_modified
+    return feed
+
+
+def get_parser_cls(url):
+    return PARSER_REGISTRY.get_parser_cls(url)
+
+
+def parse_feed(feed_url, text_processor, mod_since_utc=None, use_cache=True,
+               etag=None, fields=None, cursor=None, enrich_files=False):
     """ Parses a feed and returns its JSON object
 
-    mod_since_utc: feeds that have not changed since this timestamp are ignored
+    mod_since_utc: feeds that have not changed since this timestamp are
+                   returned as not modified (see get_not_modified_feed)
     text_processor: class to pre-process text contents
+    use_cache: serve the feed from the cache, if possible
+    etag: feeds that still have this ETag are returned as not modified
+    fields: the fields to parse (see feedservice.parse.fields)
+    cursor: return only the episodes that changed since the response with
+            this cursor (see feedservice.parse.delta)
+    enrich_files: request the metadata of the episodes' files from their
+                  servers (see feedservice.parse.enclosures)
+
+    Feeds that are known to have moved are fetched from their new location
+    (see feedservice.parse.redirects).
     """
 
+    # the episodes have to be fingerprinted to compare them with the cursor
+    if cursor and fields is not None and 'cursor' not in fields:
+        fields = dict(fields, cursor=None)
+
+    chain = redirects.resolve(feed_url)
+
+    with timing.timed_feed(feed_url):
+        try:
+            feed = _parse_feed(chain[-1], text_processor, mod_since_utc,
+                               use_cache, etag, fields, cursor)
+        except FetchFeedException:
+            metrics.record_parse_result('error')
+            raise
+
+        if enrich_files and not getattr(feed, 'not_modified', False):
+            with timing.timed('enrich'):
+                enclosures.enrich_feed(feed)
+
+    if len(chain) > 1:
+        redirects.add_aliases(feed, chain)
+
+    if getattr(feed, 'not_modified', False):
+        metrics.record_parse_result('not_modified')
+    else:
+        metrics.record_parse_result('parsed')
+
+    return feed
+
+
+def _parse_feed(feed_url, text_processor, mod_since_utc, use_cache, etag,
+                fields, cursor):
+
+    popularity.record_request(feed_url, text_processor)
+
+    if not use_cache:
+        try:
+            feed, max_age = fetch_feed(feed_url, text_processor,
+                                       mod_since_utc, etag, fields)
+        except NotModified:
+            return get_not_modified_feed(feed_url, etag, mod_since_utc)
+
+        delta.store_index(feed_url, feed)
+        return delta.apply_cursor(feed_url, feed, cursor)
+
+    with timing.timed('cache'):
+        entry = cache.get_entry(feed_url, text_processor, fields)
+
+    if entry and entry.is_fresh():
+        metrics.record_cache_lookup('fresh')
+        feed = entry.feed
+
+    elif entry and entry.is_stale_servable():
+        metrics.record_cache_lookup('stale')
+        # serve the stale feed right away, and refresh it for later requests
+        if cache.lock_refresh(feed_url, text_processor, fields):
+            eventlet.spawn_n(refresh_feed_background, feed_url,
+                             text_processor, entry, fields)
+        feed = entry.feed
+
+    else:
+        metrics.record_cache_lookup('expired' if entry else 'miss')
+
+        try:
+            feed = refresh_feed(feed_url, text_processor, entry, fields).feed
+
+        except UpstreamError as ue:
+            if not (entry and entry.is_usable_on_error()):
+                raise
+
+            feed = entry.feed
+            feed.add_warning('fetch-feed', 'serving cached feed, fetched '
+                             '%d seconds ago: %s' % (entry.age, ue))
+
+    if not cache.is_modified(feed, mod_since_utc, etag):
+        return get_not_modified_feed(feed_url,
+                                     getattr(feed, 'http_etag', None),
+                                     getattr(feed, 'http_last_modified', None))
+
+    return delta.apply_cursor(feed_url, feed, cursor)
+
+
+def refresh_feed(feed_url, text_processor, entry=None, fields=None):
+    """ Fetches and parses the feed, updates the cache and returns the entry
+
+    If a cached entry is given, the feed is only re-parsed if it has been
+    modified since the entry has been stored. """
+
+    if entry:
+        mod_since_utc = getattr(entry.feed, 'http_last_modified', None)
+        etag = getattr(entry.feed, 'http_etag', None)
+    else:
+        mod_since_utc, etag = None, None
+
+    try:
+        feed, max_age = fetch_feed(feed_url, text_processor, mod_since_utc,
+                                   etag, fields)
+        max_age = websub.get_max_age(feed_url, text_processor, fields,
+                                     max_age)
+        entry = cache.CacheEntry(feed, max_age)
+
+    except NotModified as nm:
+        if not entry:
+            raise FetchFeedException('unexpected 304 response') from nm
+
+        entry.revalidated(websub.get_max_age(feed_url, text_processor, fields,
+                                             nm.max_age))
+
+    cache.store_entry(feed_url, text_processor, entry, fields)
+    delta.store_index(feed_url, entry.feed)
+    return entry
+
+
+def store_pushed_feed(feed_url, resp, text_processors):
+    """ Parses a feed that has been pushed by its hub, and stores it in the
+    cache for each of the text processors (see feedservice.parse.websub) """
+
     parser_cls = get_parser_cls(feed_url)
 
     try:
-        resp = fetch_url(feed_url, mod_since_utc)
-        parser = parser_cls(feed_url, resp, text_processor=text_processor)
-        return parser.get_feed()
+        with resp.body:
+            for text_processor in text_processors:
+                feed = parse_response(parser_cls, feed_url, resp,
+                                      text_processor)
+                entry = cache.CacheEntry(feed, settings.WEBSUB_MAX_AGE)
+                cache.store_entry(feed_url, text_processor, entry)
+                delta.store_index(feed_url, feed)
+
+    except (ValueError, ParserException) as ex:
+        raise FetchFeedException(ex) from ex
+
+
+def refresh_feed_background(feed_url, text_processor, entry, fields=None):
+    """ Refreshes a stale feed in the cache, to be run in a greenlet """
+
+    try:
+        refresh_feed(feed_url, text_processor, entry, fields)
+
+    except FetchFeedException as ffe:
+        logger.info('Background refresh of %s failed: %s', feed_url, ffe)
+
+    finally:
+        cache.unlock_refresh(feed_url, text_processor, fields)
+
+
+def fetch_feed(feed_url, text_processor, mod_since_utc=None, etag=None,
+               fields=None):
+    """ Fetches and parses a feed
+
+    Returns the parsed feed and its freshness lifetime. Raises NotModified if
+    the feed has not changed since mod_since_utc or etag. Feeds that failed
+    recently, and feeds on hosts that are down, are not fetched; their
+    errors are raised right away (see feedservice.parse.failures). The new
+    locations of feeds that have moved are recorded (see
+    feedservice.parse.redirects). """
+
+    failure = failures.get_failure(feed_url)
+    if failure:
+        exc_cls = UpstreamError if failure.upstream else FetchFeedException
+        raise exc_cls('%s (failed %d times, retrying in %d seconds)' % (
+            failure.error, failure.count, failure.retry_in))
+
+    if not failures.is_host_available(feed_url):
+        raise UpstreamError('Host is down, retrying in at most %d seconds'
+                            % settings.HOST_BREAKER_RESET)
+
+    try:
+        result = _fetch_feed(feed_url, text_processor, mod_since_utc, etag,
+                             fields)
+
+    except UpstreamError as ue:
+        failures.record_failure(feed_url, ue, upstream=True)
+        failures.record_host_failure(feed_url)
+        raise
+
+    except FetchFeedException as ffe:
+        # the host did respond
+        failures.record_failure(feed_url, ffe, upstream=False)
+        failures.record_host_success(feed_url)
+        raise
 
     except NotModified:
-        return None
+        failures.clear_failure(feed_url)
+        failures.record_host_success(feed_url)
+        raise
+
+    failures.clear_failure(feed_url)
+    failures.record_host_success(feed_url)
+
+    feed, max_age = result
+    redirects.record_redirect(feed_url, getattr(feed, 'new_location', None))
+    return result
+
+
+def _fetch_feed(feed_url, text_processor, mod_since_utc, etag, fields):
+
+    parser_cls = get_parser_cls(feed_url)
+
+    try:
+        resp = fetch_url(feed_url, mod_since_utc, etag)
+        max_age = cache.get_max_age(resp.headers)
+
+        if resp.status_code == 304:
+            raise NotModified(max_age)
+
+        if resp.status_code >= 500 or resp.status_code in THROTTLE_STATUS:
+            raise UpstreamError('HTTP Error %d' % resp.status_code)
+
+        with resp.body:
+            feed = parse_response(parser_cls, feed_url, resp, text_processor,
+                                  fields)
+
+        return feed, max_age
 
     except eventlet.timeout.Timeout as te:
-        raise FetchFeedException(f'Timeout: {te}') from te
+        raise UpstreamError(f'Timeout: {te}') from te
+
+    except (requests.exceptions.ConnectionError,
+            requests.exceptions.ChunkedEncodingError,
+            requests.exceptions.Timeout, HostThrottled) as ex:
+        raise UpstreamError(ex) from ex
 
     except (http.client.HTTPException, urllib.error.URLError, urllib.error.HTTPError,
             ValueError, socket.error, ParserException) as ex:
         raise FetchFeedException(ex) from ex
+
+
+def parse_response(parser_cls, feed_url, resp, text_processor, fields=None):
+    """ Parses the feed in the response (see feedservice.utils.fetch_url)
+    """
+
+    start = time.perf_counter()
+
+    # the parser has been selected for the normalized URL
+    parser_url = normalize_url(feed_url)
+    parser = parser_cls(parser_url, resp, text_processor=text_processor)
+    feed = parser.get_feed(fields)
+
+    # clients find the feed by the URL that they have requested
+    urls = getattr(feed, 'urls', None)
+    if parser_url != feed_url and urls is not None and feed_url not in urls:
+        feed.urls = [feed_url] + urls
+
+    metrics.record_parse(parser_cls, time.perf_counter() - start, feed)
+    return feed
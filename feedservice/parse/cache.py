@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Caching of parsed feeds
+
+Parsed feeds are stored in Django's cache together with the time they have
+been fetched and their freshness lifetime, which is derived from the HTTP
+caching headers of the feed. Entries are kept beyond their lifetime so that
+they can be served while they are being revalidated, or when the feed's
+server fails. """
+
+import re
+import time
+import hashlib
+import email.utils
+
+from django.conf import settings
+from django.core.cache import cache
+
+from feedservice.parse.fields import format_fields
+
+
+MAX_AGE_RE = re.compile(r'(?:^|,)\s*(s-maxage|max-age)\s*=\s*"?(\d+)', re.I)
+NO_CACHE_RE = re.compile(r'(?:^|,)\s*(no-cache|no-store)\b', re.I)
+
+
+def get_cache_key(url, text_processor=None, fields=None, prefix='feed'):
+    """ Returns the cache key for the feed parsed with text_processor and
+    the given selection of fields """
+    processor = type(text_processor).__name__ if text_processor else ''
+    variant = '\0'.join((url, processor, format_fields(fields)))
+    digest = hashlib.sha1(variant.encode('utf-8'))
+    return '%s:%s' % (prefix, digest.hexdigest())
+
+
+def get_max_age(headers):
+    """ Returns the freshness lifetime (in seconds) of a response
+
+    The lifetime is taken from the Cache-Control and Expires headers; if
+    neither is present, settings.FEED_CACHE_TTL is used. """
+
+    cache_control = headers.get('cache-control', '')
+
+    if NO_CACHE_RE.search(cache_control):
+        return 0
+
+    max_ages = dict((k.lower(), int(v))
+                    for k, v in MAX_AGE_RE.findall(cache_control))
+    max_age = max_ages.get('s-maxage', max_ages.get('max-age', None))
+
+    if max_age is None and headers.get('expires'):
+        expires = email.utils.parsedate_tz(headers['expires'])
+        date = email.utils.parsedate_tz(headers.get('date', ''))
+        if expires:
+            now = email.utils.mktime_tz(date) if date else time.time()
+            max_age = max(0, int(email.utils.mktime_tz(expires) - now))
+
+    if max_age is None:
+        max_age = settings.FEED_CACHE_TTL
+
+    return min(max_age, settings.FEED_CACHE_MAX_TTL)
+
+
+def is_modified(feed, mod_since_utc=None, etag=None):
+    """ Returns False if the feed has not changed since mod_since_utc
+
+    If an etag is given, the feed is unchanged if it still has this ETag. """
+
+    if etag:
+        return getattr(feed, 'http_etag', None) != etag
+
+    if not mod_since_utc:
+        return True
+
+    last_mod = email.utils.parsedate_tz(
+        getattr(feed, 'http_last_modified', None) or '')
+    mod_since = email.utils.parsedate_tz(mod_since_utc)
+
+    if not (last_mod and mod_since):
+        return True
+
+    return email.utils.mktime_tz(last_mod) > email.utils.mktime_tz(mod_since)
+
+
+class CacheEntry(object):
+    """ A parsed feed and its freshness information """
+
+    def __init__(self, feed, max_age, fetched=None):
+        self.feed = feed
+        self.max_age = max_age
+        self.fetched = time.time() if fetched is None else fetched
+
+    @property
+    def age(self):
+        return time.time() - self.fetched
+
+    def is_fresh(self):
+        return self.age < self.max_age
+
+    def is_stale_servable(self):
+        """ if the feed can be served while being refreshed """
+        stale_window = settings.FEED_CACHE_STALE_WHILE_REVALIDATE
+        return self.age < self.max_age + stale_window
+
+    def is_usable_on_error(self):
+        """ if the feed can be served when refreshing it fails """
+        stale_window = settings.FEED_CACHE_STALE_IF_ERROR
+        return self.age < self.max_age + stale_window
+
+    def revalidated(self, max_age):
+        """ marks the entry as fresh again, eg after a 304 response """
+        self.max_age = max_age
+        self.fetched = time.time()
+
+
+def get_entry(url, text_processor=None, fields=None):
+    """ Returns the CacheEntry for the given feed, or None """
+    return cache.get(get_cache_key(url, text_processor, fields))
+
+
+def store_entry(url, text_processor, entry, fields=None):
+    """ Stores the CacheEntry until it can not be served anymore """
+    timeout = entry.max_age + max(settings.FEED_CACHE_STALE_WHILE_REVALIDATE,
+                                  settings.FEED_CACHE_STALE_IF_ERROR)
+    if timeout <= 0:
+        return
+
+    cache.set(get_cache_key(url, text_processor, fields), entry, timeout)
+
+
+def lock_refresh(url, text_processor=None, fields=None):
+    """ Returns True if the caller should refresh the feed
+
+    Only the first caller within settings.FETCH_TIMEOUT gets True, so that
+    concurrent requests for an expired feed trigger only one refresh. """
+    key = get_cache_key(url, text_processor, fields, prefix='refresh')
+    return cache.add(key, True, settings.FETCH_TIMEOUT)
+
+
+def unlock_refresh(url, text_processor=None, fields=None):
+    cache.delete(get_cache_key(url, text_processor, fields, prefix='refresh'))
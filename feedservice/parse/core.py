@@ -1,3 +1,5 @@
+# status codes of permanent redirects
+PERMANENT_REDIRECTS = (301, 308)
 
 
 class Parser(object):
@@ -14,5 +16,17 @@ class Parser(object):
         return self.resp.headers.get('last-modified')
 
     def get_new_location(self):
-        if self.resp.status_code == 301 and self.url != self.resp.url:
-            return self.resp.url
+        """ Returns the target of the permanent redirects with which the
+        response starts, if any """
+
+        # the URL of each response is the target of the previous redirect
+        responses = getattr(self.resp, 'history', []) + [self.resp]
+        location = None
+
+        for redirect, target in zip(responses, responses[1:]):
+            if redirect.status_code not in PERMANENT_REDIRECTS:
+                break
+            location = target.url
+
+        if location != self.url:
+            return location
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Delta responses for clients that already know a feed's episodes
+
+Each parsed feed carries a cursor that identifies its current list of
+episodes. The episode index behind the cursor -- the key (usually the guid)
+and a fingerprint of each episode -- is stored in the cache. A client that
+sends the cursor of a previous response gets only the episodes that have
+been added or changed since, and the keys of the episodes that have been
+removed. If the cursor is unknown (eg because it has expired), the full feed
+is returned. """
+
+import copy
+import json
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_episode_key(episode):
+    """ Returns the key that identifies an episode across versions of a feed,
+    or None if it has none """
+
+    for name in ('guid', 'link'):
+        key = getattr(episode, name, None)
+        if key:
+            return key
+
+    for f in getattr(episode, 'files', None) or []:
+        if f.urls:
+            return f.urls[0]
+
+    return None
+
+
+def _encode(obj):
+    # nested parsed objects (files) are fingerprinted by their public fields
+    return dict((k, v) for k, v in vars(obj).items() if not k.startswith('_'))
+
+
+def get_fingerprint(episode):
+    """ Returns a digest of the episode's (parsed) fields """
+
+    data = _encode(episode)
+    value = json.dumps(data, sort_keys=True, default=_encode)
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+
+def get_fingerprints(episodes):
+    """ Returns a list of (key, fingerprint) tuples for the episodes """
+
+    fingerprints = []
+    for episode in episodes:
+        fingerprint = get_fingerprint(episode)
+        key = get_episode_key(episode) or fingerprint
+        fingerprints.append((key, fingerprint))
+    return fingerprints
+
+
+def get_cursor(fingerprints):
+    """ Returns the cursor that identifies a list of episodes """
+    value = '\n'.join('%s\0%s' % item for item in fingerprints)
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:20]
+
+
+def _get_index_key(url, cursor):
+    digest = hashlib.sha1(('%s\0%s' % (url, cursor)).encode('utf-8'))
+    return 'cursor:%s' % digest.hexdigest()
+
+
+def store_index(url, feed):
+    """ Stores the episode index of the feed under its cursor """
+
+    if not hasattr(feed, 'cursor'):
+        return
+
+    index = dict(feed._episode_fingerprints)
+    cache.set(_get_index_key(url, feed.cursor), index,
+              settings.FEED_CURSOR_TTL)
+
+
+def get_index(url, cursor):
+    """ Returns the episode index that has been stored for the cursor """
+    return cache.get(_get_index_key(url, cursor))
+
+
+def apply_cursor(url, feed, cursor):
+    """ Returns the feed with only the episodes that changed since cursor
+
+    The returned feed is a copy with delta = True and removed_episodes set,
+    so that cached feeds are not modified. If the cursor is not known, the
+    feed is returned unchanged. """
+
+    if not cursor or not hasattr(feed, 'cursor'):
+        return feed
+
+    fingerprints = feed._episode_fingerprints
+
+    if cursor == feed.cursor:
+        index = dict(fingerprints)
+    else:
+        index = get_index(url, cursor)
+
+    if index is None:
+        return feed
+
+    current = set(key for key, fingerprint in fingerprints)
+
+    delta = copy.copy(feed)
+    delta.episodes = [episode for episode, (key, fingerprint)
+                      in zip(feed.episodes, fingerprints)
+                      if index.get(key) != fingerprint]
+    delta.removed_episodes = [key for key in index if key not in current]
+    delta.delta = True
+    return delta
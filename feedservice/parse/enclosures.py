@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Enrichment of episode files with metadata from the servers hosting them
+
+Many feeds omit the size or the type of their enclosures. If requested,
+each file's URL is requested with HEAD (or, if the server does not support
+it, with a GET of its first byte), which follows the file's redirects and
+reports its size and type. The redirect chain is added to the file's URLs;
+the reported size is used if the file has none, and the reported type if
+the file's type was only guessed from its URL.
+
+The metadata is cached per URL for ENCLOSURE_CACHE_TTL seconds, so that
+repeated requests for a feed cost no requests. Per feed, at most
+ENCLOSURE_ENRICH_BUDGET uncached files are requested, starting with the
+most recent episodes, ENCLOSURE_ENRICH_CONCURRENCY at a time. """
+
+import hashlib
+
+import eventlet
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from feedservice import hostlimits
+from feedservice.parse import mimetype
+from feedservice.utils import get_session
+
+
+# files whose metadata could not be requested are retried after this many
+# seconds
+FAILURE_TTL = 60 * 60
+
+
+class FileInfo(object):
+    """ The metadata of a file as reported by its server """
+
+    def __init__(self, urls, mimetype, filesize):
+        self.urls = urls
+        self.mimetype = mimetype
+        self.filesize = filesize
+
+
+def get_cache_key(url):
+    return 'enclosure:%s' % hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def get_size(resp):
+    """ Returns the size of the file of a HEAD or ranged GET response """
+
+    if resp.status_code == 206:
+        total = resp.headers.get('Content-Range', '').rpartition('/')[2]
+        return int(total) if total.isdigit() else None
+
+    length = resp.headers.get('Content-Length', '')
+    return int(length) if length.isdigit() else None
+
+
+def fetch_file_info(url):
+    """ Requests the metadata of the file at url; returns None on errors """
+
+    session = get_session()
+    resp = None
+
+    try:
+        with eventlet.Timeout(settings.ENCLOSURE_ENRICH_TIMEOUT, False), \
+                hostlimits.limited(url):
+            resp = session.head(url, allow_redirects=True)
+
+            if resp.status_code in (405, 501) or \
+                    'Content-Length' not in resp.headers:
+                resp = session.get(url, headers={'Range': 'bytes=0-0'},
+                                   allow_redirects=True, stream=True)
+                resp.close()
+
+    except (requests.exceptions.RequestException, hostlimits.HostThrottled):
+        return None
+
+    if resp is None or resp.status_code not in (200, 206):
+        return None
+
+    urls = [r.url for r in resp.history] + [resp.url]
+    content_type = resp.headers.get('Content-Type', '').split(';')[0]
+    return FileInfo(urls, content_type.strip() or None, get_size(resp))
+
+
+def get_files(feed):
+    """ Returns the episodes of the feed with each of their files, most
+    recent episodes first """
+    for episode in getattr(feed, 'episodes', None) or []:
+        for f in getattr(episode, 'files', None) or []:
+            if f.urls:
+                yield episode, f
+
+
+def apply_file_info(f, info):
+    # the redirect chain follows the file's own URLs
+    f.urls = f.urls + [url for url in info.urls[1:] if url not in f.urls]
+
+    if f.filesize is None:
+        f.filesize = info.filesize
+
+    guessed = mimetype.get_mimetype(None, f.urls[0])
+    if mimetype.get_type(info.mimetype) and \
+            (not f.mimetype or f.mimetype == guessed):
+        f.mimetype = info.mimetype
+
+
+def update_content_types(feed, episodes):
+    """ Counts the types of the episodes' files again, after their types
+    have been updated
+
+    Delta feeds (see feedservice.parse.delta) keep the content_types of the
+    full feed, as they only contain the changed episodes. """
+
+    for episode in dict((id(e), e) for e in episodes).values():
+        episode.set_files(episode.files)
+
+    if episodes and hasattr(feed, 'content_types') and \
+            not getattr(feed, 'delta', False):
+        feed.content_types = feed.get_content_types()
+
+
+def enrich_feed(feed):
+    """ Enriches the files of the parsed feed with their metadata """
+
+    files = list(get_files(feed))
+    urls = list(dict.fromkeys(f.urls[0] for episode, f in files))
+    keys = dict((url, get_cache_key(url)) for url in urls)
+
+    cached = cache.get_many(list(keys.values()))
+    infos = dict((url, cached[keys[url]]) for url in urls
+                 if keys[url] in cached)
+
+    missing = [url for url in urls if url not in infos]
+    budget = settings.ENCLOSURE_ENRICH_BUDGET
+    fetch, skipped = missing[:budget], missing[budget:]
+
+    pool = eventlet.GreenPool(settings.ENCLOSURE_ENRICH_CONCURRENCY)
+    for url, info in zip(fetch, pool.imap(fetch_file_info, fetch)):
+        # failures are stored as False, and retried sooner
+        timeout = settings.ENCLOSURE_CACHE_TTL if info else FAILURE_TTL
+        cache.set(keys[url], info or False, timeout)
+        infos[url] = info
+
+    enriched = []
+    for episode, f in files:
+        info = infos.get(f.urls[0])
+        if info:
+            apply_file_info(f, info)
+            enriched.append(episode)
+
+    update_content_types(feed, enriched)
+
+    if skipped:
+        feed.add_warning('enrich-files', 'the metadata of %d files has not '
+                         'been requested yet' % len(skipped))
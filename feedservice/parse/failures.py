@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Negative caching of failing feeds and circuit breaking of failing hosts
+
+A feed that could not be fetched or parsed is not fetched again for a while;
+requests for it fail right away with the cached error. The interval doubles
+with every consecutive failure, from FEED_FAILURE_BACKOFF up to
+FEED_FAILURE_BACKOFF_MAX seconds.
+
+Hosts that time out or respond with server errors HOST_BREAKER_THRESHOLD
+times in a row are considered down (the breaker is open): no feeds are
+fetched from them for HOST_BREAKER_RESET seconds. After that, a single
+request is let through as a probe (half-open); if it succeeds, the breaker
+closes, otherwise it stays open for another HOST_BREAKER_RESET seconds.
+
+The state is kept in the cache, so that it is shared by all workers that use
+the same cache. Concurrent updates can lose a failure, which only delays
+backing off. """
+
+import time
+import hashlib
+import urllib.parse
+
+from django.conf import settings
+from django.core.cache import cache
+
+from feedservice import metrics
+
+
+# the consecutive failures of a host are forgotten after this many seconds
+# without failures
+HOST_STATE_TTL = 24 * 60 * 60
+
+
+class Failure(object):
+    """ The last error of a feed, and when it may be fetched again """
+
+    def __init__(self, error, upstream, count=1):
+        self.error = error
+        self.upstream = upstream
+        self.count = count
+        self.failed = time.time()
+        self.backoff = min(settings.FEED_FAILURE_BACKOFF * 2 ** (count - 1),
+                           settings.FEED_FAILURE_BACKOFF_MAX)
+
+    @property
+    def retry_in(self):
+        """ seconds until the feed may be fetched again """
+        return max(0, self.failed + self.backoff - time.time())
+
+
+class HostState(object):
+    """ The consecutive failures of a host, and when its breaker opened """
+
+    def __init__(self):
+        self.failures = 0
+        self.opened = None
+
+
+def get_failure_key(url):
+    return 'failure:%s' % hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def get_host(url):
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+def get_host_key(host, prefix='breaker'):
+    return '%s:%s' % (prefix, hashlib.sha1(host.encode('utf-8')).hexdigest())
+
+
+def get_failure(url):
+    """ Returns the Failure of a feed that should not be fetched yet, or None
+    """
+
+    if settings.FEED_FAILURE_BACKOFF <= 0:
+        return None
+
+    failure = cache.get(get_failure_key(url))
+    if failure is None or failure.retry_in <= 0:
+        return None
+
+    metrics.record_fetch_rejected(url, 'failing-feed')
+    return failure
+
+
+def record_failure(url, error, upstream):
+    """ Stores the error of a feed; upstream errors are timeouts, connection
+    errors and server errors """
+
+    if settings.FEED_FAILURE_BACKOFF <= 0:
+        return
+
+    key = get_failure_key(url)
+    previous = cache.get(key)
+    count = previous.count + 1 if previous else 1
+    failure = Failure(str(error), upstream, count)
+
+    # the failure count is kept beyond the backoff, so that a feed that keeps
+    # failing backs off further
+    cache.set(key, failure, failure.backoff * 2)
+
+
+def clear_failure(url):
+    cache.delete(get_failure_key(url))
+
+
+def is_host_available(url):
+    """ Returns False if the breaker of the URL's host is open
+
+    While the breaker is half-open, True is returned to only one caller,
+    whose fetch is the probe. """
+
+    if settings.HOST_BREAKER_THRESHOLD <= 0:
+        return True
+
+    host = get_host(url)
+    state = cache.get(get_host_key(host))
+
+    if state is None or state.opened is None:
+        return True
+
+    if time.time() - state.opened < settings.HOST_BREAKER_RESET:
+        metrics.record_fetch_rejected(url, 'host-down')
+        return False
+
+    # half-open: let one probe through, and reject the others
+    probe_key = get_host_key(host, prefix='breaker-probe')
+    if cache.add(probe_key, True, settings.FETCH_TIMEOUT):
+        metrics.record_breaker(url, 'half-open')
+        return True
+
+    metrics.record_fetch_rejected(url, 'host-down')
+    return False
+
+
+def record_host_failure(url):
+    if settings.HOST_BREAKER_THRESHOLD <= 0:
+        return
+
+    host = get_host(url)
+    key = get_host_key(host)
+    state = cache.get(key) or HostState()
+    state.failures += 1
+
+    if state.opened is not None or \
+            state.failures >= settings.HOST_BREAKER_THRESHOLD:
+        # opens the breaker, or keeps it open after a failed probe
+        if state.opened is None:
+            metrics.record_breaker(url, 'open')
+        state.opened = time.time()
+        cache.delete(get_host_key(host, prefix='breaker-probe'))
+
+    cache.set(key, state, HOST_STATE_TTL)
+
+
+def record_host_success(url):
+    if settings.HOST_BREAKER_THRESHOLD <= 0:
+        return
+
+    host = get_host(url)
+    key = get_host_key(host)
+    state = cache.get(key)
+
+    if state is None:
+        return
+
+    if state.opened is not None:
+        metrics.record_breaker(url, 'closed')
+        cache.delete(get_host_key(host, prefix='breaker-probe'))
+
+    cache.delete(key)
@@ -3,39 +3,67 @@
 
 import time
 from xml.sax import SAXException
-import requests
 
 import feedparser
+from django.conf import settings
 
 from feedservice.parse.models import Feed, Episode, File
-from feedservice.utils import parse_time, url_fix
+from feedservice.utils import parse_duration, parse_date, utc_timestamp, \
+    url_fix
 from feedservice.parse.mimetype import get_mimetype
 from feedservice.parse import mimetype
 from feedservice.parse.core import Parser
+from feedservice.parse.fields import wants, get_nested, get_parse_fields
 from feedservice.parse.models import ParserException
-
-DEFAULT_TIMEOUT=10
+from feedservice import timing
 
 
 class FeedparserError(ParserException):
     pass
 
 
+def parse_date_fast(value):
+    """ Date handler for feedparser (see FEEDPARSER_FAST_DATES)
+
+    Returns the date as a UTC time tuple, or None for formats that
+    feedparser's own handlers have to parse. """
+    timestamp = parse_date(value)
+    if timestamp is None:
+        return None
+
+    try:
+        return time.gmtime(timestamp)
+    except (OverflowError, OSError, ValueError):
+        # outside of the range of the platform's time functions
+        return None
+
+
+if settings.FEEDPARSER_FAST_DATES:
+    # handlers that are registered later are tried first
+    feedparser.registerDateHandler(parse_date_fast)
+
+
 class Feedparser(Parser):
     """ A parsed Feed """
 
     def __init__(self, url, resp, text_processor=None):
+        """ Parses the body of resp (see feedservice.utils.fetch_url) """
         super(Feedparser, self).__init__(url, resp)
         self.url = url
 
-        headers = {
-            'Accept': 'application/rss+xml,application/xml;q=0.9,*/*;q=0.8'
-        }
+        # the charset of the Content-Type header overrides the document's;
+        # without one, feedparser would decode text/* types as ASCII
+        headers = {}
+        if getattr(resp, 'declared_encoding', None):
+            headers['content-type'] = resp.headers.get('Content-Type', '')
 
         try:
-            stream = requests.get(self.url, headers=headers,
-                                  timeout=DEFAULT_TIMEOUT)
-            self.feed = feedparser.parse(stream.content)
+            # subclasses might have read the body already
+            resp.body.seek(0)
+
+            with timing.timed('parse'):
+                self.feed = feedparser.parse(resp.body,
+                                             response_headers=headers)
 
         except UnicodeEncodeError as e:
             raise FeedparserError(e)
@@ -48,9 +76,6 @@ class Feedparser(Parser):
             raise FeedparserError('malformed feed, or no feed at all: %s' %
                                   (str(saxe)))
 
-        except requests.exceptions.RequestException as re:
-            raise FeedparserError('Error fetching feed') from re
-
         self.text_processor = text_processor
 
     @classmethod
@@ -58,27 +83,44 @@ class Feedparser(Parser):
         """ Generic class that can handle every RSS/Atom feed """
         return True
 
-    def get_feed(self):
+    def get_feed(self, fields=None):
+        """ Returns the parsed feed
+
+        If fields is given, only the selected fields are parsed (see
+        feedservice.parse.fields); urls, new_location and the HTTP
+        validators are always parsed. """
+
+        fields = get_parse_fields(fields)
+        self.episode_fields = get_nested(fields, 'episodes')
+
         feed = Feed(text_processor=self.text_processor)
-        feed.title = self.get_title()
-        feed.link = self.get_link()
-        feed.description = self.get_description()
-        feed.subtitle = self.get_subtitle()
-        feed.author = self.get_author()
-        feed.language = self.get_language()
         feed.urls = self.get_urls()
         feed.new_location = self.get_new_location()
-        feed.logo = self.get_logo_url()
-        feed.tags = self.get_feed_tags()
-        feed.hub = self.get_hub_url()
         feed.http_last_modified = self.get_last_modified()
         feed.http_etag = self.get_etag()
-        feed.flattr = self.get_flattr()
-        feed.license = self.get_license()
+
+        for name, getter in (
+                ('title',       self.get_title),
+                ('link',        self.get_link),
+                ('description', self.get_description),
+                ('subtitle',    self.get_subtitle),
+                ('author',      self.get_author),
+                ('language',    self.get_language),
+                ('logo',        self.get_logo_url),
+                ('tags',        self.get_feed_tags),
+                ('hub',         self.get_hub_url),
+                ('flattr',      self.get_flattr),
+                ('license',     self.get_license),
+            ):
+            if wants(fields, name):
+                setattr(feed, name, getter())
 
         #feed.logo_data = self.get_logo_inline()
 
-        feed.set_episodes(self.get_episodes())
+        if wants(fields, 'episodes'):
+            with timing.timed('episodes'):
+                episodes = self.get_episodes()
+            feed.set_episodes(episodes, fields)
 
         return feed
 
@@ -152,7 +194,7 @@ class Feedparser(Parser):
     def get_episodes(self):
         parser = [FeedparserEpisodeParser(e, self.text_processor) for e in
                   self.feed.entries]
-        return [p.get_episode() for p in parser]
+        return [p.get_episode(self.episode_fields) for p in parser]
 
 
 class FeedparserEpisodeParser(object):
@@ -162,21 +204,36 @@ class FeedparserEpisodeParser(object):
         self.entry = entry
         self.text_processor = text_processor
 
-    def get_episode(self):
+    def get_episode(self, fields=None):
+        """ Returns the parsed episode, with only the selected fields """
+
         episode = Episode(self.text_processor)
-        episode.guid = self.get_guid()
-        episode.title = self.get_title()
-        episode.description = self.get_description()
-        episode.subtitle = self.get_subtitle()
-        episode.content = self.get_content()
-        episode.link = self.get_link()
-        episode.author = self.get_author()
-        episode.duration = self.get_duration()
-        episode.language = self.get_language()
-        episode.set_files(list(self.get_files()))
-        episode.released = self.get_timestamp()
-        episode.flattr = self.get_flattr()
-        episode.license = self.get_license()
+
+        for name, getter in (
+                ('guid',        self.get_guid),
+                ('title',       self.get_title),
+                ('description', self.get_description),
+                ('subtitle',    self.get_subtitle),
+                ('content',     self.get_content),
+                ('link',        self.get_link),
+                ('author',      self.get_author),
+                ('duration',    self.get_duration),
+                ('language',    self.get_language),
+            ):
+            if wants(fields, name):
+                setattr(episode, name, getter())
+
+        if wants(fields, 'files') or wants(fields, 'content_types'):
+            episode.set_files(list(self.get_files()))
+
+        for name, getter in (
+                ('released',    self.get_timestamp),
+                ('flattr',      self.get_flattr),
+                ('license',     self.get_license),
+            ):
+            if wants(fields, name):
+                setattr(episode, name, getter())
+
         return episode
 
     def get_guid(self):
@@ -192,6 +249,10 @@ class FeedparserEpisodeParser(object):
         return self.entry.get('author', self.entry.get('itunes_author', None))
 
     def list_files(self):
+        """ Yields the (urls, mimetype, filesize) of the entry's files
+
+        The redirect chains of the files are only requested if the files are
+        enriched (see feedservice.parse.enclosures). """
         for enclosure in getattr(self.entry, 'enclosures', []):
             if not 'href' in enclosure:
                 continue
@@ -204,7 +265,6 @@ class FeedparserEpisodeParser(object):
             except (TypeError, ValueError):
                 filesize = None
 
-            #TODO: optional: urls = tils.get_redirect_chain(enclosure['href'])
             urls = [enclosure['href']]
             yield (urls, mimetype, filesize)
 
@@ -220,7 +280,6 @@ class FeedparserEpisodeParser(object):
             except (TypeError, ValueError):
                 filesize = None
 
-            #TODO: optional: urls = utils.get_redirect_chain(media['url'])
             urls = [media['url']]
             yield urls, mimetype, filesize
 
@@ -236,11 +295,7 @@ class FeedparserEpisodeParser(object):
                 return content.value
 
     def get_duration(self):
-        str = self.entry.get('itunes_duration', '')
-        try:
-            return parse_time(str)
-        except ValueError:
-            return None
+        return parse_duration(self.entry.get('itunes_duration', ''))
 
     def get_language(self):
         return self.entry.get('language', None)
@@ -250,7 +305,7 @@ class FeedparserEpisodeParser(object):
             return None
 
         try:
-            value = int(time.mktime(self.entry.published_parsed))
+            value = utc_timestamp(self.entry.published_parsed)
 
         except (ValueError, OverflowError):
             # dates before 1970 cause OverflowError
@@ -266,16 +321,20 @@ class FeedparserEpisodeParser(object):
         """Get the download / episode URL of a feedparser entry"""
 
         files = []
+        seen = set()
 
         for urls, mtype, filesize in self.list_files():
 
             # skip if we've seen this list of URLs already
-            if urls in [f.urls for f in files]:
+            key = tuple(urls)
+            if key in seen:
                 break
 
             if not mimetype.get_type(mtype):
                 continue
 
+            seen.add(key)
+
             f = File(urls, mtype, filesize)
             files.append(f)
 
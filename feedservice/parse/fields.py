@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Selection of the fields that are parsed and returned
+
+A field selection is given as a comma-separated list of field names, where
+the fields of nested objects can be selected in parentheses, eg
+
+    title,logo,episodes(guid,title,files(urls))
+
+It is represented as a dict that maps field names to the selection of their
+nested fields. None stands for all fields, both for the whole selection and
+for the nested fields of a selected field. """
+
+import re
+
+
+FIELD_RE = re.compile(r'\s*([a-z_]+)\s*', re.I)
+
+# feed fields that are always returned, so that clients can match feeds to
+# their requests, learn about errors and recognize deltas; the cursor is only
+# computed if it is selected (see Feed.set_episodes)
+FEED_FIELDS_ALWAYS = ('urls', 'errors', 'warnings', 'not_modified', 'delta',
+                      'removed_episodes')
+
+
+def parse_fields(spec):
+    """ Parses a field selection; returns None if spec is empty
+
+    >>> parse_fields('title, episodes(guid,files(urls))')
+    {'title': None, 'episodes': {'guid': None, 'files': {'urls': None}}}
+    """
+
+    if not spec or not spec.strip():
+        return None
+
+    fields, pos = _parse_list(spec, 0)
+    if pos != len(spec):
+        raise ValueError('unexpected %r at position %d in fields' %
+                         (spec[pos], pos))
+
+    return fields
+
+
+def parse_feed_fields(spec):
+    """ Parses a selection of feed fields, see FEED_FIELDS_ALWAYS """
+
+    fields = parse_fields(spec)
+    if fields is None:
+        return None
+
+    for name in FEED_FIELDS_ALWAYS:
+        fields.setdefault(name, None)
+
+    return fields
+
+
+def _parse_list(spec, pos):
+    fields = {}
+
+    while True:
+        m = FIELD_RE.match(spec, pos)
+        if not m:
+            raise ValueError('field name expected at position %d' % pos)
+
+        name, pos = m.group(1), m.end()
+        nested = None
+
+        if spec.startswith('(', pos):
+            nested, pos = _parse_list(spec, pos + 1)
+            if not spec.startswith(')', pos):
+                raise ValueError('missing ) at position %d' % pos)
+            pos += 1
+            while spec.startswith(' ', pos):
+                pos += 1
+
+        fields[name] = nested
+
+        if not spec.startswith(',', pos):
+            return fields, pos
+
+        pos += 1
+
+
+def format_fields(fields):
+    """ Returns a canonical string representation of the selection """
+
+    if fields is None:
+        return ''
+
+    parts = []
+    for name in sorted(fields):
+        nested = fields[name]
+        if nested is None:
+            parts.append(name)
+        else:
+            parts.append('%s(%s)' % (name, format_fields(nested)))
+
+    return ','.join(parts)
+
+
+def wants(fields, name):
+    """ Returns True if the field is selected """
+    return fields is None or name in fields
+
+
+def get_nested(fields, name):
+    """ Returns the selection of the nested fields of the given field """
+    return None if fields is None else fields.get(name)
+
+
+def get_parse_fields(fields):
+    """ Returns the fields that have to be parsed to return fields
+
+    Some fields are computed from others, eg an episode's number and
+    short_title from its title and the feed's common_title, and the feed's
+    content_types from the files of its episodes. """
+
+    if fields is None:
+        return None
+
+    fields = dict(fields)
+
+    if 'episodes' not in fields and 'content_types' not in fields:
+        return fields
+
+    episodes = fields.get('episodes', {})
+
+    if episodes is not None:
+        episodes = dict(episodes)
+
+        if 'content_types' in fields:
+            episodes.setdefault('files', None)
+
+        if 'number' in episodes or 'short_title' in episodes:
+            episodes.setdefault('title', None)
+            fields.setdefault('common_title', None)
+
+    else:
+        fields.setdefault('common_title', None)
+
+    fields['episodes'] = episodes
+    return fields
@@ -86,7 +86,7 @@ class FM4OnDemandPlaylistParser(Feedparser):
         self.category = self.get_category(feed_url)
         # TODO: Use proper caching of contents with support for
         #       conditional GETs (If-Modified-Since, ETag, ...)
-        self.data = minidom.parseString(resp.text)
+        self.data = minidom.parse(resp.body)
         self.playlist = self.data.getElementsByTagName('playlist')[0]
 
         super(FM4OnDemandPlaylistParser, self).__init__(
@@ -117,7 +117,7 @@ class FM4OnDemandPlaylistParser(Feedparser):
         tracks = self.playlist.getElementsByTagName('track')
         parsers = [FM4EpisodeParser(t, text_processor=self.text_processor)
                    for t in tracks]
-        episodes = [p.get_episode() for p in parsers]
+        episodes = [p.get_episode(self.episode_fields) for p in parsers]
         return episodes
 
 
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from feedservice.parse.prefetch import Prefetcher
+
+
+class Command(BaseCommand):
+    """ Refreshes the most popular feeds in the cache
+
+    The cache has to be shared with the web workers for this to have any
+    effect, ie CACHE_BACKEND has to be shm or memcached. """
+
+    help = 'Refreshes the most popular feeds in the cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feeds', type=int,
+                            default=settings.PREFETCH_FEEDS,
+                            help='Number of popular feeds to refresh')
+        parser.add_argument('--concurrency', type=int,
+                            default=settings.PREFETCH_CONCURRENCY,
+                            help='Maximum number of concurrent fetches')
+        parser.add_argument('--host-delay', type=float,
+                            default=settings.PREFETCH_HOST_DELAY,
+                            help='Minimum seconds between fetches per host')
+        parser.add_argument('--jitter', type=float,
+                            default=settings.PREFETCH_JITTER,
+                            help='Relative random variation of intervals')
+        parser.add_argument('--once', action='store_true',
+                            help='Refresh all popular feeds once and exit')
+
+    def handle(self, *args, **options):
+        prefetcher = Prefetcher(
+            max_feeds=options['feeds'],
+            concurrency=options['concurrency'],
+            host_delay=options['host_delay'],
+            jitter=options['jitter'],
+            min_interval=settings.PREFETCH_MIN_INTERVAL,
+            max_interval=settings.PREFETCH_MAX_INTERVAL,
+        )
+
+        prefetcher.update_feeds()
+
+        if options['once']:
+            prefetcher.refresh_all()
+        else:
+            prefetcher.run()
@@ -1,4 +1,5 @@
 import mimetypes
+import functools
 from collections import Counter
 
 # If 20% of the episodes of a podcast are of a given type,
@@ -14,9 +15,18 @@ def get_podcast_types(episode_mimetypes):
     A podcast is considered to be of a given types if the ratio of episodes
     that are of that type equals TYPE_THRESHOLD """
 
-    episode_types = list(map(get_type, episode_mimetypes))
-    episode_types = [_f for _f in episode_types if _f]
-    episode_types = Counter(episode_types)
+    return get_types_by_count(count_types(episode_mimetypes))
+
+
+def count_types(episode_mimetypes):
+    """ Returns a Counter of the simplified types of the mimetypes """
+    return Counter(_f for _f in map(get_type, episode_mimetypes) if _f)
+
+
+def get_types_by_count(episode_types):
+    """ Returns the types of a podcast from the counts of its types
+
+    See get_podcast_types and count_types """
 
     max_episodes = sum(episode_types.values())
     l = list(episode_types.items())
@@ -26,6 +36,7 @@ def get_podcast_types(episode_mimetypes):
     return [x[0] for x in types]
 
 
+@functools.lru_cache(maxsize=256)
 def get_type(mimetype):
     """ Returns the simplified type for the given mimetype
 
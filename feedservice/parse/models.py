@@ -3,10 +3,21 @@
 
 import re
 import logging
+from collections import Counter
 
-from feedservice.utils import flatten, longest_substr, get_data_uri, \
+from feedservice.utils import longest_substr, get_data_uri, \
     fetch_url, transform_image
-from feedservice.parse import mimetype
+from feedservice.parse import mimetype, delta
+from feedservice.parse.fields import wants
+from feedservice import timing
+
+
+# the first number of a title
+NUMBER_RE = re.compile(r'^\W*(\d+)')
+# the number and the punctuation at the start of a title
+NUMBER_PREFIX_RE = re.compile(r'^[\W\d]+')
+# the part of a title before its first digit
+NON_DIGITS_RE = re.compile(r'^\D*')
 
 
 class ParserException(Exception):
@@ -15,8 +26,10 @@ class ParserException(Exception):
 
 class ParsedObject(object):
 
+    # short_title is derived from the (already processed) title
     _UNPROCESSED_FIELDS = ['link', 'urls', 'new_location', 'logo', 'hubs',
-                           'http_etag', 'flattr', 'license']
+                           'http_etag', 'flattr', 'license', 'cursor',
+                           'short_title']
 
     def __init__(self, text_processor=None):
         super(ParsedObject, self).__init__()
@@ -26,7 +39,8 @@ class ParsedObject(object):
         if isinstance(value, str):
             if getattr(self, '_text_processor', None):
                 if not name in self._UNPROCESSED_FIELDS:
-                    value = self._text_processor.process(value)
+                    with timing.timed('text'):
+                        value = self._text_processor.process(value)
 
         object.__setattr__(self, name, value)
 
@@ -47,18 +61,35 @@ class Feed(ParsedObject):
         """ Adds a warning entry to the feed """
         self.warnings[key] = msg
 
-    def set_episodes(self, episodes):
+    def set_episodes(self, episodes, fields=None):
+        """ Sets the episodes and computes the fields derived from them
+
+        Only the derived fields that are selected in fields are computed,
+        including the cursor (see feedservice.parse.delta), whose episode
+        fingerprints are expensive for large feeds """
         self.episodes = episodes
 
-        self.content_types = self.get_content_types()
-        self.common_title = self.get_common_title()
+        if wants(fields, 'content_types'):
+            self.content_types = self.get_content_types()
 
-        for episode in self.episodes:
-            episode._common_title = self.common_title
+        if wants(fields, 'common_title'):
+            with timing.timed('common-title'):
+                self.common_title = self.get_common_title()
+
+                for episode in self.episodes:
+                    episode.set_common_title(self.common_title)
+
+        # identifies this list of episodes for delta responses
+        if wants(fields, 'cursor'):
+            with timing.timed('fingerprint'):
+                self._episode_fingerprints = \
+                    delta.get_fingerprints(self.episodes)
+            self.cursor = delta.get_cursor(self._episode_fingerprints)
 
     def get_common_title(self):
         # We take all non-empty titles
-        titles = [_f for _f in (e.title for e in self.episodes) if _f]
+        titles = [_f for _f in (getattr(e, 'title', None)
+                                for e in self.episodes) if _f]
 
         # get the longest common substring
         common_title = longest_substr(titles)
@@ -66,7 +97,7 @@ class Feed(ParsedObject):
         # but consider only the part up to the first number. Otherwise we risk
         # removing part of the number (eg if a feed contains episodes 100 -
         # 199)
-        common_title = re.search(r'^\D*', common_title).group(0)
+        common_title = NON_DIGITS_RE.match(common_title).group(0)
 
         if len(common_title.strip()) < 2:
             return None
@@ -74,9 +105,11 @@ class Feed(ParsedObject):
         return common_title
 
     def get_content_types(self):
-        files = flatten(episode.files for episode in self.episodes)
-        types = [_f for _f in (f.mimetype for f in files) if _f]
-        return mimetype.get_podcast_types(types)
+        # the types of the episodes' files have been counted by set_files
+        type_counts = Counter()
+        for episode in self.episodes:
+            type_counts.update(episode._type_counts)
+        return mimetype.get_types_by_count(type_counts)
 
     def get_logo_inline(self):
         """ Fetches the feed's logo and returns its data URI """
@@ -117,44 +150,39 @@ class Feed(ParsedObject):
 class Episode(ParsedObject):
     """ A parsed Episode """
 
+    # derived from the title by set_common_title
+    number = None
+    short_title = None
+
+    _type_counts = ()
+
     def __init__(self, text_processor=None):
         super(Episode, self).__init__(text_processor)
 
-    @property
-    def number(self):
-        """ Returns the first number in the non-repeating part of the title """
+    def set_common_title(self, common_title):
+        """ Sets the fields derived from the title and the feed's common title
 
-        if None in (self.title, self._common_title):
-            return None
+        number is the first number in the non-repeating part of the title,
+        and short_title that part without the number. """
 
-        title = self.title.replace(self._common_title, '').strip()
-        match = re.search(r'^\W*(\d+)', title)
-        if not match:
-            return None
+        title = getattr(self, 'title', None)
+
+        if None in (title, common_title):
+            self.number = self.short_title = None
+            return
 
-        return int(match.group(1))
+        title = title.replace(common_title, '').strip()
+        match = NUMBER_RE.match(title)
+        self.number = int(match.group(1)) if match else None
+        self.short_title = NUMBER_PREFIX_RE.sub('', title)
 
     def set_files(self, files):
         self.files = files
-        self.content_types = self.get_content_types()
-
-    @property
-    def short_title(self):
-        """
-        Returns the non-repeating part of the episode's title
-        If an episode number is found, it is removed
-        """
-
-        if None in (self.title, self._common_title):
-            return None
-
-        title = self.title.replace(self._common_title, '').strip()
-        title = re.sub(r'^[\W\d]+', '', title)
-        return title
+        self._type_counts = mimetype.count_types(f.mimetype for f in files)
+        self.content_types = mimetype.get_types_by_count(self._type_counts)
 
     def get_content_types(self):
-        types = [_f for _f in (f.mimetype for f in self.files) if _f]
-        return mimetype.get_podcast_types(types)
+        return mimetype.get_podcast_types(f.mimetype for f in self.files)
 
 
 class File(ParsedObject):
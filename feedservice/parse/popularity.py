@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Tracking of frequently requested feeds
+
+Every worker counts the requests for each feed and periodically merges its
+counts into decaying scores that are stored in the cache, where they are
+picked up by the prefetcher. Concurrent merges of different workers can lose
+some counts, which is acceptable for ranking feeds by popularity.
+
+Requests are counted per feed and text processor; requests with a field
+selection count for the full feed, which is what the prefetcher refreshes.
+"""
+
+import time
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+CACHE_KEY = 'popular-feeds'
+
+# scores halve in this many seconds if a feed is not requested anymore
+HALF_LIFE = 6 * 60 * 60
+
+# interval in which each worker merges its counts into the cache
+FLUSH_INTERVAL = 10
+
+_counts = Counter()
+_last_flush = time.time()
+_lock = threading.Lock()
+
+
+def record_request(url, text_processor=None):
+    """ Counts a request for the feed """
+    global _last_flush
+
+    processor = type(text_processor).__name__ if text_processor else None
+
+    with _lock:
+        _counts[(url, processor)] += 1
+
+        if time.time() - _last_flush < FLUSH_INTERVAL:
+            return
+
+        counts = _counts.copy()
+        _counts.clear()
+        _last_flush = time.time()
+
+    flush(counts)
+
+
+def flush(counts):
+    """ Merges the given counts into the stored scores """
+
+    now = time.time()
+    stats = cache.get(CACHE_KEY) or {'updated': now, 'scores': {}}
+
+    decay = 0.5 ** ((now - stats['updated']) / HALF_LIFE)
+    scores = Counter({key: score * decay
+                      for key, score in stats['scores'].items()})
+    scores.update(counts)
+
+    # keep the number of tracked feeds bounded
+    scores = dict(scores.most_common(settings.POPULAR_FEEDS_MAX))
+
+    cache.set(CACHE_KEY, {'updated': now, 'scores': scores}, None)
+
+
+def get_popular_feeds(limit):
+    """ Returns the (url, text processor name) of the most popular feeds """
+
+    stats = cache.get(CACHE_KEY) or {'scores': {}}
+    scores = Counter(stats['scores'])
+    return [key for key, score in scores.most_common(limit)]
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Proactive refreshing of popular feeds
+
+The prefetcher periodically picks the most popular feeds (see
+feedservice.parse.popularity) and refreshes them in the cache, so that
+clients are served from the cache instead of waiting for the feed's server.
+Each feed is refreshed in an interval that is derived from its caching
+headers and how often it publishes new episodes. Feeds that are published
+through a hub are subscribed to, if enabled (see feedservice.parse.websub).
+
+Only the full feeds are refreshed, for each text processor; the cached
+versions of requests with a field selection (see feedservice.parse.fields)
+are not, as popularity is not tracked per selection.
+"""
+
+import time
+import random
+import logging
+import statistics
+import urllib.parse
+
+import eventlet
+
+from feedservice.parse import cache, refresh_feed, websub, \
+    FetchFeedException
+from feedservice.parse.popularity import get_popular_feeds
+from feedservice.parse.text import TEXT_PROCESSORS
+
+
+logger = logging.getLogger(__name__)
+
+# a feed is refreshed this many times per interval between its episodes
+CADENCE_DIVISOR = 10
+
+# refreshes without changes double the interval, up to this many times
+MAX_BACKOFF_STEPS = 4
+
+# number of most recent episodes considered for the update cadence
+CADENCE_EPISODES = 20
+
+# feeds are refreshed when this fraction of their cached version's freshness
+# lifetime has passed, so that they are refreshed before it expires
+REFRESH_FRACTION = 0.9
+
+
+def get_update_cadence(feed):
+    """ Returns the median interval (in seconds) between recent episodes """
+
+    released = (getattr(e, 'released', None) for e in
+                getattr(feed, 'episodes', []))
+    released = sorted(filter(None, released), reverse=True)
+    released = released[:CADENCE_EPISODES]
+
+    gaps = [a - b for a, b in zip(released, released[1:]) if a > b]
+    if not gaps:
+        return None
+
+    return statistics.median(gaps)
+
+
+def get_episode_guids(feed):
+    return set(getattr(e, 'guid', None) for e in getattr(feed, 'episodes', []))
+
+
+class ScheduledFeed(object):
+    """ A feed that is refreshed by the prefetcher """
+
+    def __init__(self, url, processor=None):
+        self.url = url
+        self.processor = processor
+        self.host = urllib.parse.urlsplit(url).netloc.lower()
+        self.next_fetch = 0
+        self.unchanged = 0
+
+    @property
+    def text_processor(self):
+        cls = TEXT_PROCESSORS.get(self.processor)
+        return cls() if cls else None
+
+
+class Prefetcher(object):
+    """ Refreshes the most popular feeds in the cache """
+
+    def __init__(self, max_feeds, concurrency, host_delay, jitter,
+                 min_interval, max_interval):
+        self.max_feeds = max_feeds
+        self.host_delay = host_delay
+        self.jitter = jitter
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        self.pool = eventlet.GreenPool(concurrency)
+        self.feeds = {}
+        self.busy_hosts = set()
+        self.host_last_fetch = {}
+
+    def update_feeds(self):
+        """ Schedules the currently most popular feeds """
+
+        popular = get_popular_feeds(self.max_feeds)
+
+        for key in popular:
+            if key not in self.feeds:
+                self.feeds[key] = ScheduledFeed(*key)
+
+        for key in set(self.feeds) - set(popular):
+            del self.feeds[key]
+
+    def get_due_feeds(self, now):
+        """ Yields the feeds that should be refreshed now
+
+        Feeds on hosts that are currently being fetched from, or that have
+        been fetched from less than host_delay seconds ago, are skipped. """
+
+        due = [f for f in self.feeds.values() if f.next_fetch <= now]
+        due.sort(key=lambda f: f.next_fetch)
+
+        for feed in due:
+            if feed.host in self.busy_hosts:
+                continue
+
+            if now - self.host_last_fetch.get(feed.host, 0) < self.host_delay:
+                continue
+
+            yield feed
+
+    def run_once(self):
+        """ Starts refreshing all due feeds, as far as the pool permits """
+
+        now = time.time()
+
+        for feed in self.get_due_feeds(now):
+            if not self.pool.free():
+                break
+
+            self.busy_hosts.add(feed.host)
+            self.host_last_fetch[feed.host] = now
+            feed.next_fetch = float('inf')
+            self.pool.spawn_n(self.refresh, feed)
+
+    def refresh_all(self):
+        """ Refreshes every scheduled feed once """
+
+        while self.pool.running() or any(f.next_fetch == 0 for f in
+                                         self.feeds.values()):
+            self.run_once()
+            eventlet.sleep(0.1)
+
+    def run(self, update_interval=60):
+        last_update = 0
+
+        while True:
+            if time.time() - last_update >= update_interval:
+                self.update_feeds()
+                last_update = time.time()
+
+            self.run_once()
+            eventlet.sleep(1)
+
+    def refresh(self, feed):
+        """ Refreshes the feed in the cache and schedules its next refresh """
+
+        text_processor = feed.text_processor
+        entry = cache.get_entry(feed.url, text_processor)
+
+        try:
+            if not cache.lock_refresh(feed.url, text_processor):
+                # some request is refreshing the feed right now
+                return
+
+            try:
+                new_entry = refresh_feed(feed.url, text_processor, entry)
+            finally:
+                cache.unlock_refresh(feed.url, text_processor)
+
+            if entry and (new_entry is entry or get_episode_guids(
+                    new_entry.feed) == get_episode_guids(entry.feed)):
+                feed.unchanged += 1
+            else:
+                feed.unchanged = 0
+
+            entry = new_entry
+            logger.debug('Prefetched %s', feed.url)
+
+            try:
+                websub.ensure_subscribed(feed.url, entry.feed, text_processor)
+            except websub.SubscriptionError as se:
+                logger.info('Subscribing to the hub of %s failed: %s',
+                            feed.url, se)
+
+        except FetchFeedException as ffe:
+            logger.info('Prefetching %s failed: %s', feed.url, ffe)
+            feed.unchanged += 1
+
+        finally:
+            self.busy_hosts.discard(feed.host)
+            interval = self.get_interval(entry, feed.unchanged)
+            feed.next_fetch = time.time() + interval
+
+    def get_interval(self, entry, unchanged=0):
+        """ Returns the number of seconds until the next refresh
+
+        Feeds are refreshed shortly before their cached version expires, but
+        not more often than every min_interval seconds, and feeds that
+        publish rarely or have not changed recently are refreshed less often.
+        A random jitter spreads out the refreshes of feeds; it only shortens
+        the interval, so that feeds do not expire because of it. """
+
+        interval = self.min_interval
+
+        if entry:
+            interval = max(interval, entry.max_age * REFRESH_FRACTION)
+            cadence = get_update_cadence(entry.feed)
+            if cadence:
+                interval = max(interval, cadence / CADENCE_DIVISOR)
+
+        interval *= 2 ** min(unchanged, MAX_BACKOFF_STEPS)
+        interval = min(interval, self.max_interval)
+
+        return interval * random.uniform(1 - self.jitter, 1)
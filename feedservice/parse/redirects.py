@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Remembering the new locations of feeds that have moved
+
+Feeds that redirect permanently (HTTP 301 or 308) or use RSS-Redirects are
+recorded as aliases of their new location. Before a feed is fetched, its
+known redirects are followed, for at most FEED_REDIRECT_MAX_CHAIN
+redirects, so that feeds that have moved are fetched from their new
+location right away. The URLs that lead to the new location are returned
+in the feed's urls.
+
+Redirects that would form a loop are not recorded; a loop that forms
+anyway (eg through concurrent updates) is only followed until a URL
+repeats. The aliases are kept in the cache for FEED_REDIRECT_TTL seconds,
+so that they are shared by all workers that use the same cache. """
+
+import hashlib
+import urllib.parse
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def get_redirect_key(url):
+    return 'redirect:%s' % hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def resolve(url):
+    """ Returns the known locations of the feed at url
+
+    The list starts with url and ends with the location from which the feed
+    should be fetched. """
+
+    chain = [url]
+
+    while len(chain) <= settings.FEED_REDIRECT_MAX_CHAIN:
+        location = cache.get(get_redirect_key(chain[-1]))
+        if location is None or location in chain:
+            break
+        chain.append(location)
+
+    return chain
+
+
+def record_redirect(url, location):
+    """ Records that the feed at url has moved to location
+
+    Relative and non-HTTP locations, and redirects that would form a loop,
+    are ignored. """
+
+    if settings.FEED_REDIRECT_MAX_CHAIN <= 0 or not location or \
+            location == url:
+        return
+
+    if urllib.parse.urlsplit(location).scheme not in ('http', 'https'):
+        return
+
+    if url in resolve(location):
+        return
+
+    cache.set(get_redirect_key(url), location, settings.FEED_REDIRECT_TTL)
+
+
+def add_aliases(feed, chain):
+    """ Adds the URLs that lead to the feed's location (see resolve) to its
+    urls, and reports the location as its new_location """
+
+    aliases = chain[:-1]
+    urls = getattr(feed, 'urls', None) or []
+    feed.urls = aliases + [url for url in urls if url not in aliases]
+
+    if not getattr(feed, 'new_location', None):
+        feed.new_location = chain[-1]
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Selection of the parser class for a feed URL
+
+Parsers declare the hosts they handle in HOSTS; a host also covers its
+subdomains. For each URL, only the parsers registered for its host (or one
+of its parent domains) and those without HOSTS are asked whether they
+handle it, in the order in which they have been registered. If none does,
+the default parser is used. URLs are normalized (see normalize_url) before
+they are passed to the parsers, and the decisions are memoized per
+normalized URL; the parsers are created with the normalized URL, too.
+
+Parsers can be registered by their dotted path ('module:Class') together
+with their hosts, so that their modules -- and dependencies -- are only
+imported when a URL for them is requested. Additional parsers can be
+installed as entry points in the group 'feedservice.parsers'; these are
+loaded on the first dispatch. """
+
+import logging
+import functools
+import importlib
+from collections import defaultdict
+from urllib.parse import urlsplit, urlunsplit
+
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINT_GROUP = 'feedservice.parsers'
+
+# Number of URLs for which the selected parser is remembered
+DISPATCH_CACHE_SIZE = 10000
+
+
+# ports that are omitted from normalized URLs
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    """ Returns the URL with lower-case scheme and host, and without default
+    port and fragment
+
+    >>> normalize_url(' HTTP://Example.COM:80/Feed.xml#top')
+    'http://example.com/Feed.xml'
+    """
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    userinfo, _, hostport = parts.netloc.rpartition('@')
+    host, _, port = hostport.rpartition(':')
+
+    if not host or ']' in port:
+        # no port, or the colon is part of an IPv6 address
+        host, port = hostport, ''
+
+    if port == str(DEFAULT_PORTS.get(scheme)):
+        hostport = host.lower()
+    else:
+        hostport = hostport.lower()
+
+    netloc = '%s@%s' % (userinfo, hostport) if userinfo else hostport
+    return urlunsplit((scheme, netloc, parts.path, parts.query, ''))
+
+
+def iter_entry_points(group):
+    """ Returns the installed entry points of the group
+
+    importlib.metadata is only available from Python 3.8 on (and can only
+    select groups from 3.10 on); older versions use the importlib_metadata
+    backport. """
+
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        from importlib_metadata import entry_points
+
+    eps = entry_points()
+    if hasattr(eps, 'select'):
+        return list(eps.select(group=group))
+    return list(eps.get(group, ()))
+
+
+def get_host_suffixes(host):
+    """ Returns the host and its parent domains
+
+    >>> get_host_suffixes('www.youtube.com')
+    ['www.youtube.com', 'youtube.com', 'com']
+    """
+    labels = host.split('.')
+    return ['.'.join(labels[n:]) for n in range(len(labels))]
+
+
+class ParserRegistry(object):
+    """ The available parser classes, indexed by the hosts they handle """
+
+    def __init__(self, default=None, entry_point_group=None):
+        self.default = default
+        self.entry_point_group = entry_point_group
+        self._by_host = defaultdict(list)
+        self._unindexed = []
+        self._order = {}
+        self._classes = {}
+        self._cached_get = functools.lru_cache(DISPATCH_CACHE_SIZE)(
+            self._get_parser_cls)
+
+    def register(self, cls, hosts=None, first=False):
+        """ Registers a parser class for the given hosts
+
+        cls is a class or its dotted path; for dotted paths, hosts have to be
+        given if the parser should be indexed. If hosts is not given, the
+        class' HOSTS are used; classes without hosts are asked for every URL.
+        Classes registered with first=True are asked before all others. """
+
+        if hosts is None and not isinstance(cls, str):
+            hosts = getattr(cls, 'HOSTS', ())
+
+        n = len(self._order)
+        self._order.setdefault(cls, -n if first else n)
+
+        if hosts:
+            for host in hosts:
+                self._by_host[host.lower()].append(cls)
+                self._by_host[host.lower()].sort(key=self._order.get)
+        else:
+            self._unindexed.append(cls)
+            self._unindexed.sort(key=self._order.get)
+
+        self._cached_get.cache_clear()
+
+    def load_entry_points(self, group=ENTRY_POINT_GROUP):
+        """ Registers the parser classes installed as entry points
+
+        They are asked before the parsers that have been registered before.
+        """
+
+        try:
+            entry_points = iter_entry_points(group)
+        except Exception:
+            # the built-in parsers work without plugins
+            logger.warning('Could not discover installed parsers',
+                           exc_info=True)
+            return
+
+        for entry_point in entry_points:
+            try:
+                cls = entry_point.load()
+            except Exception:
+                logger.exception('Could not load parser %s', entry_point.name)
+                continue
+
+            self.register(cls, first=True)
+
+    def resolve(self, entry):
+        """ Returns the class for a registry entry, importing it if needed """
+
+        if not isinstance(entry, str):
+            return entry
+
+        cls = self._classes.get(entry)
+        if cls is None:
+            module_name, name = entry.split(':')
+            module = importlib.import_module(module_name)
+            cls = self._classes[entry] = getattr(module, name)
+
+        return cls
+
+    def preload(self):
+        """ Imports all registered parsers, eg before forking workers """
+
+        self._load_entry_points()
+
+        entries = set(self._unindexed)
+        for classes in self._by_host.values():
+            entries.update(classes)
+
+        for entry in entries:
+            self.resolve(entry)
+
+        if self.default is not None:
+            self.resolve(self.default)
+
+    def _load_entry_points(self):
+        if self.entry_point_group:
+            group, self.entry_point_group = self.entry_point_group, None
+            self.load_entry_points(group)
+
+    def get_candidates(self, host):
+        """ Returns the entries that might handle URLs on the given host """
+
+        candidates = [cls for suffix in get_host_suffixes(host)
+                      for cls in self._by_host.get(suffix, ())]
+
+        if not candidates:
+            return self._unindexed
+
+        candidates = set(candidates + self._unindexed)
+        return sorted(candidates, key=self._order.get)
+
+    def get_parser_cls(self, url):
+        """ Returns the parser class for the URL
+
+        The parser has to be created with the normalized URL (see
+        normalize_url). Raises ValueError if no parser can handle it. """
+        self._load_entry_points()
+        return self._cached_get(normalize_url(url))
+
+    def _get_parser_cls(self, url):
+        candidates = self.get_candidates(urlsplit(url).hostname or '')
+
+        for entry in candidates:
+            cls = self.resolve(entry)
+            if cls.handles_url(url):
+                return cls
+
+        if self.default is None:
+            raise ValueError('no feed can handle %s' % url)
+
+        return self.resolve(self.default)
@@ -22,7 +22,7 @@
 # Thomas Perl <thp@gpodder.org>; 2009-11-03
 
 import os
-import time
+import calendar
 
 import re
 import email
@@ -35,7 +35,7 @@ from feedservice.parse.models import Feed, Episode, File
 from feedservice.parse.feed import Feedparser, FeedparserEpisodeParser
 from feedservice.parse.models import ParserException
 from feedservice.parse.mimetype import get_mimetype
-from feedservice.utils import json, requests
+from feedservice.utils import json, get_session
 
 import logging
 logger = logging.getLogger(__name__)
@@ -56,7 +56,7 @@ class SoundcloudUser(object):
         json_url = 'https://api.soundcloud.com/users/%s.json?consumer_key=%s' \
             % (self.username, settings.SOUNDCLOUD_CONSUMER_KEY)
 
-        user_info = requests.get(json_url).json()
+        user_info = get_session().get(json_url).json()
         return user_info.get('avatar_url', None)
 
     def get_tracks(self, feed):
@@ -74,7 +74,7 @@ class SoundcloudUser(object):
 
         logger.debug("loading %s", json_url)
 
-        response = requests.get(json_url)
+        response = get_session().get(json_url)
         json_tracks = response.json()
 
         self._check_error(json_tracks)
@@ -113,7 +113,7 @@ class SoundcloudUser(object):
         key = ':'.join((self.username, 'user_info'))
 
         json_url = 'https://api.soundcloud.com/users/%s.json?consumer_key=%s' % (self.username, settings.SOUNDCLOUD_CONSUMER_KEY)
-        user_info = requests.get(json_url).json()
+        user_info = get_session().get(json_url).json()
 
         return user_info
 
@@ -160,7 +160,7 @@ class SoundcloudUser(object):
         metadata via the HTTP header fields.
         """
 
-        res = requests.head(url)
+        res = get_session().head(url)
         return (res.headers['Content-Length'], res.headers['Content-Type'],
                 os.path.basename(os.path.dirname(res.url)))
 
@@ -172,7 +172,7 @@ class SoundcloudUser(object):
         parsed with this function (2009/11/03 13:37:00).
         """
         m = re.match(r'(\d{4})/(\d{2})/(\d{2}) (\d{2}):(\d{2}):(\d{2})', s)
-        return time.mktime(tuple([int(x) for x in m.groups()]+[0, 0, -1]))
+        return calendar.timegm([int(x) for x in m.groups()])
 
 
 class SoundcloudParser(Feedparser):
@@ -209,7 +209,7 @@ class SoundcloudParser(Feedparser):
         tracks = self.sc_user.get_tracks('tracks')
         parsers = [SoundcloudEpisodeParser(t, self.get_author(),
                    text_processor=self.text_processor) for t in tracks]
-        return [p.get_episode() for p in parsers]
+        return [p.get_episode(self.episode_fields) for p in parsers]
 
 
 class SoundcloudFavParser(SoundcloudParser):
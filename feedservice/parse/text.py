@@ -36,7 +36,7 @@ class StripHtmlTags(object):
 
         # Convert named HTML entities to their unicode character
         result = re_html_entities.sub(
-            lambda x: str(entitydefs.get(x.group(1), ''), 'iso-8859-1'),
+            lambda x: entitydefs.get(x.group(1), ''),
             result)
 
         # Convert more than two newlines to two newlines
@@ -56,3 +56,8 @@ class ConvertMarkdown(object):
 
         except Exception:
             return ''
+
+
+# the text processors by class name, as they are recorded for popular feeds
+TEXT_PROCESSORS = {cls.__name__: cls for cls in (StripHtmlTags,
+                                                 ConvertMarkdown)}
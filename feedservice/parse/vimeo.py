@@ -30,7 +30,7 @@ logger = logging.getLogger(__name__)
 VIMEOCOM_RE = re.compile(r'http://vimeo\.com/(\d+)$', re.IGNORECASE)
 MOOGALOOP_RE = re.compile(r'http://vimeo\.com/moogaloop\.swf\?clip_id=(\d+)$', re.IGNORECASE)
 SIGNATURE_RE = re.compile(r'"timestamp":(\d+),"signature":"([^"]+)"')
-DATA_CONFIG_RE = re.compile(r'data-config-url="([^"]+)"')
+DATA_CONFIG_RE = re.compile(rb'data-config-url="([^"]+)"')
 
 # List of qualities, from lowest to highest
 FILEFORMAT_RANKING = ['mobile', 'sd', 'hd']
@@ -69,7 +69,7 @@ class VimeoParser(Feedparser):
     def get_episodes(self):
         parser = [VimeoEpisodeParser(e, text_processor=self.text_processor)
                   for e in self.feed.entries]
-        return [p.get_episode() for p in parser]
+        return [p.get_episode(self.episode_fields) for p in parser]
 
 
 class VimeoEpisodeParser(FeedparserEpisodeParser):
@@ -95,17 +95,20 @@ class VimeoEpisodeParser(FeedparserEpisodeParser):
             return url
 
         web_url = 'http://vimeo.com/%s' % video_id
-        web_data = fetch_url(web_url).read()
+        with fetch_url(web_url).body as body:
+            web_data = body.read()
         data_config_frag = DATA_CONFIG_RE.search(web_data)
 
         if data_config_frag is None:
             raise VimeoError('Cannot get data config from Vimeo')
 
-        data_config_url = data_config_frag.group(1).replace('&amp;', '&')
+        data_config_url = data_config_frag.group(1).decode('ascii', 'replace')
+        data_config_url = data_config_url.replace('&amp;', '&')
 
         def get_urls(data_config_url):
-            data_config_data = fetch_url(data_config_url).read().decode('utf-8')
-            data_config = json.loads(data_config_data)
+            # json detects the UTF encoding of bytes itself
+            with fetch_url(data_config_url).body as body:
+                data_config = json.loads(body.read())
             for fileinfo in list(data_config['request']['files'].values()):
                 if not isinstance(fileinfo, dict):
                     continue
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+#
+
+""" Push updates of feeds through WebSub (formerly PubSubHubbub) hubs
+
+If WEBSUB_CALLBACK_URL is set, the prefetcher subscribes to the hubs of the
+popular feeds it refreshes (see Feedparser.get_hub_url). The hub verifies
+the subscription by requesting the callback (the /websub endpoint), and
+from then on pushes the content of the feed to it whenever the feed
+changes. Pushes are signed with a secret that is derived from SECRET_KEY
+for each feed; pushes without a valid signature are ignored.
+
+Pushed feeds are parsed and stored in the cache for each text processor
+that the feed has been subscribed for. While the subscription is active,
+these cached feeds stay fresh for at least WEBSUB_MAX_AGE seconds, so that
+they are served without polling the feed's server. Subscriptions are
+renewed by the prefetcher before their lease runs out; those of feeds that
+are not popular anymore are left to expire.
+
+Subscriptions are kept in the cache, which has to be shared by the
+prefetcher and the web workers. """
+
+import hmac
+import time
+import hashlib
+import tempfile
+import urllib.parse
+
+import eventlet
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from feedservice import metrics
+from feedservice.parse.text import TEXT_PROCESSORS
+from feedservice.utils import get_session, get_declared_encoding
+
+
+# subscriptions that the hub has not verified within this many seconds are
+# requested again
+PENDING_TIMEOUT = 60 * 60
+
+# subscriptions are renewed when less than this fraction of the lease is left
+RENEW_FRACTION = 0.1
+
+# the hash functions of the signature methods of X-Hub-Signature headers
+SIGNATURE_METHODS = {
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+    'sha384': hashlib.sha384,
+    'sha512': hashlib.sha512,
+}
+
+PUSH_CHUNK_SIZE = 64 * 1024
+
+
+class SubscriptionError(Exception):
+    """ raised when a hub can not be reached or rejects a subscription """
+
+
+class Subscription(object):
+    """ The subscription to the hub of a feed (the topic) """
+
+    def __init__(self, topic, hub):
+        self.topic = topic
+        self.hub = hub
+        # the names of the text processors, see TEXT_PROCESSORS
+        self.processors = set()
+        self.requested = None
+        self.verified = None
+        self.expires = None
+        self.denied = False
+
+    def is_active(self):
+        return self.expires is not None and self.expires > time.time()
+
+    def is_pending(self):
+        """ if the hub has yet to verify the last request """
+        if self.requested is None or \
+                (self.verified or 0) >= self.requested:
+            return False
+        return time.time() - self.requested < PENDING_TIMEOUT
+
+    def needs_renewal(self):
+        if not self.is_active():
+            return True
+        lease = self.expires - self.verified
+        return self.expires - time.time() < RENEW_FRACTION * lease
+
+    def get_text_processors(self):
+        processors = (TEXT_PROCESSORS.get(name) for name in self.processors)
+        return [cls() if cls else None for cls in processors]
+
+
+def is_enabled():
+    return bool(settings.WEBSUB_CALLBACK_URL and settings.SECRET_KEY)
+
+
+def get_subscription_key(topic):
+    return 'websub:%s' % hashlib.sha1(topic.encode('utf-8')).hexdigest()
+
+
+def get_subscription(topic):
+    return cache.get(get_subscription_key(topic))
+
+
+def store_subscription(subscription):
+    if subscription.denied:
+        timeout = settings.WEBSUB_LEASE_SECONDS
+    else:
+        timeout = max((subscription.expires or 0) - time.time(),
+                      PENDING_TIMEOUT)
+
+    cache.set(get_subscription_key(subscription.topic), subscription,
+              timeout)
+
+
+def get_secret(topic):
+    """ Returns the secret with which the hub signs the pushes of the feed
+    """
+    msg = ('websub:%s' % topic).encode('utf-8')
+    key = settings.SECRET_KEY.encode('utf-8')
+    return hmac.new(key, msg, hashlib.sha256).hexdigest()
+
+
+def get_callback_url(topic):
+    url = settings.WEBSUB_CALLBACK_URL
+    separator = '&' if '?' in url else '?'
+    return url + separator + urllib.parse.urlencode({'url': topic})
+
+
+def get_processor_name(text_processor):
+    return type(text_processor).__name__ if text_processor else None
+
+
+def subscribe(topic, hub, text_processor=None):
+    """ Asks the hub to push the feed to the callback
+
+    The subscription is active once the hub has verified it (see
+    verify_intent), which can happen before the hub responds. """
+
+    if urllib.parse.urlsplit(hub).scheme not in ('http', 'https'):
+        raise SubscriptionError('invalid hub URL %s' % hub)
+
+    subscription = get_subscription(topic) or Subscription(topic, hub)
+    subscription.hub = hub
+    subscription.processors.add(get_processor_name(text_processor))
+    subscription.requested = time.time()
+    subscription.denied = False
+    store_subscription(subscription)
+
+    data = {
+        'hub.mode': 'subscribe',
+        'hub.topic': topic,
+        'hub.callback': get_callback_url(topic),
+        'hub.lease_seconds': settings.WEBSUB_LEASE_SECONDS,
+        'hub.secret': get_secret(topic),
+    }
+
+    resp = None
+
+    try:
+        with eventlet.Timeout(settings.FETCH_TIMEOUT, False):
+            resp = get_session().post(hub, data=data)
+
+    except requests.exceptions.RequestException as ex:
+        raise SubscriptionError(ex) from ex
+
+    if resp is None:
+        raise SubscriptionError('hub %s timed out' % hub)
+
+    if not 200 <= resp.status_code < 300:
+        raise SubscriptionError('hub %s responded with HTTP %d' %
+                                (hub, resp.status_code))
+
+    metrics.record_websub('subscribe')
+
+
+def ensure_subscribed(url, feed, text_processor=None):
+    """ Subscribes to the hub of the parsed feed, unless the subscription is
+    active or pending already """
+
+    hub = getattr(feed, 'hub', None)
+    if not hub or not is_enabled():
+        return
+
+    subscription = get_subscription(url)
+    if subscription and get_processor_name(text_processor) in \
+            subscription.processors and (subscription.denied or
+                                         subscription.is_pending() or
+                                         not subscription.needs_renewal()):
+        return
+
+    subscribe(url, hub, text_processor)
+
+
+def verify_intent(url, topic, mode, challenge, lease_seconds=None):
+    """ Handles a request of the hub to verify a subscription
+
+    url is the feed for which the callback has been requested (see
+    get_callback_url), and has to match the topic. Returns the body of the
+    response to the hub, or None if the request has not been expected.
+    Subscriptions are only verified while they are pending and are never
+    cancelled, so requests to verify unsubscriptions are never expected. """
+
+    if url != topic:
+        return None
+
+    subscription = get_subscription(topic)
+    if subscription is None:
+        return None
+
+    if mode == 'denied':
+        subscription.denied = True
+        subscription.expires = None
+        store_subscription(subscription)
+        metrics.record_websub('denied')
+        return ''
+
+    if mode != 'subscribe' or not challenge or subscription.denied or \
+            not subscription.is_pending():
+        return None
+
+    lease_seconds = get_lease_seconds(lease_seconds)
+    if lease_seconds is None:
+        return None
+
+    subscription.verified = time.time()
+    subscription.expires = subscription.verified + lease_seconds
+    store_subscription(subscription)
+    metrics.record_websub('verified')
+    return challenge
+
+
+def get_lease_seconds(lease_seconds):
+    """ Returns the lease that the hub has granted, or None if it is invalid
+
+    Hubs that do not report the lease are assumed to have granted the
+    requested one; longer leases are shortened to it, so that subscriptions
+    are renewed in time. """
+
+    if lease_seconds is None:
+        return settings.WEBSUB_LEASE_SECONDS
+
+    try:
+        lease_seconds = int(lease_seconds)
+    except (TypeError, ValueError):
+        return None
+
+    if lease_seconds <= 0:
+        return None
+
+    return min(lease_seconds, settings.WEBSUB_LEASE_SECONDS)
+
+
+def receive_push(topic, stream, signature, content_type=None):
+    """ Reads the content that the hub pushed for the feed from stream
+
+    Returns the subscription and the content as a response for the feed's
+    parser (see feedservice.utils.fetch_url), or None if the push has not
+    been signed by the hub of an active subscription. """
+
+    subscription = get_subscription(topic)
+    method, _, digest = (signature or '').partition('=')
+    digestmod = SIGNATURE_METHODS.get(method)
+
+    if subscription is None or not subscription.is_active() or \
+            digestmod is None:
+        metrics.record_websub('rejected')
+        return None
+
+    mac = hmac.new(get_secret(topic).encode('utf-8'), digestmod=digestmod)
+    body = tempfile.SpooledTemporaryFile(max_size=settings.FETCH_SPOOL_SIZE)
+    size = 0
+
+    while True:
+        chunk = stream.read(PUSH_CHUNK_SIZE)
+        if not chunk:
+            break
+
+        size += len(chunk)
+        if size > settings.FETCH_MAX_SIZE:
+            break
+
+        mac.update(chunk)
+        body.write(chunk)
+
+    if size > settings.FETCH_MAX_SIZE or \
+            not hmac.compare_digest(mac.hexdigest(), digest):
+        body.close()
+        metrics.record_websub('rejected')
+        return None
+
+    body.seek(0)
+
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.url = topic
+    resp.headers['Content-Type'] = content_type or ''
+    resp.body, resp.body_size = body, size
+    resp.declared_encoding = get_declared_encoding(resp.headers)
+
+    metrics.record_websub('push')
+    return subscription, resp
+
+
+def get_max_age(url, text_processor, fields, max_age):
+    """ Returns the freshness lifetime of a fetched feed
+
+    Feeds whose cached version is updated by pushes stay fresh for at least
+    WEBSUB_MAX_AGE seconds. """
+
+    if not is_enabled() or fields is not None:
+        return max_age
+
+    subscription = get_subscription(url)
+    if subscription is None or not subscription.is_active() or \
+            get_processor_name(text_processor) not in \
+            subscription.processors:
+        return max_age
+
+    return max(max_age, settings.WEBSUB_MAX_AGE)
@@ -27,7 +27,7 @@ from django.conf import settings
 
 from feedservice.parse.feed import Feedparser, FeedparserEpisodeParser
 from feedservice.parse.models import ParserException
-from feedservice.utils import remove_html_tags, fetch_url, requests
+from feedservice.utils import remove_html_tags, fetch_url
 
 import feedservice.utils as util  # for gpodder.youtube compat
 
@@ -36,7 +36,11 @@ logger = logging.getLogger(__name__)
 
 
 # todo: actually parse the feed and look for the <link rel=canonical"> tag
-RE_CANONICAL = 'rel="canonical" href="([^"]+)'
+RE_CANONICAL = re.compile(rb'rel="canonical" href="([^"]+)')
+
+# Number of bytes at the start of a page that are searched for its
+# canonical link, which is in the page's head
+PAGE_SCAN_SIZE = 512 * 1024
 
 RE_CHANNEL = re.compile('channel/([_a-zA-Z0-9-]+)')
 RE_PLAYLIST = re.compile(r'playlist\?list=([_a-zA-Z0-9-]+)')
@@ -84,8 +88,29 @@ class YoutubeParser(Feedparser):
     def __init__(self, url, resp, text_processor=None):
         self._orig_url = url
         self._current_url = self.get_current_url(self._orig_url)
-        self._new_url = self.parse_video_page(self._current_url)
-        super().__init__(self._new_url, resp, text_processor=text_processor)
+
+        # the bodies of the responses that are fetched here (rather than by
+        # the caller) have to be closed here, too
+        fetched = []
+
+        try:
+            if self._current_url != url:
+                resp = fetch_url(self._current_url)
+                fetched.append(resp)
+
+            self._new_url = self.parse_video_page(self._current_url, resp)
+
+            # the feed is found through the channel's page, which is in resp
+            if self._new_url != url:
+                resp = fetch_url(self._new_url)
+                fetched.append(resp)
+
+            super().__init__(self._new_url, resp,
+                             text_processor=text_processor)
+
+        finally:
+            for fetched_resp in fetched:
+                fetched_resp.body.close()
 
     def get_current_url(self, url):
         # try to match for old URLs that already contain the video ID
@@ -104,14 +129,15 @@ class YoutubeParser(Feedparser):
 
         return url
 
-    def parse_video_page(self, url):
-        # by now we should have a new (working) URL, let's fetch it
-        r = requests.get(url)
-        m = re.search(RE_CANONICAL, r.text)
+    def parse_video_page(self, url, resp):
+        # by now we should have a new (working) URL, and resp is its page;
+        # the canonical link is ASCII in all encodings that YouTube uses
+        resp.body.seek(0)
+        m = RE_CANONICAL.search(resp.body.read(PAGE_SCAN_SIZE))
         if not m:
             # URL didn't contain a canonical link, so we can't work with it
             return url
-        canonical_url = m.group(1)
+        canonical_url = m.group(1).decode('ascii', 'replace')
 
         # see what kind of canonical link we found
         for regex, feed in FEED_TYPES.items():
@@ -132,7 +158,7 @@ class YoutubeParser(Feedparser):
     def get_episodes(self):
         parser = [YoutubeEpisodeParser(e, text_processor=self.text_processor)
                   for e in self.feed.entries]
-        return [p.get_episode() for p in parser]
+        return [p.get_episode(self.episode_fields) for p in parser]
 
 
 class YoutubeEpisodeParser(FeedparserEpisodeParser):
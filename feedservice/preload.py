@@ -0,0 +1,41 @@
+""" Loading of modules and tables before worker processes are forked
+
+Parsers and heavy dependencies are imported lazily (see
+feedservice.parse.registry), which keeps single processes small. When
+several workers are forked from one master process (eg with gunicorn's
+preload_app), it is cheaper to load everything once in the master, so that
+the workers share these pages copy-on-write instead of loading their own
+copies. """
+
+import gc
+import mimetypes
+
+
+def preload():
+    """ Imports all modules and builds all tables that requests might need """
+
+    # Django loads the URL configuration, and thereby the views, on the
+    # first request of each worker
+    import feedservice.urls
+
+    from feedservice.parse import PARSER_REGISTRY
+    PARSER_REGISTRY.preload()
+
+    # optional dependencies of text processing and inlined logos
+    for name in ('html2text', 'PIL.Image', 'PIL.ImageDraw'):
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+    # the mime type table is otherwise read from disk on first use
+    mimetypes.init()
+
+
+def freeze():
+    """ Excludes all current objects from garbage collection
+
+    The collector would otherwise write to the headers of all preloaded
+    objects in each worker, which un-shares their pages. """
+    gc.collect()
+    gc.freeze()
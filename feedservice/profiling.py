@@ -0,0 +1,236 @@
+""" Profiling of single requests
+
+A request to a profiled view can ask for a profile instead of its response
+with the parameter profile, if it sends the token in PROFILING_TOKEN in the
+header X-Profiling-Token:
+
+    cprofile    a text report of cProfile, sorted by cumulative time
+    pstats      the cProfile statistics, to be loaded with pstats.Stats
+    speedscope  the samples of the sampling profiler as speedscope JSON
+                (https://www.speedscope.app/)
+
+In addition, if PROFILING_SLOW_DIR is set, a random sample of requests
+(PROFILING_SLOW_SAMPLE_RATE) is run under the sampling profiler, and the
+profiles of those that take longer than PROFILING_SLOW_THRESHOLD seconds
+are stored there.
+
+The sampling profiler records the stack of the profiled green thread on
+each SIGPROF, ie after every PROFILING_INTERVAL seconds of CPU time, so it
+shows where CPU time is spent, not where requests wait for the network. It
+is cheap enough to run in production, but only one request per process can
+be sampled at a time. cProfile also records the other green threads that
+run while the request is profiled. """
+
+import io
+import os
+import json
+import time
+import hmac
+import random
+import signal
+import marshal
+import pstats
+import cProfile
+import logging
+import functools
+import threading
+import urllib.parse
+
+import greenlet
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+
+logger = logging.getLogger(__name__)
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+# only one sampler can use the profiling timer at a time
+_sampler_lock = threading.Lock()
+
+
+class ProfilerUnavailable(Exception):
+    """ raised when the sampling profiler can not be used right now """
+
+
+class Sampler(object):
+    """ Samples the stack of the current green thread """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.frames = {}
+        self.samples = []
+        self.target = None
+
+    def __enter__(self):
+        if not _sampler_lock.acquire(blocking=False):
+            raise ProfilerUnavailable('another request is being sampled')
+
+        try:
+            self.previous = signal.signal(signal.SIGPROF, self._sample)
+        except ValueError as ve:
+            # signal handlers can only be set in the main thread
+            _sampler_lock.release()
+            raise ProfilerUnavailable(ve) from ve
+
+        self.target = greenlet.getcurrent()
+        self.start = time.perf_counter()
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous)
+        self.duration = time.perf_counter() - self.start
+        _sampler_lock.release()
+
+    def _sample(self, signum, frame):
+        if greenlet.getcurrent() is not self.target:
+            return
+
+        stack = []
+        while frame is not None:
+            stack.append(self._get_frame_index(frame.f_code))
+            frame = frame.f_back
+
+        stack.reverse()
+        self.samples.append(stack)
+
+    def _get_frame_index(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self.frames.get(key)
+        if index is None:
+            index = self.frames[key] = len(self.frames)
+        return index
+
+    def get_speedscope(self, name):
+        """ Returns the samples in the speedscope file format """
+
+        frames = [dict(name=func, file=filename, line=line)
+                  for (func, filename, line) in self.frames]
+
+        return {
+            '$schema': SPEEDSCOPE_SCHEMA,
+            'name': name,
+            'exporter': 'feedservice',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': name,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': len(self.samples) * self.interval,
+                'samples': self.samples,
+                'weights': [self.interval] * len(self.samples),
+            }],
+        }
+
+
+def is_authorized(request):
+    token = settings.PROFILING_TOKEN
+    given = request.META.get('HTTP_X_PROFILING_TOKEN', '')
+    return bool(token) and hmac.compare_digest(given.encode('utf-8'),
+                                               token.encode('utf-8'))
+
+
+def get_profile_name(request):
+    return urllib.parse.unquote(request.get_full_path())
+
+
+def run_view(view_func, request, *args, **kwargs):
+    """ Runs the view, including the generation of streamed content """
+    response = view_func(request, *args, **kwargs)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def profile_cprofile(view_func, request, *args, **kwargs):
+    profiler = cProfile.Profile()
+    profiler.runcall(run_view, view_func, request, *args, **kwargs)
+    profiler.create_stats()
+    return profiler
+
+
+def profile_view(mode, view_func, request, *args, **kwargs):
+    """ Returns the profile of the view as response """
+
+    if mode == 'cprofile':
+        profiler = profile_cprofile(view_func, request, *args, **kwargs)
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(100)
+        return HttpResponse(out.getvalue(), content_type='text/plain')
+
+    elif mode == 'pstats':
+        profiler = profile_cprofile(view_func, request, *args, **kwargs)
+        response = HttpResponse(marshal.dumps(profiler.stats),
+                                content_type='application/octet-stream')
+        response['Content-Disposition'] = \
+            'attachment; filename="profile.pstats"'
+        return response
+
+    elif mode == 'speedscope':
+        try:
+            with Sampler(settings.PROFILING_INTERVAL) as sampler:
+                run_view(view_func, request, *args, **kwargs)
+        except ProfilerUnavailable as pu:
+            return HttpResponse(str(pu), status=503,
+                                content_type='text/plain')
+
+        profile = sampler.get_speedscope(get_profile_name(request))
+        return HttpResponse(json.dumps(profile),
+                            content_type='application/json')
+
+    return HttpResponse('unknown profile: %s' % mode, status=400,
+                        content_type='text/plain')
+
+
+def store_slow_profile(sampler, name):
+    filename = '%s-%dms-%d.speedscope.json' % (
+        time.strftime('%Y%m%d-%H%M%S'), sampler.duration * 1000, os.getpid())
+    path = os.path.join(settings.PROFILING_SLOW_DIR, filename)
+
+    with open(path, 'w') as f:
+        json.dump(sampler.get_speedscope(name), f)
+
+    logger.info('Stored profile of slow request %s in %s', name, path)
+
+
+def sample_slow(view_func, request, *args, **kwargs):
+    """ Runs the view under the sampling profiler, and stores the profile
+    if it is slow """
+
+    try:
+        with Sampler(settings.PROFILING_INTERVAL) as sampler:
+            response = view_func(request, *args, **kwargs)
+
+    except ProfilerUnavailable:
+        return view_func(request, *args, **kwargs)
+
+    if sampler.duration >= settings.PROFILING_SLOW_THRESHOLD:
+        store_slow_profile(sampler, get_profile_name(request))
+
+    return response
+
+
+def with_profiling(view_func):
+    """ Profiles the view if requested, or if it is sampled (see above) """
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        mode = request.GET.get('profile')
+        if mode:
+            if not is_authorized(request):
+                return HttpResponseForbidden('profiling is not enabled, or '
+                                             'the token is invalid')
+
+            return profile_view(mode, view_func, request, *args, **kwargs)
+
+        if settings.PROFILING_SLOW_DIR and \
+                random.random() < settings.PROFILING_SLOW_SAMPLE_RATE:
+            return sample_slow(view_func, request, *args, **kwargs)
+
+        return view_func(request, *args, **kwargs)
+
+    return wrapper
@@ -121,7 +121,11 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
-        }
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.request': {
@@ -129,6 +133,12 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        # one line per parsed feed, if TIMING_ENABLED is set
+        'feedservice.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
 
@@ -138,6 +148,156 @@ EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.Email
 
 FETCH_TIMEOUT = int(os.getenv('FETCH_TIMEOUT', 20))
 
+# Fetched responses that are larger than FETCH_MAX_SIZE bytes are rejected;
+# bodies larger than FETCH_SPOOL_SIZE bytes are stored in temporary files
+FETCH_MAX_SIZE = int(os.getenv('FETCH_MAX_SIZE', 20 * 1024 * 1024))
+FETCH_SPOOL_SIZE = int(os.getenv('FETCH_SPOOL_SIZE', 1024 * 1024))
+
+# Responses with these Content-Types (prefixes) are rejected without being
+# downloaded, as they can't be feeds
+FETCH_REJECTED_CONTENT_TYPES = ('audio/', 'video/', 'image/')
+
+# Feeds that could not be fetched or parsed are not fetched again for
+# FEED_FAILURE_BACKOFF seconds, doubling with each consecutive failure up to
+# FEED_FAILURE_BACKOFF_MAX (0 to disable)
+FEED_FAILURE_BACKOFF = int(os.getenv('FEED_FAILURE_BACKOFF', 30))
+FEED_FAILURE_BACKOFF_MAX = int(os.getenv('FEED_FAILURE_BACKOFF_MAX', 3600))
+
+# Hosts that time out or respond with server errors HOST_BREAKER_THRESHOLD
+# times in a row are not fetched from for HOST_BREAKER_RESET seconds (0 to
+# disable, see feedservice.parse.failures)
+HOST_BREAKER_THRESHOLD = int(os.getenv('HOST_BREAKER_THRESHOLD', 5))
+HOST_BREAKER_RESET = int(os.getenv('HOST_BREAKER_RESET', 60))
+
+# Concurrent fetches from each host start at HOST_CONCURRENCY_INITIAL, and
+# adapt to how fast the host responds, up to HOST_CONCURRENCY_MAX (0 to
+# disable). Hosts that respond HOST_LATENCY_FACTOR times slower than usual,
+# or with 429 or 503, are fetched less; their Retry-After headers are
+# respected for up to HOST_RETRY_AFTER_MAX seconds
+# (see feedservice.hostlimits)
+HOST_CONCURRENCY_INITIAL = int(os.getenv('HOST_CONCURRENCY_INITIAL', 4))
+HOST_CONCURRENCY_MAX = int(os.getenv('HOST_CONCURRENCY_MAX', 32))
+HOST_LATENCY_FACTOR = float(os.getenv('HOST_LATENCY_FACTOR', 2))
+HOST_RETRY_AFTER_MAX = int(os.getenv('HOST_RETRY_AFTER_MAX', 3600))
+
+# If requested, the size and type of episode files are requested from their
+# servers, for at most ENCLOSURE_ENRICH_BUDGET uncached files per feed, and
+# cached for ENCLOSURE_CACHE_TTL seconds (see feedservice.parse.enclosures)
+ENCLOSURE_ENRICH_BUDGET = int(os.getenv('ENCLOSURE_ENRICH_BUDGET', 20))
+ENCLOSURE_ENRICH_CONCURRENCY = int(
+    os.getenv('ENCLOSURE_ENRICH_CONCURRENCY', 10))
+ENCLOSURE_ENRICH_TIMEOUT = int(os.getenv('ENCLOSURE_ENRICH_TIMEOUT', 5))
+ENCLOSURE_CACHE_TTL = int(os.getenv('ENCLOSURE_CACHE_TTL', 30 * 86400))
+
+# Parse RFC 822 and ISO 8601 dates in feeds with a fast parser before trying
+# those of feedparser (see feedservice.parse.feed.parse_date_fast)
+FEEDPARSER_FAST_DATES = bool_env('FEEDPARSER_FAST_DATES', True)
+
+# Permanent HTTP redirects and RSS-Redirects of feeds are remembered for
+# FEED_REDIRECT_TTL seconds, and followed before fetching for up to
+# FEED_REDIRECT_MAX_CHAIN redirects (0 to disable)
+# (see feedservice.parse.redirects)
+FEED_REDIRECT_TTL = int(os.getenv('FEED_REDIRECT_TTL', 90 * 86400))
+FEED_REDIRECT_MAX_CHAIN = int(os.getenv('FEED_REDIRECT_MAX_CHAIN', 5))
+
+
+# The cache for parsed feeds and all state that is shared between requests:
+# 'locmem' (per process), 'shm' (shared by the worker processes of one host,
+# in the file CACHE_LOCATION of CACHE_SIZE bytes) or 'memcached' (shared by
+# all nodes, on the servers CACHE_LOCATION as host:port separated by ';')
+# (see feedservice.cachebackends)
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'shm': 'feedservice.cachebackends.SharedMemoryCache',
+    'memcached': 'feedservice.cachebackends.MemcachedProtocolCache',
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[os.getenv('CACHE_BACKEND', 'locmem')],
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 1000)),
+            'SIZE': int(os.getenv('CACHE_SIZE', 64 * 1024 * 1024)),
+        },
+    },
+}
+
+# Parsed feeds are cached according to their HTTP caching headers. Feeds
+# without such headers are considered fresh for FEED_CACHE_TTL seconds
+FEED_CACHE_TTL = int(os.getenv('FEED_CACHE_TTL', 300))
+FEED_CACHE_MAX_TTL = int(os.getenv('FEED_CACHE_MAX_TTL', 86400))
+
+# Number of seconds after expiry in which a cached feed is served while it is
+# refreshed in the background (stale-while-revalidate, 0 to disable)
+FEED_CACHE_STALE_WHILE_REVALIDATE = int(
+    os.getenv('FEED_CACHE_STALE_WHILE_REVALIDATE', 0))
+
+# Number of seconds after expiry in which a cached feed is served, with a
+# warning, if refreshing it fails (stale-if-error, 0 to disable)
+FEED_CACHE_STALE_IF_ERROR = int(os.getenv('FEED_CACHE_STALE_IF_ERROR', 0))
+
+# Number of seconds for which the episode index behind a cursor is kept, ie
+# for which clients can request deltas with it
+FEED_CURSOR_TTL = int(os.getenv('FEED_CURSOR_TTL', 7 * 86400))
+
+# Compression levels for responses by Content-Encoding; responses smaller
+# than COMPRESSION_MIN_SIZE bytes are not compressed
+COMPRESSION_LEVELS = {
+    'gzip': int(os.getenv('COMPRESSION_LEVEL_GZIP', 6)),
+    'br': int(os.getenv('COMPRESSION_LEVEL_BR', 5)),
+    'zstd': int(os.getenv('COMPRESSION_LEVEL_ZSTD', 3)),
+}
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 512))
+
+# Maximum number of feeds per request to /parse/batch, and the number of them
+# that are fetched concurrently
+BATCH_MAX_FEEDS = int(os.getenv('BATCH_MAX_FEEDS', 1000))
+BATCH_CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 20))
+
+# Time the stages of requests; the durations are sent in a Server-Timing
+# header, logged per feed and aggregated (see feedservice.timing)
+TIMING_ENABLED = bool_env('TIMING_ENABLED', False)
+
+# Requests that send this token in X-Profiling-Token can ask for a profile
+# instead of the response (see feedservice.profiling); empty to disable
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+
+# Seconds of CPU time between the samples of the sampling profiler
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', 0.005))
+
+# If set, this fraction of requests is sampled, and the profiles of requests
+# that take longer than PROFILING_SLOW_THRESHOLD seconds are stored in
+# PROFILING_SLOW_DIR
+PROFILING_SLOW_DIR = os.getenv('PROFILING_SLOW_DIR', '')
+PROFILING_SLOW_SAMPLE_RATE = float(
+    os.getenv('PROFILING_SLOW_SAMPLE_RATE', 0.01))
+PROFILING_SLOW_THRESHOLD = float(os.getenv('PROFILING_SLOW_THRESHOLD', 2))
+
+# Maximum number of hosts (registered domains) for which metrics are recorded
+# separately in each process; all others are labelled 'other'
+METRICS_MAX_HOSTS = int(os.getenv('METRICS_MAX_HOSTS', 200))
+
+# Maximum number of feeds for which requests are counted
+POPULAR_FEEDS_MAX = int(os.getenv('POPULAR_FEEDS_MAX', 10000))
+
+# Defaults for the prefetch_feeds management command, which keeps the most
+# popular feeds fresh in the cache
+PREFETCH_FEEDS = int(os.getenv('PREFETCH_FEEDS', 500))
+PREFETCH_CONCURRENCY = int(os.getenv('PREFETCH_CONCURRENCY', 20))
+PREFETCH_HOST_DELAY = float(os.getenv('PREFETCH_HOST_DELAY', 1))
+PREFETCH_JITTER = float(os.getenv('PREFETCH_JITTER', 0.1))
+PREFETCH_MIN_INTERVAL = int(os.getenv('PREFETCH_MIN_INTERVAL', 5 * 60))
+PREFETCH_MAX_INTERVAL = int(os.getenv('PREFETCH_MAX_INTERVAL', 24 * 60 * 60))
+
+# If set to the public URL of the /websub endpoint, the prefetcher subscribes
+# to the WebSub hubs of popular feeds for WEBSUB_LEASE_SECONDS; feeds that
+# are pushed by their hubs are fresh in the cache for WEBSUB_MAX_AGE seconds
+# (see feedservice.parse.websub)
+WEBSUB_CALLBACK_URL = os.getenv('WEBSUB_CALLBACK_URL', '')
+WEBSUB_LEASE_SECONDS = int(os.getenv('WEBSUB_LEASE_SECONDS', 10 * 86400))
+WEBSUB_MAX_AGE = int(os.getenv('WEBSUB_MAX_AGE', 6 * 60 * 60))
+
 
 ### Sentry
 
@@ -155,6 +315,3 @@ try:
 except (ImportError, ValueError):
     pass
 
-
-import eventlet
-eventlet.monkey_patch()
@@ -0,0 +1,185 @@
+""" Timing of the stages of a request
+
+Code that should be timed is wrapped in ``with timed('stage'):``. The
+durations are collected per request and sent in a Server-Timing header (see
+with_server_timing), logged per feed (see timed_feed) and aggregated into
+histograms per stage.
+
+Timing is only active if settings.TIMING_ENABLED is set; otherwise timed()
+returns a shared no-op context manager, so that instrumented code costs no
+more than a function call. Timings are stored per (green) thread, and have to
+be passed on explicitly to green threads that work on the same request (see
+use_timings). """
+
+import time
+import bisect
+import logging
+import threading
+import functools
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# upper bounds (in seconds) of the histogram buckets
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10,
+           float('inf'))
+
+
+class Histogram(object):
+    """ Counts of durations in BUCKETS, their sum and count """
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+# histograms of all stages in this process, by stage
+HISTOGRAMS = {}
+
+
+def observe(stage, seconds):
+    histogram = HISTOGRAMS.get(stage)
+    if histogram is None:
+        histogram = HISTOGRAMS[stage] = Histogram()
+    histogram.observe(seconds)
+
+
+class Timings(object):
+    """ The durations of the stages of a request, or of a feed in it """
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.durations = OrderedDict()
+
+    def add(self, stage, seconds):
+        self.durations[stage] = self.durations.get(stage, 0) + seconds
+        if self.parent is not None:
+            self.parent.add(stage, seconds)
+        else:
+            observe(stage, seconds)
+
+    def get_header(self):
+        """ Returns the value of the Server-Timing header """
+        return ', '.join('%s;dur=%.1f' % (stage, seconds * 1000)
+                         for stage, seconds in self.durations.items())
+
+    def format(self):
+        return ' '.join('%s=%.1fms' % (stage, seconds * 1000)
+                        for stage, seconds in self.durations.items())
+
+
+class Timer(object):
+
+    def __init__(self, timings, stage):
+        self.timings = timings
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.timings.add(self.stage, time.perf_counter() - self.start)
+
+
+class NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def get_timings():
+    """ Returns the timings of the current request, or None """
+    return getattr(_local, 'timings', None)
+
+
+def timed(stage):
+    """ Returns a context manager that times the stage """
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        return NULL_TIMER
+    return Timer(timings, stage)
+
+
+def add(stage, seconds):
+    """ Adds a duration that has been measured elsewhere """
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+class use_timings(object):
+    """ Collects the timings of the current green thread into timings """
+
+    def __init__(self, timings):
+        self.timings = timings
+
+    def __enter__(self):
+        self.previous = getattr(_local, 'timings', None)
+        _local.timings = self.timings
+        return self.timings
+
+    def __exit__(self, exc_type, exc_value, tb):
+        _local.timings = self.previous
+
+
+class timed_feed(object):
+    """ Collects the timings of one feed, and logs them when it is done """
+
+    def __init__(self, url):
+        self.url = url
+
+    def __enter__(self):
+        self.parent = getattr(_local, 'timings', None)
+        if self.parent is None:
+            return None
+
+        self.start = time.perf_counter()
+        _local.timings = Timings(self.parent)
+        return _local.timings
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.parent is None:
+            return
+
+        timings, _local.timings = _local.timings, self.parent
+        total = time.perf_counter() - self.start
+        logger.info('feed=%s total=%.1fms %s%s', self.url, total * 1000,
+                    timings.format(), ' error=%s' % exc_type.__name__
+                    if exc_type else '')
+
+
+def with_server_timing(view_func):
+    """ Times the view and adds the Server-Timing header to its response """
+
+    @functools.wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not settings.TIMING_ENABLED:
+            return view_func(request, *args, **kwargs)
+
+        start = time.perf_counter()
+        with use_timings(Timings()) as timings:
+            response = view_func(request, *args, **kwargs)
+
+        timings.add('total', time.perf_counter() - start)
+        response['Server-Timing'] = timings.get_header()
+        return response
+
+    return wrapper
@@ -1,6 +1,7 @@
 from django.urls import path
 
-from feedservice.webservice.views import ParseView, IndexView
+from feedservice.webservice.views import ParseView, BatchParseView, \
+    IndexView, MetricsView, WebSubView
 
 urlpatterns = [
 
@@ -8,4 +9,10 @@ urlpatterns = [
 
     path('parse',       ParseView.as_view(),     name='parse'),
 
+    path('parse/batch', BatchParseView.as_view(), name='parse-batch'),
+
+    path('metrics',     MetricsView.as_view(),   name='metrics'),
+
+    path('websub',      WebSubView.as_view(),    name='websub'),
+
 ]
@@ -18,27 +18,36 @@
 
 import sys
 import time
+import calendar
+import functools
 from itertools import chain
 import collections
 import urllib.parse
 import re
 from html.entities import entitydefs
 import io
+import tempfile
 import http.client as httplib
 
 from django.conf import settings
 
 import requests
-from PIL import Image, ImageDraw
 urlparse = urllib.parse
 
 import eventlet
 
+from feedservice import hostlimits, metrics, timing
+
 from urllib.request import (build_opener, HTTPPasswordMgrWithDefaultRealm,
     HTTPBasicAuthHandler, Request)
 
 unicode = str
 
+# bytes that are read from a response at a time
+FETCH_CHUNK_SIZE = 64 * 1024
+
+FEED_ACCEPT = 'application/rss+xml,application/xml;q=0.9,*/*;q=0.8'
+
 
 def _get_requests_defaults():
     s = requests.Session()
@@ -48,7 +57,15 @@ def _get_requests_defaults():
     return s
 
 
-requests = _get_requests_defaults()
+_session = None
+
+
+def get_session():
+    """ Returns the shared requests session, which is created on first use """
+    global _session
+    if _session is None:
+        _session = _get_requests_defaults()
+    return _session
 
 
 try:
@@ -78,21 +95,144 @@ def parse_time(value):
     if value is None:
         raise ValueError('None value in parse_time')
 
+    seconds = parse_duration(value)
+    if seconds is None:
+        raise ValueError('invalid duration: %r' % (value,))
+
+    return seconds
+
+
+def parse_duration(value):
+    """ Returns the seconds of a duration, or None if it is invalid
+
+    Durations are given in seconds, or as [[H:]M:]S, where the seconds can
+    have a fraction (which is dropped) and the first part can exceed 24 hours
+    or 60 minutes. Unlike parse_time, this does not raise exceptions.
+
+    >>> parse_duration('1:05:10.5')
+    3910
+    >>> parse_duration('90:00')
+    5400
+    >>> parse_duration('1 hour') is None
+    True
+    """
+
     if isinstance(value, int):
-        # Don't need to parse already-converted time value
         return value
 
-    if value == '':
-        raise ValueError('Empty valueing in parse_time')
+    if not isinstance(value, str):
+        return None
+
+    parts = value.split(':')
+    if len(parts) > 3:
+        return None
+
+    seconds = 0
+    for part in parts[:-1]:
+        part = part.strip()
+        if not part.isdecimal():
+            return None
+        seconds = seconds * 60 + int(part)
+
+    whole, _, fraction = parts[-1].strip().partition('.')
+    if not whole.isdecimal() or (fraction and not fraction.isdecimal()):
+        return None
+
+    return seconds * 60 + int(whole)
+
+
+RFC822_RE = re.compile(
+    r'\s*(?:[A-Za-z]+,?\s*)?(\d{1,2})\s+([A-Za-z]{3})[A-Za-z]*\.?\s+(\d{4})'
+    r'\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s*([+-]\d{4}|[A-Za-z]+)?\s*$')
 
-    for format in ('%H:%M:%S', '%M:%S'):
-        try:
-            t = time.strptime(value, format)
-            return t.tm_hour * 60*60 + t.tm_min * 60 + t.tm_sec
-        except (ValueError, TypeError):
-            continue
+ISO8601_RE = re.compile(
+    r'\s*(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.\d+)?)?'
+    r'\s*(Z|[+-]\d{2}:?\d{2})?)?\s*$')
 
-    return int(value)
+MONTHS = dict((name, n) for n, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct',
+     'nov', 'dec'), 1))
+
+# offsets of the time zone names of RFC 822, in hours
+TIMEZONES = {'gmt': 0, 'ut': 0, 'utc': 0, 'z': 0, 'est': -5, 'edt': -4,
+             'cst': -6, 'cdt': -5, 'mst': -7, 'mdt': -6, 'pst': -8,
+             'pdt': -7}
+
+
+def parse_date(value):
+    """ Returns the UTC timestamp of an RFC 822 or ISO 8601 date, or None
+
+    Dates without a time zone are taken as UTC. Other formats, and dates
+    that this does not understand, return None, so that a more thorough
+    parser can be tried.
+
+    >>> parse_date('Mon, 19 Oct 2026 10:00:00 +0200')
+    1792396800
+    >>> parse_date('2026-10-19T08:00:00Z')
+    1792396800
+    """
+
+    m = RFC822_RE.match(value)
+    if m:
+        day, month, year, hour, minute, second, zone = m.groups()
+        month = MONTHS.get(month.lower())
+        offset = get_timezone_offset(zone)
+
+    else:
+        m = ISO8601_RE.match(value)
+        if not m:
+            return None
+
+        year, month, day, hour, minute, second, zone = m.groups()
+        month = int(month)
+        offset = get_timezone_offset(zone)
+
+    if month is None or offset is None:
+        return None
+
+    year, day, hour = int(year), int(day), int(hour or 0)
+    minute, second = int(minute or 0), int(second or 0)
+
+    if not (1 <= year and 1 <= month <= 12 and hour < 24 and minute < 60 and
+            second < 60):
+        return None
+
+    if not 1 <= day <= 28 and \
+            not 1 <= day <= calendar.monthrange(year, month)[1]:
+        return None
+
+    return utc_timestamp((year, month, day, hour, minute, second)) - offset
+
+
+def utc_timestamp(t):
+    """ Returns the timestamp of a UTC time tuple, like calendar.timegm
+
+    >>> utc_timestamp((2026, 10, 19, 8, 0, 0))
+    1792396800
+    """
+    return get_month_start(t[0], t[1]) + (t[2] - 1) * 86400 + \
+        t[3] * 3600 + t[4] * 60 + t[5]
+
+
+@functools.lru_cache(maxsize=256)
+def get_month_start(year, month):
+    """ Returns the UTC timestamp of the start of a month """
+    return calendar.timegm((year, month, 1, 0, 0, 0))
+
+
+def get_timezone_offset(zone):
+    """ Returns the offset of a time zone in seconds, or None if unknown """
+
+    if not zone:
+        return 0
+
+    if zone[0] in '+-':
+        digits = zone[1:].replace(':', '')
+        offset = int(digits[:2]) * 3600 + int(digits[2:]) * 60
+        return -offset if zone[0] == '-' else offset
+
+    hours = TIMEZONES.get(zone.lower())
+    return None if hours is None else hours * 3600
 
 
 # from http://stackoverflow.com/questions/2892931/longest-common-substring-from-more-than-two-strings-python
@@ -187,26 +327,133 @@ def remove_html_tags(html):
 class NotModified(Exception):
     """ raised instead of HTTPException with code 304 """
 
+    def __init__(self, max_age=None):
+        super(NotModified, self).__init__(max_age)
+        self.max_age = max_age
+
+
+class ResponseTooLarge(ValueError):
+    """ raised when a response body is larger than FETCH_MAX_SIZE """
+
 
-def fetch_url(url, mod_since_utc=None):
+class UnsupportedContentType(ValueError):
+    """ raised when a response has a Content-Type that can't be a feed """
+
+
+def fetch_url(url, mod_since_utc=None, etag=None):
     """
-    Fetches the given URL and stores the resulting object in the Cache
+    Fetches the given URL, conditionally if mod_since_utc or etag are given
+
+    The body is streamed into resp.body, a file that is kept in memory up
+    to FETCH_SPOOL_SIZE bytes and spilled to disk beyond; resp.body_size is
+    its size. The body is not decoded; resp.declared_encoding is the charset
+    of the Content-Type header, if any. Raises ResponseTooLarge if the body
+    is larger than FETCH_MAX_SIZE, and UnsupportedContentType for media files
+    (see FETCH_REJECTED_CONTENT_TYPES), without downloading them.
+
+    Concurrent fetches from the same host are limited (see
+    feedservice.hostlimits).
     """
 
     headers = {}
 
     # TODO: how to handle redirect in requests?
     headers['User-Agent'] = ''
+    headers['Accept'] = FEED_ACCEPT
 
     if mod_since_utc:
         headers['If-Modified-Since'] = mod_since_utc
 
+    if etag:
+        headers['If-None-Match'] = etag
+
     timeout = settings.FETCH_TIMEOUT
 
     # timeout for full download, see
     # https://stackoverflow.com/a/22096841/693140
-    with eventlet.Timeout(timeout):
-        return requests.get(url, headers=headers)
+    start = time.perf_counter()
+
+    try:
+        with eventlet.Timeout(timeout), timing.timed('fetch'), \
+                hostlimits.limited(url) as host_limit:
+            resp = get_session().get(url, headers=headers, stream=True)
+            host_limit.record(resp)
+
+            try:
+                if resp.status_code == 200:
+                    check_content_type(resp)
+                resp.body, resp.body_size = read_body(resp)
+                resp.declared_encoding = get_declared_encoding(resp.headers)
+
+            finally:
+                resp.close()
+
+    except BaseException:
+        metrics.record_fetch(url, 'error', time.perf_counter() - start)
+        raise
+
+    metrics.record_fetch(url, resp.status_code, time.perf_counter() - start,
+                         resp.body_size)
+
+    # the time until the response headers have been parsed
+    timing.add('fetch-ttfb', resp.elapsed.total_seconds())
+    return resp
+
+
+def check_content_type(resp):
+    content_type = resp.headers.get('Content-Type', '').lower()
+    if content_type.startswith(settings.FETCH_REJECTED_CONTENT_TYPES):
+        raise UnsupportedContentType('not a feed: %s' % content_type)
+
+
+def get_declared_encoding(headers):
+    """ Returns the charset of the Content-Type header, or None
+
+    Unlike requests, this does not default to ISO-8859-1 for text types, so
+    that decoders can fall back to the encoding declared in the document.
+
+    >>> get_declared_encoding({'Content-Type': 'text/xml; charset="UTF-8"'})
+    'UTF-8'
+    >>> get_declared_encoding({'Content-Type': 'text/html'}) is None
+    True
+    """
+
+    content_type = headers.get('Content-Type', '')
+
+    for param in content_type.split(';')[1:]:
+        name, _, value = param.partition('=')
+        if name.strip().lower() == 'charset':
+            return value.strip().strip('"\'') or None
+
+    return None
+
+
+def read_body(resp):
+    """ Reads the body of a streamed response into a temporary file
+
+    Returns the file, positioned at its start, and its size. """
+
+    max_size = settings.FETCH_MAX_SIZE
+    too_large = 'response larger than %d bytes' % max_size
+
+    length = resp.headers.get('Content-Length', '')
+    if length.isdigit() and int(length) > max_size:
+        raise ResponseTooLarge(too_large)
+
+    body = tempfile.SpooledTemporaryFile(max_size=settings.FETCH_SPOOL_SIZE)
+    size = 0
+
+    # the size is checked after decoding, so compressed bodies count with
+    # their decompressed size
+    for chunk in resp.iter_content(FETCH_CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            body.close()
+            raise ResponseTooLarge(too_large)
+        body.write(chunk)
+
+    body.seek(0)
+    return body, size
 
 
 def basic_sanitizing(url):
@@ -278,6 +525,9 @@ def transform_image(content, mtype, size, img_format):
     the resulting bytes and mimetype
     """
 
+    # PIL is only needed for inlined logos
+    from PIL import Image, ImageDraw
+
     content_io = io.StringIO(content)
     img = Image.open(content_io)
 
@@ -0,0 +1,253 @@
+""" Content-Encoding negotiation, ETags and conditional responses
+
+Responses are compressed with the best encoding that the client accepts;
+brotli and zstd are only offered if the respective modules are installed.
+Streaming responses are compressed chunk by chunk, flushing the compressor
+after each chunk so that clients can process data as it arrives. """
+
+import zlib
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from feedservice import timing
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Compressors return compressed data for compress(), the data that is pending
+# in the compressor for flush() and the remaining data for finish(), after
+# which they can not be used anymore
+
+class GzipCompressor(object):
+
+    def __init__(self, level):
+        # wbits=31 produces a gzip header and trailer
+        self.obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.obj.compress(data)
+
+    def flush(self):
+        return self.obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.obj.flush(zlib.Z_FINISH)
+
+
+class BrotliCompressor(object):
+
+    def __init__(self, level):
+        self.obj = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self.obj.process(data)
+
+    def flush(self):
+        return self.obj.flush()
+
+    def finish(self):
+        return self.obj.finish()
+
+
+class ZstdCompressor(object):
+
+    def __init__(self, level):
+        self.obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self.obj.compress(data)
+
+    def flush(self):
+        return self.obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self.obj.flush()
+
+
+def get_compressors():
+    """ Returns the available compressors by their Content-Encoding """
+    compressors = {}
+
+    if zstandard is not None:
+        compressors['zstd'] = ZstdCompressor
+
+    if brotli is not None:
+        compressors['br'] = BrotliCompressor
+
+    compressors['gzip'] = GzipCompressor
+    return compressors
+
+
+COMPRESSORS = get_compressors()
+
+
+def parse_accept_encoding(accept_encoding):
+    """ Returns the q value of each content-coding in an Accept-Encoding
+    header value
+
+    Parameters other than q are ignored, as are codings with invalid q
+    values.
+
+    >>> parse_accept_encoding('gzip; q=0.5, br;q=1.0;foo=1, *;q=0')
+    {'gzip': 0.5, 'br': 1.0, '*': 0.0}
+    """
+
+    codings = {}
+
+    for item in accept_encoding.split(','):
+        params = [param.strip() for param in item.split(';')]
+        coding, q = params[0].lower(), 1.0
+        if not coding:
+            continue
+
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = None
+
+        if q is not None and 0 <= q <= 1:
+            codings[coding] = q
+
+    return codings
+
+
+def select_encoding(accept_encoding):
+    """ Returns the Content-Encoding for the Accept-Encoding header value
+
+    The coding with the highest q value is selected; codings with q=0 are
+    not acceptable, and codings that are not listed get the q value of *,
+    if given. Between codings with the same q value, the compressors are
+    preferred in the order of COMPRESSORS.
+
+    Returns 'identity' if the response should not be compressed, which is
+    also the case if no compressor is acceptable. """
+
+    if not accept_encoding:
+        return 'identity'
+
+    codings = parse_accept_encoding(accept_encoding)
+
+    def get_q(coding):
+        if coding in codings:
+            return codings[coding]
+        return codings.get('*', 0.0)
+
+    supported = list(COMPRESSORS) + ['identity']
+    # max returns the first of the codings with the highest q value
+    encoding = max(supported, key=get_q)
+    return encoding if get_q(encoding) > 0 else 'identity'
+
+
+def compress(data, encoding, level=None):
+    """ Compresses data (bytes) with the given Content-Encoding """
+    if level is None:
+        level = settings.COMPRESSION_LEVELS[encoding]
+    compressor = COMPRESSORS[encoding](level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def compress_stream(chunks, encoding, level=None):
+    """ Compresses an iterable of byte chunks with the given encoding """
+    if level is None:
+        level = settings.COMPRESSION_LEVELS[encoding]
+    compressor = COMPRESSORS[encoding](level)
+
+    for chunk in chunks:
+        # flush after each chunk, so that it can be decompressed right away
+        data = compressor.compress(chunk) + compressor.flush()
+        if data:
+            yield data
+
+    yield compressor.finish()
+
+
+def get_etag(digest, encoding):
+    """ Returns a strong ETag for the payload digest and its encoding
+
+    Each encoding is a different representation, so it gets its own ETag. """
+    if encoding == 'identity':
+        return '"%s"' % digest
+    return '"%s-%s"' % (digest, encoding)
+
+
+def get_digest(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def etag_matches(if_none_match, digest):
+    """ Returns True if the If-None-Match header matches the digest
+
+    As required for If-None-Match, the comparison is weak, ie an ETag of any
+    encoding of the same payload matches. """
+
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == '*':
+        return True
+
+    for etag in if_none_match.split(','):
+        etag = etag.strip()
+        if etag.startswith('W/'):
+            etag = etag[2:]
+        etag = etag.strip('"').split('-', 1)[0]
+        if etag == digest:
+            return True
+
+    return False
+
+
+def finalize_response(request, response):
+    """ Adds ETag, handles If-None-Match and compresses the response
+
+    Returns the response that should be sent, which is a 304 response if the
+    client already has the current payload. """
+
+    if response.status_code != 200:
+        return response
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = select_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+    if response.streaming:
+        if encoding != 'identity':
+            response.streaming_content = compress_stream(
+                response.streaming_content, encoding)
+            response['Content-Encoding'] = encoding
+        return response
+
+    digest = get_digest(response.content)
+
+    if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+        encoding = 'identity'
+
+    etag = get_etag(digest, encoding)
+
+    if etag_matches(request.META.get('HTTP_IF_NONE_MATCH'), digest):
+        not_modified = HttpResponseNotModified()
+        not_modified['ETag'] = etag
+        not_modified['Vary'] = response['Vary']
+        return not_modified
+
+    if encoding != 'identity':
+        with timing.timed('compress'):
+            response.content = compress(response.content, encoding)
+        response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Content-Length'] = str(len(response.content))
+    return response
@@ -0,0 +1,95 @@
+""" Response formats for parsed feeds
+
+All formats are produced from the same representation of the parsed
+objects (see feedservice.webservice.utils). Besides JSON, feeds can be
+returned as MessagePack or CBOR (if the respective modules are installed),
+and as newline-delimited JSON with one element per line, which is streamed
+so that clients can process feeds as they arrive. """
+
+import json
+import time
+
+from django.http import HttpResponse, StreamingHttpResponse
+
+from feedservice import metrics, timing
+from feedservice.webservice.utils import ObjectEncoder, to_builtin
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+def dumps_json(data, fields=None):
+    return json.dumps(data, sort_keys=True, indent=None,
+                      separators=(',', ':'), cls=ObjectEncoder,
+                      fields=fields).encode('utf-8')
+
+
+def dumps_msgpack(data, fields=None):
+    return msgpack.packb(to_builtin(data, fields), use_bin_type=True)
+
+
+def dumps_cbor(data, fields=None):
+    return cbor2.dumps(to_builtin(data, fields))
+
+
+def iter_ndjson(items, fields=None):
+    """ Yields one line of JSON for each item """
+    for item in items:
+        yield dumps_json(item, fields) + b'\n'
+
+
+def get_formats():
+    """ Returns the available serializers by their content type
+
+    Serializers return the encoded data as bytes, or an iterable of bytes
+    for formats that are streamed. """
+
+    formats = {
+        'application/json': dumps_json,
+        'application/x-ndjson': iter_ndjson,
+    }
+
+    if msgpack is not None:
+        formats['application/msgpack'] = dumps_msgpack
+        formats['application/x-msgpack'] = dumps_msgpack
+
+    if cbor2 is not None:
+        formats['application/cbor'] = dumps_cbor
+
+    return formats
+
+
+FORMATS = get_formats()
+
+STREAMING_FORMATS = ('application/x-ndjson', )
+
+
+def get_response(data, content_type, fields=None):
+    """ Returns a response with the data in the given format
+
+    data is the list of elements to return; content_type has to be one of
+    FORMATS. """
+
+    serializer = FORMATS[content_type]
+
+    if content_type in STREAMING_FORMATS:
+        # serialized while the response is sent, ie after it has been timed
+        response = StreamingHttpResponse(serializer(data, fields))
+    else:
+        start = time.perf_counter()
+        with timing.timed('encode'):
+            content = serializer(data, fields)
+
+        metrics.record_encode(content_type, time.perf_counter() - start,
+                              len(content))
+        response = HttpResponse(content)
+
+    response['Content-Type'] = content_type
+    return response
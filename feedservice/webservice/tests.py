@@ -0,0 +1,525 @@
+import os
+import gzip
+import hmac
+import json
+import hashlib
+import marshal
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from urllib.parse import parse_qs, urlencode
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from feedservice import metrics, timing
+from feedservice.parse import parse_feed, websub, cache as feed_cache
+from feedservice.parse.prefetch import Prefetcher, ScheduledFeed
+from feedservice.parse.tests import FeedServerMixin, RSS_FEED
+from feedservice.webservice import compression
+from feedservice.webservice.compression import compress_stream, \
+    select_encoding
+from feedservice.webservice.formats import msgpack, cbor2
+
+class BatchParseTest(FeedServerMixin, TestCase):
+
+    def post_batch(self, items):
+        return self.client.post(reverse('parse-batch'), json.dumps(items),
+                                content_type='application/json')
+
+    def test_batch(self):
+        resp = self.post_batch([
+            {'url': self.url, 'max_episodes': 0},
+            {'url': self.url, 'process_text': 'strip_html'},
+        ])
+        self.assertEqual(resp.status_code, 200)
+
+        results = resp.json()
+        self.assertEqual([r['status'] for r in results], [200, 200])
+        self.assertEqual(results[0]['feed']['episodes'], [])
+        self.assertEqual(len(results[1]['feed']['episodes']), 1)
+
+    def test_not_modified(self):
+        resp = self.post_batch([{'url': self.url}])
+        etag = resp.json()[0]['feed']['http_etag']
+
+        resp = self.post_batch([{'url': self.url, 'etag': etag}])
+        self.assertEqual(resp.json(), [{'url': self.url, 'status': 304}])
+
+    def test_cursor(self):
+        resp = self.post_batch([{'url': self.url}])
+        cursor = resp.json()[0]['feed']['cursor']
+
+        resp = self.post_batch([{'url': self.url, 'cursor': cursor}])
+        feed = resp.json()[0]['feed']
+        self.assertTrue(feed['delta'])
+        self.assertEqual(feed['episodes'], [])
+
+    def test_invalid_request(self):
+        for body in ({'url': self.url}, [], [{'etag': 'x'}],
+                     [{'url': self.url, 'max_episodes': 'all'}],
+                     [{'url': self.url, 'cursor': 1}],
+                     [{'url': self.url, 'etag': ['x']}],
+                     [{'url': self.url, 'last_modified': 12345}]):
+            resp = self.post_batch(body)
+            self.assertEqual(resp.status_code, 400)
+
+
+class ParseTest(FeedServerMixin, TestCase):
+
+    def parse(self, **params):
+        return self.client.get(reverse('parse'), params,
+                               HTTP_ACCEPT='application/json')
+
+    def test_per_feed_etag(self):
+        other_url = self.url + '?other'
+        feed = self.parse(url=self.url).json()[0]
+
+        resp = self.parse(url=[self.url, other_url],
+                          etag=[feed['http_etag'], ''])
+        unchanged, changed = resp.json()
+
+        self.assertTrue(unchanged['not_modified'])
+        self.assertEqual(unchanged['urls'], [self.url])
+        self.assertEqual(unchanged['http_etag'], feed['http_etag'])
+        self.assertNotIn('not_modified', changed)
+        self.assertEqual(changed['title'], 'Test Podcast')
+
+    def test_fields(self):
+        resp = self.parse(url=self.url,
+                          fields='title,episodes(short_title,number)')
+        feed, = resp.json()
+
+        self.assertEqual(set(feed), {'title', 'episodes', 'urls', 'errors',
+                                     'warnings'})
+        self.assertEqual(feed['episodes'], [{'short_title': 'First Episode',
+                                             'number': 1}])
+
+    def test_fields_cursor(self):
+        fields = 'title,episodes(guid),cursor'
+        feed, = self.parse(url=self.url, fields=fields).json()
+
+        resp = self.parse(url=self.url, fields=fields, cursor=feed['cursor'])
+        unchanged, = resp.json()
+        self.assertTrue(unchanged['delta'])
+        self.assertEqual(unchanged['episodes'], [])
+        self.assertEqual(unchanged['cursor'], feed['cursor'])
+
+        # the cursor is used even if it is not selected
+        resp = self.parse(url=self.url, fields='title,episodes(guid)',
+                          cursor=feed['cursor'])
+        unchanged, = resp.json()
+        self.assertTrue(unchanged['delta'])
+        self.assertNotIn('cursor', unchanged)
+
+    def test_cursor(self):
+        feed = self.parse(url=self.url).json()[0]
+        self.assertEqual(len(feed['episodes']), 1)
+
+        resp = self.parse(url=self.url, cursor=feed['cursor'], use_cache=0)
+        unchanged, = resp.json()
+        self.assertTrue(unchanged['delta'])
+        self.assertEqual(unchanged['episodes'], [])
+        self.assertEqual(unchanged['removed_episodes'], [])
+        self.assertEqual(unchanged['cursor'], feed['cursor'])
+
+        resp = self.parse(url=self.url, cursor='unknown')
+        full, = resp.json()
+        self.assertNotIn('delta', full)
+        self.assertEqual(len(full['episodes']), 1)
+
+    def test_invalid_fields(self):
+        resp = self.parse(url=self.url, fields='episodes(')
+        self.assertEqual(resp.status_code, 400)
+
+
+class TimingTest(FeedServerMixin, TestCase):
+
+    def parse(self):
+        return self.client.get(reverse('parse'), {'url': self.url},
+                               HTTP_ACCEPT='application/json')
+
+    def test_disabled(self):
+        resp = self.parse()
+        self.assertNotIn('Server-Timing', resp)
+        self.assertIs(timing.timed('fetch'), timing.NULL_TIMER)
+
+    @override_settings(TIMING_ENABLED=True)
+    def test_server_timing(self):
+        with self.assertLogs('feedservice.timing', 'INFO') as logs:
+            resp = self.parse()
+
+        stages = dict(metric.split(';dur=')
+                      for metric in resp['Server-Timing'].split(', '))
+        self.assertTrue({'fetch', 'parse', 'episodes', 'encode',
+                         'total'} <= set(stages))
+        self.assertTrue(all(float(dur) >= 0 for dur in stages.values()))
+
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('feed=%s' % self.url, logs.output[0])
+        self.assertIn(' parse=', logs.output[0])
+
+    @override_settings(TIMING_ENABLED=True)
+    def test_batch(self):
+        count = timing.HISTOGRAMS.get('parse', timing.Histogram()).count
+        with self.assertLogs('feedservice.timing', 'INFO') as logs:
+            resp = self.client.post(reverse('parse-batch') + '?use_cache=0',
+                                    json.dumps([{'url': self.url}] * 2),
+                                    content_type='application/json')
+
+        self.assertIn('parse;dur=', resp['Server-Timing'])
+        self.assertEqual(timing.HISTOGRAMS['parse'].count, count + 2)
+        self.assertEqual(len(logs.records), 2)
+
+
+@unittest.skipIf(metrics.prometheus_client is None,
+                 'prometheus_client is not installed')
+class MetricsTest(FeedServerMixin, TestCase):
+
+    def get_sample(self, name, **labels):
+        registry = metrics.prometheus_client.REGISTRY
+        return registry.get_sample_value(name, labels) or 0
+
+    def test_metrics(self):
+        fetches = self.get_sample('feedservice_fetches_total', host='ip',
+                                  status='200')
+        parsed = self.get_sample('feedservice_feed_episodes_count',
+                                 parser='Feedparser')
+
+        self.client.get(reverse('parse'), {'url': self.url, 'use_cache': 0},
+                        HTTP_ACCEPT='application/json')
+
+        resp = self.client.get(reverse('metrics'))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'feedservice_fetch_duration_seconds_bucket',
+                      resp.content)
+
+        self.assertGreater(self.get_sample('feedservice_fetches_total',
+                                           host='ip', status='200'), fetches)
+        self.assertEqual(self.get_sample('feedservice_feed_episodes_count',
+                                         parser='Feedparser'), parsed + 1)
+
+    @override_settings(METRICS_MAX_HOSTS=2)
+    def test_host_label(self):
+        metrics._hosts.clear()
+        self.assertEqual(metrics.get_host_label('http://127.0.0.1/'), 'ip')
+        self.assertEqual(metrics.get_host_label(
+            'http://feeds.example.com/podcast.xml'), 'example.com')
+        self.assertEqual(metrics.get_host_label('http://www.example.com/'),
+                         'example.com')
+        self.assertEqual(metrics.get_host_label('http://example.org/'),
+                         'example.org')
+        self.assertEqual(metrics.get_host_label('http://example.net/'),
+                         'other')
+
+
+@override_settings(PROFILING_TOKEN='secret')
+class ProfilingTest(FeedServerMixin, TestCase):
+
+    def parse(self, profile, token='secret'):
+        return self.client.get(reverse('parse'),
+                               {'url': self.url, 'profile': profile},
+                               HTTP_X_PROFILING_TOKEN=token)
+
+    def test_forbidden(self):
+        self.assertEqual(self.parse('cprofile', token='wrong').status_code,
+                         403)
+
+        with override_settings(PROFILING_TOKEN=''):
+            self.assertEqual(self.parse('cprofile', token='').status_code,
+                             403)
+
+    def test_cprofile(self):
+        resp = self.parse('cprofile')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn(b'function calls', resp.content)
+        self.assertIn(b'parse_feed', resp.content)
+
+        resp = self.parse('pstats')
+        stats = marshal.loads(resp.content)
+        self.assertTrue(any(func == 'parse_feeds' for _, _, func in stats))
+
+    def test_speedscope(self):
+        resp = self.parse('speedscope')
+        profile = resp.json()
+        self.assertEqual(profile['profiles'][0]['type'], 'sampled')
+
+        frames = profile['shared']['frames']
+        for sample in profile['profiles'][0]['samples']:
+            self.assertTrue(all(0 <= n < len(frames) for n in sample))
+
+    def test_unknown_profile(self):
+        self.assertEqual(self.parse('flamegraph').status_code, 400)
+
+    def test_slow_requests(self):
+        with tempfile.TemporaryDirectory() as slow_dir, \
+                override_settings(PROFILING_SLOW_DIR=slow_dir,
+                                  PROFILING_SLOW_SAMPLE_RATE=1,
+                                  PROFILING_SLOW_THRESHOLD=0):
+            resp = self.client.get(reverse('parse'), {'url': self.url},
+                                   HTTP_ACCEPT='application/json')
+            self.assertEqual(resp.json()[0]['title'], 'Test Podcast')
+
+            filename, = os.listdir(slow_dir)
+            with open(os.path.join(slow_dir, filename)) as f:
+                profile = json.load(f)
+            self.assertIn(self.url, profile['name'])
+
+
+class CompressionTest(FeedServerMixin, TestCase):
+
+    @override_settings(COMPRESSION_MIN_SIZE=0)
+    def test_gzip(self):
+        resp = self.client.get(reverse('parse'), {'url': self.url},
+                               HTTP_ACCEPT='application/json',
+                               HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertTrue(resp['ETag'].endswith('-gzip"'))
+
+        feeds = json.loads(gzip.decompress(resp.content))
+        self.assertEqual(feeds[0]['title'], 'Test Podcast')
+
+    def test_if_none_match(self):
+        resp = self.client.get(reverse('parse'), {'url': self.url},
+                               HTTP_ACCEPT='application/json')
+        self.assertNotIn('Content-Encoding', resp)
+
+        resp = self.client.get(reverse('parse'), {'url': self.url},
+                               HTTP_ACCEPT='application/json',
+                               HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.content, b'')
+
+    def test_select_encoding(self):
+        self.assertEqual(select_encoding(''), 'identity')
+        self.assertEqual(select_encoding('gzip;q=0.5, deflate'), 'gzip')
+        self.assertEqual(select_encoding('compress'), 'identity')
+
+    @mock.patch.dict(compression.COMPRESSORS, clear=True,
+                     br=compression.BrotliCompressor,
+                     gzip=compression.GzipCompressor)
+    def test_accept_encoding(self):
+        for accept_encoding, encoding in [
+                ('gzip;q=0', 'identity'),
+                ('gzip; q=0.5, br; q=1.0', 'br'),
+                ('br;q=0.5 , GZIP ; Q=0.8', 'gzip'),
+                ('gzip;q=1.0;foo=1', 'gzip'),
+                ('gzip;foo, br;q=0.1', 'gzip'),
+                ('gzip;q=high, br;q=2', 'identity'),
+                ('gzip, br', 'br'),
+                ('*', 'br'),
+                ('*;q=0.5, br;q=0', 'gzip'),
+                ('identity;q=0, gzip;q=0.1', 'gzip'),
+                ('identity;q=0, *;q=0', 'identity'),
+                ('gzip;q=0.5, identity;q=0.8', 'identity'),
+                (',;q=1, gzip', 'gzip')]:
+            self.assertEqual(select_encoding(accept_encoding), encoding,
+                             accept_encoding)
+
+    def test_compress_stream(self):
+        chunks = [b'[', b'{"a":1}', b']']
+        data = b''.join(compress_stream(chunks, 'gzip', 6))
+        self.assertEqual(gzip.decompress(data), b''.join(chunks))
+
+
+class FormatsTest(FeedServerMixin, TestCase):
+    """ All formats contain the same data as JSON """
+
+    def parse(self, accept, **params):
+        params.setdefault('url', self.url)
+        return self.client.get(reverse('parse'), params, HTTP_ACCEPT=accept)
+
+    def assertRoundTrip(self, accept, loads, **params):
+        expected = self.parse('application/json', **params).json()
+
+        resp = self.parse(accept, **params)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], accept)
+        self.assertEqual(loads(resp), expected)
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        loads = lambda resp: msgpack.unpackb(resp.content, raw=False)
+        self.assertRoundTrip('application/msgpack', loads)
+        self.assertRoundTrip('application/msgpack', loads,
+                             fields='title,episodes(guid,files)')
+
+    @unittest.skipIf(cbor2 is None, 'cbor2 is not installed')
+    def test_cbor(self):
+        loads = lambda resp: cbor2.loads(resp.content)
+        self.assertRoundTrip('application/cbor', loads)
+        self.assertRoundTrip('application/cbor', loads,
+                             fields='title,episodes(guid,files)')
+
+    def test_ndjson(self):
+        def loads(resp):
+            content = b''.join(resp.streaming_content)
+            return [json.loads(line) for line in content.splitlines()]
+
+        self.assertRoundTrip('application/x-ndjson', loads,
+                             url=[self.url, self.url + '?other'])
+
+    def test_batch_ndjson(self):
+        resp = self.client.post(reverse('parse-batch'),
+                                json.dumps([{'url': self.url}] * 3),
+                                content_type='application/json',
+                                HTTP_ACCEPT='application/x-ndjson')
+        self.assertTrue(resp.streaming)
+
+        lines = b''.join(resp.streaming_content).splitlines()
+        results = [json.loads(line) for line in lines]
+        self.assertEqual([r['status'] for r in results], [200] * 3)
+
+
+class HubHandler(BaseHTTPRequestHandler):
+    """ A stand-in WebSub hub that records the requests to subscribe """
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        params = parse_qs(self.rfile.read(length).decode('utf-8'))
+        self.server.subscriptions.append(
+            dict((key, values[0]) for key, values in params.items()))
+
+        self.send_response(202)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(WEBSUB_CALLBACK_URL='http://testserver/websub')
+class WebSubTest(FeedServerMixin, TestCase):
+
+    def setUp(self):
+        super(WebSubTest, self).setUp()
+
+        self.hub = HTTPServer(('127.0.0.1', 0), HubHandler)
+        self.hub.subscriptions = []
+        self.hub_thread = threading.Thread(target=self.hub.serve_forever)
+        self.hub_thread.start()
+
+        hub_url = 'http://127.0.0.1:%d/' % self.hub.server_port
+        self.server.body = RSS_FEED.replace(
+            b'<rss version="2.0">',
+            b'<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">'
+        ).replace(
+            b'<channel>',
+            b'<channel><atom:link rel="hub" href="%s"/>' % hub_url.encode())
+
+    def tearDown(self):
+        self.hub.shutdown()
+        self.hub.server_close()
+        self.hub_thread.join()
+        super(WebSubTest, self).tearDown()
+
+    def subscribe(self):
+        """ Lets the prefetcher subscribe, and verifies the subscription """
+
+        subscription = self.request_subscription()
+        resp = self.verify(subscription['hub.callback'])
+        self.assertEqual(resp.content, b'challenge')
+        return subscription
+
+    def request_subscription(self):
+        """ Lets the prefetcher subscribe, without verifying it """
+
+        prefetcher = Prefetcher(1, 1, 0, 0, 60, 60)
+        prefetcher.refresh(ScheduledFeed(self.url))
+
+        subscription = self.hub.subscriptions[-1]
+        self.assertEqual(subscription['hub.mode'], 'subscribe')
+        self.assertEqual(subscription['hub.topic'], self.url)
+        return subscription
+
+    def verify(self, callback, **params):
+        """ Requests the callback as the hub does to verify a subscription
+        """
+
+        params.setdefault('hub.mode', 'subscribe')
+        params.setdefault('hub.topic', self.url)
+        params.setdefault('hub.challenge', 'challenge')
+        params.setdefault('hub.lease_seconds', 3600)
+        return self.client.get(callback + '&' + urlencode(params))
+
+    def push(self, subscription, body, secret=None):
+        secret = secret or subscription['hub.secret']
+        digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return self.client.post(subscription['hub.callback'], body,
+                                content_type='application/rss+xml',
+                                HTTP_X_HUB_SIGNATURE='sha256=' + digest)
+
+    def test_push_updates_cache(self):
+        subscription = self.subscribe()
+
+        # further refreshes neither subscribe again, nor expire the feed
+        # before WEBSUB_MAX_AGE
+        prefetcher = Prefetcher(1, 1, 0, 0, 60, 60)
+        prefetcher.refresh(ScheduledFeed(self.url))
+        self.assertEqual(len(self.hub.subscriptions), 1)
+        self.assertEqual(feed_cache.get_entry(self.url).max_age,
+                         settings.WEBSUB_MAX_AGE)
+        requests = self.server.requests
+
+        body = self.server.body.replace(b'Test Podcast', b'Pushed Podcast')
+        resp = self.push(subscription, body)
+        self.assertEqual(resp.status_code, 202)
+
+        self.assertEqual(parse_feed(self.url, None).title, 'Pushed Podcast')
+        self.assertEqual(self.server.requests, requests)
+
+    def test_invalid_signature_ignored(self):
+        subscription = self.subscribe()
+
+        body = self.server.body.replace(b'Test Podcast', b'Forged Podcast')
+        resp = self.push(subscription, body, secret='guessed')
+        self.assertEqual(resp.status_code, 202)
+
+        self.assertEqual(parse_feed(self.url, None).title, 'Test Podcast')
+
+    def test_unexpected_verification(self):
+        callback = reverse('websub') + '?' + urlencode({'url': self.url})
+        resp = self.verify(callback)
+        self.assertEqual(resp.status_code, 404)
+
+        subscription = self.subscribe()
+        resp = self.verify(subscription['hub.callback'],
+                           **{'hub.mode': 'unsubscribe'})
+        self.assertEqual(resp.status_code, 404)
+
+    def test_unsolicited_verification(self):
+        subscription = self.request_subscription()
+
+        # the callback of another feed can not verify the subscription
+        other = reverse('websub') + '?' + urlencode({'url': self.url + 'x'})
+        resp = self.verify(other)
+        self.assertEqual(resp.status_code, 404)
+
+        resp = self.verify(subscription['hub.callback'])
+        self.assertEqual(resp.status_code, 200)
+
+        # once verified, the subscription is not pending anymore
+        resp = self.verify(subscription['hub.callback'],
+                           **{'hub.lease_seconds': 60})
+        self.assertEqual(resp.status_code, 404)
+        self.assertGreater(websub.get_subscription(self.url).expires,
+                           time.time() + 60)
+
+    def test_lease_seconds(self):
+        subscription = self.request_subscription()
+
+        for lease_seconds in ('abc', '-1', '0'):
+            resp = self.verify(subscription['hub.callback'],
+                               **{'hub.lease_seconds': lease_seconds})
+            self.assertEqual(resp.status_code, 404)
+
+        # oversized leases are shortened to the requested one
+        resp = self.verify(subscription['hub.callback'],
+                           **{'hub.lease_seconds': '9' * 400})
+        self.assertEqual(resp.status_code, 200)
+        expires = websub.get_subscription(self.url).expires
+        self.assertLessEqual(expires,
+                             time.time() + settings.WEBSUB_LEASE_SECONDS)
@@ -1,36 +1,85 @@
 from feedservice.utils import json
 
 from feedservice.parse.models import ParsedObject
-import collections
+from feedservice.parse.fields import get_nested
 
 
 class ObjectEncoder(json.JSONEncoder):
 
+    def __init__(self, *args, **kwargs):
+        # the selection of fields to encode, see feedservice.parse.fields
+        self.fields = kwargs.pop('fields', None)
+        super(ObjectEncoder, self).__init__(*args, **kwargs)
+
     def default(self, obj):
         if isinstance(obj, ParsedObject):
-            return self.to_dict(obj)
+            return to_dict(obj, self.fields)
 
         return json.JSONEncoder.default(self, obj)
 
 
-    def to_dict(self, obj):
-        """
-        Parses a feed and returns its JSON object, a list of urls that refer to
-        this feed, an outgoing redirect and the timestamp of the last modification
-        of the feed
-        """
+def to_dict(obj, fields=None):
+    """
+    Parses a feed and returns its JSON object, a list of urls that refer to
+    this feed, an outgoing redirect and the timestamp of the last modification
+    of the feed
+
+    If fields is given, only the selected fields are included (and, for
+    properties, computed). Nested objects are converted with their
+    nested selection.
+    """
 
-        d = {}
-        for key in dir(obj):
+    d = {}
+    keys = dir(obj) if fields is None else fields
+    for key in keys:
 
-            if key.startswith('_'):
-                continue
+        if key.startswith('_'):
+            continue
 
+        try:
             val = getattr(obj, key)
-            if isinstance(val, collections.Callable):
-                continue
+        except AttributeError:
+            # the field has not been parsed
+            continue
+
+        if callable(val):
+            continue
+
+        if fields is not None:
+            val = convert(val, get_nested(fields, key))
+
+        d[key] = val
+
+    return d
+
+
+def convert(val, fields):
+    """ Converts (lists of) parsed objects with the given selection """
+
+    if isinstance(val, ParsedObject):
+        return to_dict(val, fields)
+
+    if isinstance(val, list):
+        return [convert(v, fields) for v in val]
+
+    return val
+
+
+def to_builtin(val, fields=None):
+    """ Converts parsed objects, also in nested lists and dicts, into dicts
+
+    Used for formats without an equivalent of JSONEncoder.default """
+
+    if isinstance(val, ParsedObject):
+        d = to_dict(val, fields)
+        return dict((k, to_builtin(v, get_nested(fields, k)))
+                    for k, v in d.items())
 
-            d[key] = getattr(obj, key)
+    if isinstance(val, (list, tuple)):
+        return [to_builtin(v, fields) for v in val]
 
-        return d
+    if isinstance(val, dict):
+        # plain dicts, such as errors or batch results, are not selected from
+        return dict((k, to_builtin(v, fields)) for k, v in val.items())
 
+    return val
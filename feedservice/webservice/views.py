@@ -7,25 +7,38 @@ import time
 import email.utils
 import cgi
 import json
+import logging
 
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import render
 from django.contrib.sites.requests import RequestSite
 from django.views.generic.base import View
 from django.views.generic import TemplateView
 from django.conf import settings
 
-from feedservice.parse import parse_feeds
+from feedservice import metrics, profiling, timing
+from feedservice.parse import parse_feeds, iter_feed_requests, websub, \
+    store_pushed_feed, FetchFeedException
+from feedservice.parse.fields import parse_feed_fields
 from feedservice.utils import select_matching_option
 from feedservice.webservice.utils import ObjectEncoder
+from feedservice.webservice.compression import finalize_response
+from feedservice.webservice.formats import FORMATS, get_response
 from feedservice.parse.text import StripHtmlTags, ConvertMarkdown
 
 
+logger = logging.getLogger(__name__)
+
 class IndexView(TemplateView):
 
     template_name = 'index.html'
 
 
+@method_decorator(profiling.with_profiling, name='dispatch')
+@method_decorator(timing.with_server_timing, name='dispatch')
+@method_decorator(metrics.track_in_progress('parse'), name='dispatch')
 class ParseView(View):
     """ Parser Endpoint """
 
@@ -46,17 +59,38 @@ class ParseView(View):
 
         text_processor = get_text_processor(request.GET.get('process_text', ''))
 
-        # TODO: caching has been removed; ?use_cache is not used atm
+        use_cache = bool(int(request.GET.get('use_cache', 1)))
+        enrich_files = bool(int(request.GET.get('enrich_files', 0)))
+
+        try:
+            fields = parse_feed_fields(request.GET.get('fields', ''))
+        except ValueError as ve:
+            return HttpResponseBadRequest('invalid fields: %s' % ve)
 
         mod_since_utc = request.META.get('HTTP_IF_MODIFIED_SINCE', None)
         accept = request.META.get('HTTP_ACCEPT', 'application/json')
 
+        # the n-th etag / last_modified parameter belongs to the n-th url
+        etags = request.GET.getlist('etag') + request.POST.getlist('etag')
+        last_mods = request.GET.getlist('last_modified') + \
+            request.POST.getlist('last_modified')
+        validators = self.get_validators(urls, etags, last_mods)
+
+        # the n-th cursor belongs to the n-th url, too
+        cursors = request.GET.getlist('cursor') + \
+            request.POST.getlist('cursor')
+        cursors = dict((url, cursor) for url, cursor in zip(urls, cursors)
+                       if cursor)
+
         base_url = request.build_absolute_uri('/')
 
         if urls:
-            podcasts = parse_feeds(urls, mod_since_utc, text_processor)
+            podcasts = parse_feeds(urls, mod_since_utc, text_processor,
+                                   use_cache, validators, fields, cursors,
+                                   enrich_files)
             last_mod_utc = self.get_earliest_last_modified(podcasts)
-            response = self.send_response(request, podcasts, last_mod_utc, accept)
+            response = self.send_response(request, podcasts, last_mod_utc,
+                                          accept, fields)
 
         else:
             response = HttpResponse()
@@ -68,6 +102,17 @@ class ParseView(View):
     post = get
 
 
+    def get_validators(self, urls, etags, last_mods):
+        """ returns the (etag, last_modified) values given for each URL """
+        validators = {}
+        for n, url in enumerate(urls):
+            etag = etags[n] if n < len(etags) else None
+            last_mod = last_mods[n] if n < len(last_mods) else None
+            if etag or last_mod:
+                validators[url] = (etag or None, last_mod or None)
+        return validators
+
+
     def get_earliest_last_modified(self, podcasts):
         """ returns the earliest Last-Modified date of all podcasts """
         timestamps = (getattr(p, 'http_last_modified', None) for p in podcasts)
@@ -77,19 +122,17 @@ class ParseView(View):
         return next(iter(timestamps), None)
 
 
-    def send_response(self, request, podcasts, last_mod_utc, accepted_formats):
+    def send_response(self, request, podcasts, last_mod_utc, accepted_formats,
+                      fields=None):
 
-        SUPPORTED_FORMATS = ['text/html', 'application/json']
+        SUPPORTED_FORMATS = ['text/html'] + list(FORMATS)
 
         fmt = select_matching_option(SUPPORTED_FORMATS, accepted_formats)
 
-        if fmt in (None, 'application/json'): #serve json as default
-            content_type = 'application/json'
-            response = HttpResponse()
-
-            dense_json = json.dumps(podcasts, sort_keys=True,
-                    indent=None, separators=(',', ':'), cls=ObjectEncoder)
-            response.write(dense_json)
+        if fmt != 'text/html':
+            # serve json as default
+            response = get_response(podcasts, fmt or 'application/json',
+                                    fields)
 
             if last_mod_utc:
                 last_mod_time = time.mktime(last_mod_utc)
@@ -97,18 +140,146 @@ class ParseView(View):
 
 
         else:
-            content_type = 'text/html'
-            pretty_json = json.dumps(podcasts, sort_keys=True, indent=4, cls=ObjectEncoder)
+            with timing.timed('encode'):
+                pretty_json = json.dumps(podcasts, sort_keys=True, indent=4,
+                                         cls=ObjectEncoder, fields=fields)
             pretty_json = cgi.escape(pretty_json)
             response = render(request, 'pretty_response.html', {
                     'response': pretty_json,
                     'site': RequestSite(request),
                 })
+            response['Content-Type'] = 'text/html'
 
-        response['Content-Type'] = content_type
         response['Vary'] = 'Accept, User-Agent, Accept-Encoding'
 
-        return response
+        return finalize_response(request, response)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+@method_decorator(profiling.with_profiling, name='dispatch')
+@method_decorator(timing.with_server_timing, name='dispatch')
+@method_decorator(metrics.track_in_progress('parse-batch'), name='dispatch')
+class BatchParseView(View):
+    """ Parser Endpoint for a JSON list of feeds with individual options """
+
+    def post(self, request):
+
+        try:
+            items = json.loads(request.body.decode('utf-8'))
+            feed_requests = [self.get_feed_request(item) for item in items]
+
+        except (ValueError, TypeError, KeyError) as ex:
+            return HttpResponseBadRequest('invalid request: %s' % ex)
+
+        if not feed_requests:
+            return HttpResponseBadRequest('no feeds requested')
+
+        if len(feed_requests) > settings.BATCH_MAX_FEEDS:
+            return HttpResponseBadRequest('at most %d feeds can be requested'
+                                          % settings.BATCH_MAX_FEEDS)
+
+        use_cache = bool(int(request.GET.get('use_cache', 1)))
+        enrich_files = bool(int(request.GET.get('enrich_files', 0)))
+
+        try:
+            fields = parse_feed_fields(request.GET.get('fields', ''))
+        except ValueError as ve:
+            return HttpResponseBadRequest('invalid fields: %s' % ve)
+
+        accept = request.META.get('HTTP_ACCEPT', 'application/json')
+        fmt = select_matching_option(list(FORMATS), accept)
+
+        results = iter_feed_requests(feed_requests, use_cache,
+                                     settings.BATCH_CONCURRENCY, fields,
+                                     enrich_files)
+        podcasts = (self.get_result(*result) for result in results)
+
+        if fmt != 'application/x-ndjson':
+            # only NDJSON can be sent while the feeds are being parsed
+            podcasts = list(podcasts)
+
+        response = get_response(podcasts, fmt or 'application/json', fields)
+        response['Vary'] = 'Accept, Accept-Encoding'
+        return finalize_response(request, response)
+
+    def get_result(self, url, status, feed):
+        result = {'url': url, 'status': status}
+        if feed is not None:
+            result['feed'] = feed
+        return result
+
+    def get_feed_request(self, item):
+        """ Validates a requested feed and returns it for parse_feed_requests
+        """
+
+        url = item['url']
+        if not isinstance(url, str):
+            raise TypeError('url must be a string')
+
+        for key in ('etag', 'last_modified', 'cursor'):
+            value = item.get(key, None)
+            if value is not None and not isinstance(value, str):
+                raise TypeError('%s must be a string' % key)
+
+        max_episodes = item.get('max_episodes', None)
+        if max_episodes is not None:
+            max_episodes = int(max_episodes)
+            if max_episodes < 0:
+                raise ValueError('max_episodes must not be negative')
+
+        return dict(
+            url = url,
+            etag = item.get('etag', None),
+            last_modified = item.get('last_modified', None),
+            cursor = item.get('cursor', None),
+            text_processor = get_text_processor(item.get('process_text', '')),
+            max_episodes = max_episodes,
+        )
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class WebSubView(View):
+    """ Callback for WebSub hubs (see feedservice.parse.websub) """
+
+    def get(self, request):
+        body = websub.verify_intent(request.GET.get('url', ''),
+                                    request.GET.get('hub.topic', ''),
+                                    request.GET.get('hub.mode', ''),
+                                    request.GET.get('hub.challenge', ''),
+                                    request.GET.get('hub.lease_seconds'))
+        if body is None:
+            raise Http404('unexpected verification request')
+
+        return HttpResponse(body, content_type='text/plain')
+
+    def post(self, request):
+        url = request.GET.get('url', '')
+        push = websub.receive_push(url, request,
+                                   request.META.get('HTTP_X_HUB_SIGNATURE'),
+                                   request.META.get('CONTENT_TYPE'))
+
+        # invalid pushes are acknowledged, too, as hubs would retry them
+        if push is not None:
+            subscription, resp = push
+            try:
+                store_pushed_feed(url, resp,
+                                  subscription.get_text_processors())
+            except FetchFeedException as ffe:
+                logger.info('Pushed feed %s could not be parsed: %s', url,
+                            ffe)
+
+        return HttpResponse(status=202)
+
+
+class MetricsView(View):
+    """ Metrics in the Prometheus text format (see feedservice.metrics) """
+
+    def get(self, request):
+        if metrics.prometheus_client is None:
+            raise Http404('prometheus_client is not installed')
+
+        return HttpResponse(metrics.generate(),
+                            content_type=metrics.CONTENT_TYPE)
 
 
 def get_text_processor(name):
@@ -13,6 +13,13 @@ middleware here, or combine a Django application with an application of another
 framework.
 
 """
+
+# The parser requires a patched standard library. gunicorn.conf.py patches
+# it before the application is loaded; this covers other WSGI servers.
+import eventlet
+if not eventlet.patcher.is_monkey_patched('socket'):
+    eventlet.monkey_patch()
+
 import os
 
 # We defer to a DJANGO_SETTINGS_MODULE already in the environment. This breaks
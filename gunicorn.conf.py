@@ -0,0 +1,86 @@
+# Production configuration for gunicorn, which reads ./gunicorn.conf.py
+# automatically:
+#
+#     gunicorn feedservice.wsgi
+#
+# All settings can be overridden with the environment variables below or
+# gunicorn's own command line options.
+
+import os
+import multiprocessing
+
+
+# The parser uses eventlet (green threads for concurrent fetching, timeouts),
+# so the eventlet worker is the only supported worker class. The standard
+# library has to be patched before anything else is imported -- in
+# particular before the application is preloaded in the master process.
+# os and select stay unpatched in the master, whose main loop and signal
+# handling rely on them; the workers patch them after forking.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'eventlet')
+
+if worker_class == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch(os=False, select=False)
+
+
+bind = '0.0.0.0:%s' % os.getenv('PORT', '8000')
+
+# Number of worker processes; each one serves up to worker_connections
+# requests concurrently, most of which wait for the feeds' servers
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+
+# Load the application, all parsers and their dependencies in the master
+# process, so that the forked workers share them (see feedservice.preload)
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+# Workers are restarted after handling this many requests (plus a random
+# jitter, so that they don't restart at the same time), which bounds the
+# memory that grows through fragmentation and caches
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Seconds after which a silent worker is killed and restarted; has to be
+# larger than FETCH_TIMEOUT
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = os.getenv('GUNICORN_ACCESSLOG', None)
+
+# Directory in which the workers store their metrics, so that /metrics can
+# aggregate them (see feedservice.metrics); it is emptied on startup
+metrics_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+
+def on_starting(server):
+    """ Removes the metrics of previous runs """
+
+    if not metrics_dir:
+        return
+
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith('.db'):
+            os.remove(os.path.join(metrics_dir, name))
+
+
+def when_ready(server):
+    """ Preloads everything before the first workers are forked """
+
+    if not preload_app:
+        return
+
+    from feedservice.preload import preload, freeze
+    preload()
+    freeze()
+
+
+def child_exit(server, worker):
+    """ Drops the live metrics (eg requests in progress) of a worker """
+
+    if not metrics_dir:
+        return
+
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,4 +1,9 @@
 #!/usr/bin/env python
+
+# patch the standard library before anything else uses it
+import eventlet
+eventlet.monkey_patch()
+
 import os
 import sys
 